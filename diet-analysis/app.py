@@ -1,16 +1,30 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
+import clients
 import extract
 import dietician
+import jobs
+import rules
+import cache
+import health_record
+import pdf_pipeline
+import profiles
+import firestore_writer
+import resilience
 import os
 import logging
 from functools import wraps
+import hashlib
+import threading
 from dotenv import load_dotenv
 import requests
 import time
+import json
 from io import BytesIO
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys  # For log flushing
 
 # --- Load Environment Variables ---
@@ -19,6 +33,47 @@ load_dotenv()
 # --- Configuration ---
 PRIVATE_KEY_PATH = os.getenv("FIREBASE_PRIVATE_KEY_PATH")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Threads used to overlap independent network I/O within a request
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "16"))
+# Read size used when streaming downloads into memory
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+# Batch analysis limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "20"))
+# Analysis output formats: Markdown text, or per-ingredient verdicts and a summary
+ANALYSIS_FORMATS = ("markdown", "structured")
+# Concurrent extraction/analysis model calls per process
+ANALYSIS_POOL_SIZE = int(os.getenv("ANALYSIS_POOL_SIZE", "4"))
+# Verified ID token cache (entries never outlive the token's own expiry)
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_CACHE_MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", "3600"))
+# Seconds between revocation checks for a cached token (0 = never check)
+TOKEN_REVOCATION_CHECK_INTERVAL = float(os.getenv("TOKEN_REVOCATION_CHECK_INTERVAL", "0"))
+# Per-user health profile cache in front of Firestore
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "600"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+# Profiles without a snapshot listener may miss another worker's update for this long
+PROFILE_CACHE_UNWATCHED_TTL = float(os.getenv("PROFILE_CACHE_UNWATCHED_TTL", "60"))
+# Opt-in snapshot listeners (one Firestore stream each) keep up to
+# PROFILE_CACHE_MAX_LISTENERS profiles per worker current for PROFILE_CACHE_TTL
+PROFILE_CACHE_LISTENERS = os.getenv("PROFILE_CACHE_LISTENERS", "false").lower() == "true"
+PROFILE_CACHE_MAX_LISTENERS = int(os.getenv("PROFILE_CACHE_MAX_LISTENERS", "100"))
+# Write-behind buffering of analysis records in the uploads collection
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+# Background processing of healthcare reports (opt-in per request)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Where job status lives. "sqlite" is shared by every worker process on the host,
+# so a status poll can land on any worker; "memory" only suits a single process.
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "sqlite")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "cache/jobs.sqlite3")
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+JOB_MAX_RETAINED = int(os.getenv("JOB_MAX_RETAINED", "10000"))
+# Hosts job results may be POSTed to (comma-separated); callbacks are refused when empty
+JOB_CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+# Open storage and Gemini connections at startup instead of on the first request
+CLIENT_WARM_UP = os.getenv("CLIENT_WARM_UP", "true").lower() == "true"
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -41,32 +96,148 @@ except Exception as e:
     logger.error(f"Firebase initialization failed: {e}", exc_info=True)
     raise RuntimeError("Firebase initialization failed. Check your credentials path.")
 
+def warm_auth_keys():
+    """Fetch Firebase ID token signing certificates so the first request doesn't pay for it."""
+    try:
+        from firebase_admin import _token_gen
+        token_verifier = auth._get_client(firebase_admin.get_app())._token_verifier
+        token_verifier.request(url=_token_gen.ID_TOKEN_CERT_URI, method="GET")
+        logger.info("Firebase token signing keys warmed")
+    except Exception as e:
+        logger.warning(f"Could not warm Firebase token signing keys: {e}")
+
+warm_auth_keys()
+if CLIENT_WARM_UP:
+    clients.warm_up()
+
 # --- Initialize Flask App ---
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# Shared pool for I/O stages that don't depend on each other
+io_executor = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="io")
+# Bounded pool for model-bound extraction and analysis in batch requests
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_POOL_SIZE, thread_name_prefix="analysis")
+
+# Read-through cache of users' extracted_health_data; report uploads refresh it
+profile_store = profiles.ProfileStore(
+    db,
+    ttl=PROFILE_CACHE_TTL,
+    unwatched_ttl=PROFILE_CACHE_UNWATCHED_TTL,
+    max_entries=PROFILE_CACHE_MAX_ENTRIES,
+    use_listeners=PROFILE_CACHE_LISTENERS,
+    max_listeners=PROFILE_CACHE_MAX_LISTENERS
+)
+
+# Versioned per-field health records with change history
+health_records = health_record.HealthRecordStore(db)
+
+# Batches analysis records off the request path
+upload_writer = firestore_writer.WriteBehindBuffer(
+    db,
+    max_batch=WRITE_BEHIND_MAX_BATCH,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL
+) if WRITE_BEHIND_ENABLED else None
+
+# Local worker pool for asynchronous healthcare report processing
+job_queue = jobs.JobQueue(
+    num_workers=JOB_WORKERS,
+    max_queue_size=JOB_QUEUE_SIZE,
+    store=cache.create_cache(
+        JOB_STORE_BACKEND,
+        path=JOB_STORE_PATH,
+        max_entries=JOB_MAX_RETAINED,
+        default_ttl=JOB_RETENTION_SECONDS
+    )
+)
+
 # --- Helper Functions ---
-def download_file(url, max_size=5 * 1024 * 1024):  # 5 MB limit
+def download_file(url, max_size=5 * 1024 * 1024, chunk_size=None):  # 5 MB limit
     if not url.startswith("https://"):
         raise ValueError("Insecure URL detected. Only HTTPS URLs are allowed.")
 
+    chunk_size = chunk_size or DOWNLOAD_CHUNK_SIZE
     try:
-        response = requests.get(url, stream=True, timeout=10)
-        response.raise_for_status()
-
-        total_size = 0
-        file_data = bytearray()
-        for chunk in response.iter_content(1024):
-            total_size += len(chunk)
-            if total_size > max_size:
+        # The pooled connection goes back to the session when the response is closed
+        with clients.get_session().get(url, stream=True, timeout=10) as response:
+            response.raise_for_status()
+
+            content_length = response.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > max_size:
                 raise ValueError("File size exceeds 5 MB limit.")
-            file_data.extend(chunk)
 
-        return BytesIO(file_data)
+            total_size = 0
+            chunks = []
+            for chunk in response.iter_content(chunk_size):
+                total_size += len(chunk)
+                if total_size > max_size:
+                    raise ValueError("File size exceeds 5 MB limit.")
+                chunks.append(chunk)
+
+        # BytesIO shares the joined bytes object instead of copying it
+        return BytesIO(b"".join(chunks))
     except requests.exceptions.RequestException as e:
         logger.error(f"File download error: {e}")
         raise ValueError(f"Failed to download file: {str(e)}")
 
+# --- Verified Token Cache ---
+_token_cache = cache.MemoryCache(max_entries=TOKEN_CACHE_MAX_ENTRIES, default_ttl=TOKEN_CACHE_MAX_TTL)
+_token_stats_lock = threading.Lock()
+_token_stats = {"verifications": 0, "verify_seconds": 0.0, "revocation_checks": 0}
+
+def verify_id_token_cached(id_token):
+    """Verify a Firebase ID token, reusing earlier successful verifications.
+    
+    Cached entries are keyed by a SHA-256 of the token and expire with the
+    token itself (or after TOKEN_CACHE_MAX_TTL). When
+    TOKEN_REVOCATION_CHECK_INTERVAL is set, a cached token is re-verified
+    with a revocation check once the interval has passed.
+    
+    Returns:
+        dict: Decoded token claims
+        
+    Raises:
+        auth.InvalidIdTokenError: If the token is invalid, expired or revoked
+    """
+    key = hashlib.sha256(id_token.encode()).hexdigest()
+    now = time.time()
+    entry = _token_cache.get(key)
+    if entry and (not TOKEN_REVOCATION_CHECK_INTERVAL
+                  or now - entry["checked_at"] < TOKEN_REVOCATION_CHECK_INTERVAL):
+        return entry["claims"]
+
+    check_revoked = bool(TOKEN_REVOCATION_CHECK_INTERVAL)
+    started = time.perf_counter()
+    try:
+        decoded_token = auth.verify_id_token(id_token, check_revoked=check_revoked)
+    except Exception:
+        _token_cache.delete(key)
+        raise
+    elapsed = time.perf_counter() - started
+
+    with _token_stats_lock:
+        _token_stats["verifications"] += 1
+        _token_stats["verify_seconds"] += elapsed
+        if check_revoked:
+            _token_stats["revocation_checks"] += 1
+
+    ttl = min(decoded_token.get("exp", now) - now, TOKEN_CACHE_MAX_TTL)
+    if ttl > 0:
+        _token_cache.set(key, {"claims": decoded_token, "checked_at": now}, ttl=ttl)
+    return decoded_token
+
+def get_token_cache_stats():
+    """Return token cache counters and the verification time it saved."""
+    stats = _token_cache.stats.as_dict()
+    with _token_stats_lock:
+        stats.update(_token_stats)
+    avg_verify = stats["verify_seconds"] / stats["verifications"] if stats["verifications"] else 0.0
+    stats["avg_verify_ms"] = round(avg_verify * 1000, 2)
+    stats["saved_seconds"] = round(avg_verify * stats["hits"], 3)
+    stats["verify_seconds"] = round(stats["verify_seconds"], 3)
+    stats["entries"] = len(_token_cache)
+    return stats
+
 # --- Authentication Decorator ---
 def requires_auth(f):
     @wraps(f)
@@ -93,7 +264,7 @@ def requires_auth(f):
                     return f(*args, **kwargs)
             
             # Normal ID token verification for production
-            decoded_token = auth.verify_id_token(id_token)
+            decoded_token = verify_id_token_cached(id_token)
             uid = decoded_token['uid']
             logger.info(f"Authenticated request for UID: {uid}")
             kwargs['uid'] = uid
@@ -120,7 +291,71 @@ def health_check():
         "timestamp": time.time()
     }), 200
 
+# --- Metrics Endpoint ---
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose cache counters for capacity planning"""
+    return jsonify({
+        "token_cache": get_token_cache_stats(),
+        "profile_cache": profile_store.stats(),
+        "health_records": health_records.stats(),
+        "extraction_cache": extract.get_extraction_cache_stats(),
+        "analysis_cache": dietician.get_cache_stats(),
+        "gemini_uploads": extract.get_upload_stats(),
+        "local_ocr": extract.get_ocr_stats(),
+        "pdf_pipeline": pdf_pipeline.get_stats(),
+        "pdf_text_layer": extract.get_text_layer_stats(),
+        "verdict_cache": dietician.get_verdict_cache_stats(),
+        "rule_engine": dietician.get_rule_stats(),
+        "gemini": resilience.gemini_guard.stats(),
+        "clients": clients.stats(),
+        "jobs": job_queue.stats(),
+        "upload_writer": upload_writer.stats() if upload_writer else None,
+        "timestamp": time.time()
+    }), 200
+
 # --- API Routes ---
+def process_healthcare_report(uid, report_file_url, replace_lists=False):
+    """Download a report, extract healthcare data and merge it into the user's record.
+
+    With ``replace_lists`` the report's conditions, allergies and medications
+    replace the stored lists instead of being added to them.
+
+    Returns:
+        tuple: (extracted healthcare data, health_record update result); the
+            data is empty and the result None if nothing could be extracted
+    """
+    logger.info(f"Downloading file from URL for processing")
+    file_data = download_file(report_file_url)
+    
+    logger.info("Extracting healthcare data from file")
+    extracted_data = extract.extract_healthcare_data(file_data)
+    
+    if not extracted_data:
+        logger.warning("No healthcare data extracted from file")
+        return {}, None
+    
+    logger.info(f"Merging healthcare data into the record for UID: {uid}")
+    # Download tokens in the query string are not worth keeping
+    update = health_records.apply(uid, extracted_data, source=report_file_url.split("?")[0],
+                                  replace_lists=replace_lists)
+    if update["signature_changed"]:
+        # Analyses are cached per profile signature, so only a new signature needs a fresh profile
+        profile_store.refresh(uid, update["record"])
+    return extracted_data, update
+
+def healthcare_report_job(uid, report_file_url, replace_lists=False):
+    """Background job wrapper around process_healthcare_report."""
+    extracted_data, update = process_healthcare_report(uid, report_file_url, replace_lists)
+    if not extracted_data:
+        raise ValueError("Failed to extract healthcare data")
+    return {
+        "message": "Healthcare report processed successfully",
+        "data": extracted_data,
+        "changed_fields": update["changed"],
+        "version": update["version"]
+    }
+
 @app.route('/upload_healthcare_report', methods=['POST'])
 @requires_auth
 def upload_healthcare_report(uid):
@@ -130,26 +365,45 @@ def upload_healthcare_report(uid):
         
         if not report_file_url:
             return jsonify({"success": False, "error": "Missing report file URL"}), 400
-            
-        logger.info(f"Downloading file from URL for processing")
-        file_data = download_file(report_file_url)
+        # A full report's lists replace the stored ones, so stopped medications are removed
+        replace_lists = request.form.get('replace_lists', '').lower() in ('1', 'true', 'yes')
+
+        # Opt-in background mode: return a job id and let the worker pool do the work
+        if request.form.get('async', '').lower() in ('1', 'true', 'yes'):
+            if not report_file_url.startswith("https://"):
+                return jsonify({"success": False, "error": "Insecure URL detected. Only HTTPS URLs are allowed."}), 400
+
+            callback_url = request.form.get('callback_url')
+            if callback_url and not callback_url.startswith("https://"):
+                return jsonify({"success": False, "error": "Callback URL must use HTTPS."}), 400
+            if callback_url and (urlsplit(callback_url).hostname or "").lower() not in JOB_CALLBACK_HOSTS:
+                return jsonify({"success": False, "error": "Callback host is not allowed."}), 400
+
+            try:
+                job = job_queue.submit(uid, healthcare_report_job, uid, report_file_url, replace_lists,
+                                       callback_url=callback_url)
+            except jobs.QueueFullError as e:
+                logger.warning(f"Rejecting healthcare report for UID {uid}: {e}")
+                return jsonify({"success": False, "error": str(e)}), 429, {"Retry-After": "5"}
+
+            return jsonify({
+                "success": True,
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}"
+            }), 202
         
-        logger.info("Extracting healthcare data from file")
-        extracted_data = extract.extract_healthcare_data(file_data)
+        extracted_data, update = process_healthcare_report(uid, report_file_url, replace_lists)
         
         if not extracted_data:
-            logger.warning("No healthcare data extracted from file")
             return jsonify({"success": False, "error": "Failed to extract healthcare data"}), 422
         
-        logger.info(f"Saving healthcare data to Firestore for UID: {uid}")
-        db.collection("users").document(uid).set(
-            {"extracted_health_data": extracted_data}, merge=True
-        )
-        
         return jsonify({
             "success": True,
             "message": "Healthcare report processed successfully",
-            "data": extracted_data
+            "data": extracted_data,
+            "changed_fields": update["changed"],
+            "version": update["version"]
         }), 200
         
     except ValueError as e:
@@ -159,62 +413,206 @@ def upload_healthcare_report(uid):
         logger.exception("Error processing healthcare report")
         return jsonify({"success": False, "error": "An unexpected error occurred."}), 500
 
+@app.route('/health_history', methods=['GET'])
+@requires_auth
+def health_history(uid):
+    """Recorded values of one health record field over time, newest first"""
+    field = request.args.get('field')
+    if not field:
+        return jsonify({"success": False, "error": "Missing field"}), 400
+    try:
+        limit = min(int(request.args.get('limit', 100)), 500)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid limit"}), 400
+    if limit < 1:
+        return jsonify({"success": False, "error": "Invalid limit"}), 400
+    try:
+        return jsonify({"success": True, "field": field, "history": health_records.history(uid, field, limit)}), 200
+    except Exception:
+        logger.exception("Error fetching health history")
+        return jsonify({"success": False, "error": "An unexpected error occurred."}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@requires_auth
+def job_status(job_id, uid):
+    """Poll the status of a background healthcare report job"""
+    job = job_queue.get(job_id)
+    if not job or job["uid"] != uid:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    job = {key: value for key, value in job.items() if key != "uid"}
+    return jsonify({"success": True, **job}), 200
+
+def analyze_file_data(healthcare_data, file_data, deadline=None, structured=False):
+    """Extract ingredients from a downloaded file and analyze them for the user.
+    
+    Args:
+        healthcare_data (dict): User's healthcare data
+        file_data (BytesIO): Downloaded ingredient file
+        deadline (resilience.Deadline): Time budget shared by both model calls
+            (default: a new REQUEST_DEADLINE_SECONDS budget)
+        structured (bool): Return per-ingredient verdicts instead of Markdown
+    
+    Returns:
+        tuple: (ingredients, rule result, analysis); ingredients is empty and the
+            other values None if nothing could be extracted
+    """
+    deadline = deadline or resilience.Deadline()
+    logger.info(f"Extracting ingredients from file")
+    ingredients = extract.extract_ingredients(file_data, deadline=deadline)
+    
+    if not ingredients:
+        logger.warning("No ingredients extracted from file")
+        return [], None, None
+    
+    logger.info(f"Ingredients extracted: {ingredients}")
+    rule_result = rules.evaluate(healthcare_data, ingredients)
+    if structured:
+        analysis_result = dietician.analyze_structured(healthcare_data, ingredients, deadline=deadline)
+    else:
+        analysis_result = dietician.analyze(healthcare_data, ingredients, rule_result=rule_result, deadline=deadline)
+    return ingredients, rule_result, analysis_result
+
+def build_upload_record(uid, ingredient_file_url, ingredients, rule_result, analysis_result):
+    """Build the uploads collection document for an analysis."""
+    return {
+        "user_id": uid,
+        "image_url": ingredient_file_url,
+        "ingredients": ingredients,
+        "analysis": analysis_result,
+        "warnings": rule_result["warnings"],
+        "uploaded_at": firestore.SERVER_TIMESTAMP
+    }
+
+def sse_event(event, data):
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def analysis_event_stream(uid, ingredient_file_url, healthcare_data, file_data):
+    """Generate server-sent events for a streaming product analysis.
+    
+    Emits 'ingredients' once extraction finishes, 'section' whenever the
+    dietician response moves to a new section, 'delta' for each chunk of text,
+    and finally 'done' (with the stored document id) or 'error'.
+    """
+    try:
+        logger.info(f"Extracting ingredients from file")
+        ingredients = extract.extract_ingredients(file_data, deadline=resilience.Deadline())
+        if not ingredients:
+            logger.warning("No ingredients extracted from file")
+            yield sse_event("error", {"success": False, "error": "Could not extract ingredients"})
+            return
+        
+        rule_result = rules.evaluate(healthcare_data, ingredients)
+        yield sse_event("ingredients", {"ingredients": ingredients, "warnings": rule_result["warnings"]})
+        
+        chunks = []
+        current_section = None
+        for chunk in dietician.analyze_stream(healthcare_data, ingredients, rule_result=rule_result):
+            if chunk["section"] and chunk["section"] != current_section:
+                current_section = chunk["section"]
+                yield sse_event("section", {"name": current_section})
+            chunks.append(chunk["text"])
+            yield sse_event("delta", {"section": current_section, "text": chunk["text"]})
+        analysis_result = "".join(chunks)
+        
+        # Store the complete analysis once the stream has finished
+        document_id = store_upload_record(
+            build_upload_record(uid, ingredient_file_url, ingredients, rule_result, analysis_result)
+        )
+        
+        yield sse_event("done", {
+            "success": True,
+            "document_id": document_id,
+            "ingredients": ingredients,
+            "analysis": analysis_result,
+            "warnings": rule_result["warnings"]
+        })
+    except Exception:
+        logger.exception("Error in streaming analysis")
+        yield sse_event("error", {"success": False, "error": "An unexpected error occurred."})
+
+def store_upload_record(upload_data):
+    """Save an analysis record, via the write-behind buffer when enabled.
+    
+    Returns:
+        str: Document id of the record (assigned before the write happens)
+    """
+    upload_ref = db.collection("uploads").document()
+    if upload_writer:
+        upload_writer.enqueue(upload_ref, upload_data)
+        logger.info(f"Analysis queued for storage with document ID: {upload_ref.id}")
+    else:
+        upload_ref.set(upload_data)
+        logger.info(f"Analysis stored with document ID: {upload_ref.id}")
+    return upload_ref.id
+
+def store_upload_records(records):
+    """Save several analysis records in one Firestore batch (or the write-behind buffer).
+    
+    Returns:
+        list: Document ids of the records, in order
+    """
+    if upload_writer:
+        return [store_upload_record(record) for record in records]
+    refs = [db.collection("uploads").document() for _ in records]
+    batch = db.batch()
+    for upload_ref, record in zip(refs, records):
+        batch.set(upload_ref, record)
+    batch.commit()
+    logger.info(f"Stored {len(refs)} analyses in one batch")
+    return [upload_ref.id for upload_ref in refs]
+
 @app.route('/analyze', methods=['POST'])
 @requires_auth
 def analyze_product(uid):
     logger.info(f"Processing product analysis for UID: {uid}")
+    # The time budget starts with the request so slow downloads leave less for retries
+    deadline = resilience.Deadline()
     try:
         ingredient_file_url = request.form.get('ingredient_file')
+        analysis_format = request.form.get('format', 'markdown').lower()
         
         if not ingredient_file_url:
             return jsonify({"success": False, "error": "Missing ingredient file URL"}), 400
+        if analysis_format not in ANALYSIS_FORMATS:
+            return jsonify({"success": False, "error": f"Unsupported format: {analysis_format}"}), 400
         
+        # Firestore lookup and file download are independent, so run them concurrently
+        logger.info(f"Fetching user data and downloading ingredient file")
+        user_future = io_executor.submit(profile_store.get, uid)
+        download_future = io_executor.submit(download_file, ingredient_file_url)
+
         # Get user's healthcare data
-        user_doc = db.collection("users").document(uid).get()
-        if not user_doc.exists:
-            return jsonify({
-                "success": False, 
-                "error": "User data not found. Please upload healthcare report first."
-            }), 404
-            
-        user_data = user_doc.to_dict()
-        healthcare_data = user_data.get('extracted_health_data')
-        if not healthcare_data:
-            return jsonify({
-                "success": False, 
-                "error": "Healthcare data not found. Please upload healthcare report first."
-            }), 404
+        healthcare_data, error = user_future.result()
+        if error:
+            return jsonify({"success": False, "error": error}), 404
         
-        logger.info(f"Downloading ingredient file from URL")
-        file_data = download_file(ingredient_file_url)
+        file_data = download_future.result()
         
-        logger.info(f"Extracting ingredients from file")
-        ingredients = extract.extract_ingredients(file_data)
+        # Opt-in streaming mode: server-sent events instead of a single JSON body (Markdown only)
+        if analysis_format == 'markdown' and request.form.get('stream', '').lower() in ('1', 'true', 'yes'):
+            return Response(
+                stream_with_context(analysis_event_stream(uid, ingredient_file_url, healthcare_data, file_data)),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
+        ingredients, rule_result, analysis_result = analyze_file_data(
+            healthcare_data, file_data, deadline, structured=analysis_format == 'structured'
+        )
         if not ingredients:
-            logger.warning("No ingredients extracted from file")
             return jsonify({"success": False, "error": "Could not extract ingredients"}), 422
         
-        logger.info(f"Ingredients extracted: {ingredients}")
-        analysis_result = dietician.analyze(healthcare_data, ingredients)
-        
         # Store analysis results
-        upload_ref = db.collection("uploads").document()
-        upload_data = {
-            "user_id": uid,
-            "image_url": ingredient_file_url,
-            "ingredients": ingredients,
-            "analysis": analysis_result,
-            "uploaded_at": firestore.SERVER_TIMESTAMP
-        }
-        upload_ref.set(upload_data)
-        logger.info(f"Analysis stored with document ID: {upload_ref.id}")
+        upload_data = build_upload_record(uid, ingredient_file_url, ingredients, rule_result, analysis_result)
+        document_id = store_upload_record(upload_data)
         
         return jsonify({
             "success": True,
-            "document_id": upload_ref.id,
+            "document_id": document_id,
             "ingredients": ingredients,
-            "analysis": analysis_result
+            "analysis": analysis_result,
+            "warnings": rule_result["warnings"]
         }), 200
         
     except ValueError as e:
@@ -224,6 +622,123 @@ def analyze_product(uid):
         logger.exception("Error in analyze_product")
         return jsonify({"success": False, "error": "An unexpected error occurred."}), 500
 
+@app.route('/analyze_batch', methods=['POST'])
+@requires_auth
+def analyze_batch(uid):
+    """Analyze several ingredient files for one user in a single request.
+    
+    Accepts repeated 'ingredient_files' form fields or a JSON body
+    {"ingredient_files": [...]}, and an optional 'format' ("markdown" or
+    "structured"). Each item succeeds or fails on its own; all items share
+    one REQUEST_DEADLINE_SECONDS budget.
+    """
+    logger.info(f"Processing batch product analysis for UID: {uid}")
+    # One time budget covers the whole batch, not each item
+    deadline = resilience.Deadline()
+    try:
+        json_body = request.get_json(silent=True) or {}
+        if not isinstance(json_body, dict):
+            return jsonify({"success": False, "error": "Request body must be a JSON object"}), 400
+        ingredient_file_urls = json_body.get('ingredient_files') or request.form.getlist('ingredient_files')
+        analysis_format = str(json_body.get('format') or request.form.get('format', 'markdown')).lower()
+        
+        if not ingredient_file_urls or not isinstance(ingredient_file_urls, list):
+            return jsonify({"success": False, "error": "Missing ingredient file URLs"}), 400
+        if len(ingredient_file_urls) > BATCH_MAX_ITEMS:
+            return jsonify({
+                "success": False,
+                "error": f"Too many ingredient files. Maximum is {BATCH_MAX_ITEMS} per batch."
+            }), 400
+        if analysis_format not in ANALYSIS_FORMATS:
+            return jsonify({"success": False, "error": f"Unsupported format: {analysis_format}"}), 400
+        
+        # Fetch the profile once and start every download at the same time
+        user_future = io_executor.submit(profile_store.get, uid)
+        download_futures = {
+            io_executor.submit(download_file, url): index
+            for index, url in enumerate(ingredient_file_urls)
+            if isinstance(url, str)
+        }
+        
+        healthcare_data, error = user_future.result()
+        if error:
+            return jsonify({"success": False, "error": error}), 404
+        
+        items = [
+            {"index": index, "ingredient_file": url, "success": False, "error": "Invalid ingredient file URL"}
+            for index, url in enumerate(ingredient_file_urls)
+        ]
+        
+        # Hand each file to the bounded analysis pool as soon as its download finishes
+        analysis_futures = {}
+        for download_future in as_completed(download_futures):
+            index = download_futures[download_future]
+            try:
+                file_data = download_future.result()
+            except ValueError as e:
+                items[index]["error"] = str(e)
+                continue
+            except Exception:
+                logger.exception(f"Error downloading batch item {index}")
+                items[index]["error"] = "Could not download ingredient file"
+                continue
+            analysis_futures[analysis_executor.submit(
+                analyze_file_data, healthcare_data, file_data, deadline=deadline,
+                structured=analysis_format == 'structured'
+            )] = index
+        
+        results = {}
+        for analysis_future in as_completed(analysis_futures):
+            index = analysis_futures[analysis_future]
+            item = items[index]
+            try:
+                ingredients, rule_result, analysis_result = analysis_future.result()
+            except Exception:
+                logger.exception(f"Error analyzing batch item {index}")
+                item["error"] = "An unexpected error occurred."
+                continue
+            if not ingredients:
+                item["error"] = "Could not extract ingredients"
+                continue
+            results[index] = (ingredients, rule_result, analysis_result)
+        
+        # Successful analyses are written together once every item has finished
+        indexes = sorted(results)
+        try:
+            document_ids = store_upload_records([
+                build_upload_record(uid, items[index]["ingredient_file"], *results[index]) for index in indexes
+            ])
+        except Exception:
+            logger.exception("Error storing batch analyses")
+            document_ids = None
+        for position, index in enumerate(indexes):
+            item = items[index]
+            if document_ids is None:
+                item["error"] = "Could not save the analysis"
+                continue
+            ingredients, rule_result, analysis_result = results[index]
+            item.pop("error")
+            item.update({
+                "success": True,
+                "document_id": document_ids[position],
+                "ingredients": ingredients,
+                "analysis": analysis_result,
+                "warnings": rule_result["warnings"]
+            })
+        
+        succeeded = sum(1 for item in items if item["success"])
+        
+        return jsonify({
+            "success": succeeded > 0,
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+            "items": items
+        }), 200
+        
+    except Exception as e:
+        logger.exception("Error in analyze_batch")
+        return jsonify({"success": False, "error": "An unexpected error occurred."}), 500
+
 # --- Generate Test Token Endpoint (FOR TESTING ONLY) ---
 @app.route('/generate_test_token', methods=['GET'])
 def generate_test_token():
@@ -0,0 +1,860 @@
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from io import BytesIO
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+import firebase_admin
+import google.generativeai as genai
+import requests
+from firebase_admin import auth, credentials
+from firebase_admin import firestore as firebase_firestore
+from google.api_core import exceptions as api_exceptions
+from google.cloud import firestore
+from requests.adapters import BaseAdapter
+
+import file_types
+import resilience
+
+logger = logging.getLogger(__name__)
+
+# Sample files replayed by default (label images and healthcare reports)
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "uploads")
+# Host the corpus is served from; download URLs never leave the process
+CORPUS_HOST = "storage.benchmark.local"
+# Request types and their share of the load, overridden with --mix
+DEFAULT_MIX = "analyze=6,structured=2,stream=1,report=1"
+# Backend latency distributions in milliseconds (see parse_latency)
+DEFAULT_LATENCY = {
+    "gemini": "lognormal:1500:0.5",
+    "upload": "lognormal:400:0.4",
+    "firestore": "lognormal:25:0.5",
+    "auth": "lognormal:5:0.3",
+    "download": "lognormal:80:0.6",
+}
+# Stages reported, in request order
+STAGES = ["queue", "auth", "download", "sniff", "upload", "generate", "parse", "firestore"]
+
+# Stand-in model output
+INGREDIENTS = [
+    "wheat flour", "sugar", "palm oil", "salt", "gram flour", "peanuts", "milk solids", "soy lecithin",
+    "turmeric", "red chilli powder", "citric acid", "sodium benzoate", "high fructose corn syrup",
+    "cocoa butter", "monosodium glutamate", "black pepper", "sesame seeds", "whey powder", "dextrose",
+    "natural flavours",
+]
+HEALTH_PROFILES = [
+    {"blood_pressure": "128/82", "blood_sugar": "112 mg/dL", "conditions": ["prediabetes"],
+     "medications": ["metformin"]},
+    {"blood_pressure": "142/91", "conditions": ["hypertension"], "medications": ["lisinopril"],
+     "cholesterol": {"total": "232 mg/dL", "ldl": "151 mg/dL", "hdl": "38 mg/dL"}},
+    {"blood_sugar": "94 mg/dL", "allergies": ["peanuts"], "bmi": "23.4"},
+    {"hba1c": "7.1%", "blood_sugar": "148 mg/dL", "conditions": ["type 2 diabetes"], "allergies": ["shellfish"]},
+    {"blood_pressure": "118/76", "conditions": ["celiac disease"],
+     "cholesterol": {"total": "188 mg/dL", "triglycerides": "210 mg/dL"}},
+]
+ANALYSIS_TEXT = (
+    "**Summary:** Most ingredients are fine in moderation, but a few need attention for this profile.\n\n"
+    "**Ingredient Analysis:**\n{ingredients}\n\n"
+    "**Warnings:** Watch sodium and added sugar.\n\n"
+    "**Recommendations:** Keep portions small and prefer low-sodium alternatives.\n"
+)
+
+
+# --- Measurement ---
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` (q in 0-100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class StageTimer:
+    """Collects durations per named stage from any thread."""
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def wrap(self, stage, function):
+        """Return ``function`` timed as ``stage`` (also when it raises)."""
+        @wraps(function)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return timed
+
+    def summary(self, stage):
+        with self._lock:
+            samples = list(self._samples.get(stage, ()))
+        return {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 99) * 1000, 1),
+            "max_ms": round(max(samples, default=0.0) * 1000, 1),
+        }
+
+    def stages(self):
+        with self._lock:
+            return list(self._samples)
+
+
+def parse_latency(spec, rng):
+    """Build a latency sampler from a distribution spec in milliseconds.
+
+    Args:
+        spec (str): "fixed:MS", "uniform:LOW:HIGH" or "lognormal:MEDIAN:SIGMA"
+        rng (random.Random): Random source
+
+    Returns:
+        callable: Returns a latency in seconds on each call
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(value) for value in params.split(":")] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid latency spec: {spec}")
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+class Backend:
+    """Latency, error rate and quota of one fake remote dependency.
+
+    Args:
+        name (str): Stage name the calls are recorded under
+        latency (callable): Latency sampler from parse_latency
+        timer (StageTimer): Where call durations are recorded
+        rng (random.Random): Random source for injected errors
+        error_rate (float): Share of calls that fail with 503 Service Unavailable
+        rate_limit (float): Calls per second allowed before 429 Resource Exhausted (0 = unlimited)
+    """
+
+    def __init__(self, name, latency, timer, rng, error_rate=0.0, rate_limit=0.0):
+        self.name = name
+        self.latency = latency
+        self.timer = timer
+        self.rng = rng
+        self.error_rate = error_rate
+        self.quota = resilience.TokenBucket(rate_limit, max(1, int(rate_limit))) if rate_limit else None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "errors": 0, "throttled": 0, "timeouts": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def call(self, timeout=None):
+        """Wait like one remote call, raising the errors a real backend would.
+
+        Args:
+            timeout (float): Client timeout in seconds
+        """
+        self._count("calls")
+        started = time.perf_counter()
+        try:
+            if self.quota and not self.quota.acquire(0):
+                self._count("throttled")
+                raise api_exceptions.ResourceExhausted(f"{self.name} quota exceeded")
+            delay = self.latency()
+            if timeout is not None and delay > timeout:
+                time.sleep(timeout)
+                self._count("timeouts")
+                raise api_exceptions.DeadlineExceeded(f"{self.name} call timed out")
+            time.sleep(delay)
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self._count("errors")
+                raise api_exceptions.ServiceUnavailable(f"{self.name} unavailable")
+        finally:
+            self.timer.record(self.name, time.perf_counter() - started)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+# --- Fake Gemini ---
+def _digest(value):
+    return hashlib.sha256(value if isinstance(value, bytes) else str(value).encode()).hexdigest()
+
+
+def _pick(items, digest, count):
+    """Deterministically choose ``count`` items, so the same file always gets the same answer."""
+    rng = random.Random(digest)
+    return rng.sample(items, min(count, len(items)))
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        part = SimpleNamespace(text=text)
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(parts=[part]), finish_reason=1)]
+
+
+class FakeGemini:
+    """In-process stand-in for the google.generativeai calls the service makes.
+
+    Answers are derived from the prompt and a hash of the attached file, so a
+    given label always yields the same ingredients and the service's caches
+    behave as they would in production.
+
+    Args:
+        generate (Backend): generate_content calls
+        upload (Backend): File API uploads
+    """
+
+    def __init__(self, generate, upload):
+        self.generate = generate
+        self.upload = upload
+
+    def install(self):
+        gemini = self
+
+        class GenerativeModel:
+            def __init__(self, model_name, generation_config=None, system_instruction=None, **kwargs):
+                self.model_name = model_name
+                self.generation_config = generation_config
+
+            def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+                timeout = (request_options or {}).get("timeout")
+                if stream:
+                    return gemini._stream(contents, timeout)
+                gemini.generate.call(timeout)
+                return _FakeResponse(gemini.respond(contents))
+
+        genai.configure = lambda *args, **kwargs: None
+        genai.GenerativeModel = GenerativeModel
+        genai.upload_file = self.upload_file
+        genai.get_model = lambda name, **kwargs: SimpleNamespace(name=name)
+
+    def upload_file(self, path, mime_type=None, **kwargs):
+        data = path.read() if hasattr(path, "read") else open(path, "rb").read()
+        self.upload.call()
+        return SimpleNamespace(
+            name=f"files/{_digest(data)}",
+            mime_type=mime_type,
+            expiration_time=datetime.now(timezone.utc) + timedelta(hours=48),
+        )
+
+    def _stream(self, contents, timeout):
+        # The whole latency is paid before the first chunk, so time-to-first-token is pessimistic
+        self.generate.call(timeout)
+        text = self.respond(contents)
+        chunk_size = max(1, len(text) // 4)
+        for start in range(0, len(text), chunk_size):
+            yield _FakeResponse(text[start:start + chunk_size])
+
+    def respond(self, contents):
+        prompt = next((item for item in reversed(contents) if isinstance(item, str)), "")
+        attachment = next((item for item in contents if not isinstance(item, str)), None)
+        if isinstance(attachment, dict):
+            digest = _digest(attachment["data"])
+        elif attachment is not None:
+            digest = _digest(getattr(attachment, "name", ""))
+        else:
+            digest = _digest(prompt)
+
+        if "healthcare data" in prompt:
+            return json.dumps(HEALTH_PROFILES[int(digest, 16) % len(HEALTH_PROFILES)])
+        if "For each ingredient below" in prompt:
+            names = json.loads(prompt.rsplit("**Ingredients:**\n", 1)[1])
+            effects = ["safe", "safe", "caution", "unsafe"]
+            return json.dumps([
+                {"name": name, "effect": _pick(effects, _digest(name), 1)[0],
+                 "reason": f"Stand-in verdict for {name}.", "risk_tags": []}
+                for name in names
+            ])
+        if "ingredients" in prompt.lower() and "dietician" not in prompt:
+            return json.dumps(_pick(INGREDIENTS, digest, 6 + int(digest, 16) % 7))
+        ingredients = re.search(r"\*\*Ingredients:\*\*\n(.*?)\n\n", prompt, re.DOTALL)
+        lines = [f"- **{name.strip()}:** Safe in moderation."
+                 for name in (ingredients.group(1).split(",") if ingredients else [])]
+        return ANALYSIS_TEXT.format(ingredients="\n".join(lines))
+
+
+# --- Fake Firestore ---
+def _merge(current, update):
+    """Apply ``update`` to ``current`` the way set(merge=True) does: maps merge, other values replace."""
+    merged = dict(current or {})
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _resolve_transforms(data):
+    if data is firestore.SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(data, dict):
+        return {key: _resolve_transforms(value) for key, value in data.items()}
+    return data
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def get(self, transaction=None, **kwargs):
+        self._db.backend.call()
+        return FakeSnapshot(self, self._db.read(self.path))
+
+    def set(self, data, merge=False):
+        self._db.backend.call()
+        self._db.write(self.path, data, merge)
+
+    def update(self, data):
+        self.set(data, merge=True)
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def on_snapshot(self, callback):
+        # Changes are not pushed; cached profiles only expire by TTL
+        return SimpleNamespace(unsubscribe=lambda: None)
+
+
+class FakeQuery:
+    def __init__(self, db, path, filters=(), order=None, count=None):
+        self._db = db
+        self._path = path
+        self._filters = list(filters)
+        self._order = order
+        self._count = count
+
+    def where(self, field, op, value):
+        if op != "==":
+            raise NotImplementedError(f"Unsupported query operator: {op}")
+        return FakeQuery(self._db, self._path, self._filters + [(field, value)], self._order, self._count)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return FakeQuery(self._db, self._path, self._filters, (field, direction), self._count)
+
+    def limit(self, count):
+        return FakeQuery(self._db, self._path, self._filters, self._order, count)
+
+    def stream(self):
+        self._db.backend.call()
+        documents = [
+            (path, data) for path, data in self._db.children(self._path)
+            if all(data.get(field) == value for field, value in self._filters)
+        ]
+        if self._order:
+            field, direction = self._order
+            documents.sort(key=lambda item: str(item[1].get(field)), reverse=direction == firestore.Query.DESCENDING)
+        for path, data in documents[:self._count]:
+            yield FakeSnapshot(FakeDocument(self._db, path), data)
+
+
+class FakeCollection(FakeQuery):
+    def document(self, document_id=None):
+        return FakeDocument(self._db, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+
+class FakeWriteBatch:
+    """Buffered writes committed in one round trip (also used for transactions)."""
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference.path, data, merge))
+
+    def commit(self):
+        self._db.backend.call()
+        for path, data, merge in self._writes:
+            self._db.write(path, data, merge)
+        self._writes = []
+
+
+class FakeFirestore:
+    """In-memory Firestore client covering the calls the service makes.
+
+    Every round trip (document get/set, query, batch or transaction commit)
+    waits on ``backend``. Transactions are not isolated from each other.
+
+    Args:
+        backend (Backend): Latency and error model for Firestore RPCs
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def install(self):
+        def transactional(function):
+            @wraps(function)
+            def run(transaction, *args, **kwargs):
+                result = function(transaction, *args, **kwargs)
+                transaction.commit()
+                return result
+            return run
+
+        credentials.Certificate = lambda *args, **kwargs: None
+        firebase_admin.initialize_app = lambda *args, **kwargs: None
+        firebase_firestore.client = lambda *args, **kwargs: self
+        firestore.transactional = transactional
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self):
+        return FakeWriteBatch(self)
+
+    def read(self, path):
+        with self._lock:
+            return copy.deepcopy(self._documents.get(path))
+
+    def write(self, path, data, merge=False):
+        data = _resolve_transforms(copy.deepcopy(data))
+        with self._lock:
+            current = self._documents.get(path)
+            self._documents[path] = _merge(current, data) if merge and current else data
+
+    def children(self, collection_path):
+        prefix = collection_path + "/"
+        with self._lock:
+            return [
+                (path, copy.deepcopy(data)) for path, data in self._documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+
+
+# --- Fake storage and auth ---
+class CorpusAdapter(BaseAdapter):
+    """Serves corpus files for https://CORPUS_HOST/<name> URLs.
+
+    A ``v`` query parameter appends that many bytes of padding to images, so
+    repeated uploads of one label miss the exact-match extraction cache.
+    """
+
+    def __init__(self, corpus, backend):
+        super().__init__()
+        self.corpus = corpus
+        self.backend = backend
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        url = urlsplit(request.url)
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        entry = self.corpus.get(url.path.lstrip("/")) if url.hostname == CORPUS_HOST else None
+        try:
+            self.backend.call()
+        except api_exceptions.GoogleAPICallError as e:
+            response.status_code = e.code
+            response.raw = BytesIO()
+            return response
+        if entry is None:
+            response.status_code = 404
+            response.raw = BytesIO()
+            return response
+
+        data = entry["data"]
+        variant = parse_qs(url.query).get("v", [""])[0]
+        if variant and entry["mime_type"].startswith("image/"):
+            data += variant.encode()
+        response.status_code = 200
+        response.headers["Content-Length"] = str(len(data))
+        response.raw = BytesIO(data)
+        return response
+
+    def close(self):
+        pass
+
+
+def install_fake_auth(backend):
+    """Accept "benchmark-token-<uid>" bearer tokens, waiting on ``backend`` per verification."""
+    def verify_id_token(id_token, check_revoked=False, **kwargs):
+        backend.call()
+        if not id_token.startswith("benchmark-token-"):
+            raise auth.InvalidIdTokenError("Unknown benchmark token")
+        return {"uid": id_token[len("benchmark-token-"):], "exp": time.time() + 3600}
+
+    auth.verify_id_token = verify_id_token
+
+
+# --- Corpus and load ---
+def load_corpus(paths):
+    """Read replayable files, sorted into ingredient labels (images) and reports.
+
+    Args:
+        paths (list): Files or directories
+
+    Returns:
+        dict: file name -> {"data", "mime_type", "kind"}
+    """
+    corpus = {}
+    for path in paths:
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for file_path in files:
+            if not os.path.isfile(file_path):
+                continue
+            with open(file_path, "rb") as f:
+                data = f.read()
+            try:
+                mime_type = file_types.sniff(data)
+            except ValueError:
+                logger.warning(f"Skipping unsupported corpus file {file_path}")
+                continue
+            kind = "label" if mime_type.startswith("image/") else "report"
+            corpus[os.path.basename(file_path)] = {"data": data, "mime_type": mime_type, "kind": kind}
+    return corpus
+
+
+def parse_mix(spec):
+    """Parse "analyze=6,report=1" into request type weights."""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in ("analyze", "structured", "stream", "report"):
+            raise ValueError(f"Unknown request type in mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class LoadGenerator:
+    """Open-loop load at a target rate through the Flask test client.
+
+    Requests start on schedule whether or not earlier ones have finished, and
+    run on a fixed pool of worker threads standing in for the WSGI server's
+    threads. When every worker is busy, new requests wait; that wait is
+    reported as the "queue" stage.
+
+    Args:
+        service: The imported app module
+        corpus (dict): From load_corpus
+        mix (dict): Request type -> weight
+        timer (StageTimer): Stage timings
+        workers (int): Server worker threads
+        users (int): Distinct users the load is spread over
+        vary_files (bool): Make every label upload byte-unique
+        rng (random.Random): Random source
+    """
+
+    def __init__(self, service, corpus, mix, timer, workers, users, vary_files, rng):
+        self.service = service
+        self.client = service.app.test_client()
+        self.labels = [name for name, entry in corpus.items() if entry["kind"] == "label"]
+        self.reports = [name for name, entry in corpus.items() if entry["kind"] == "report"]
+        if not self.labels and any(kind != "report" for kind in mix):
+            raise ValueError("The corpus has no label images to analyze")
+        if not self.reports and "report" in mix:
+            raise ValueError("The corpus has no healthcare reports")
+        self.mix = mix
+        self.timer = timer
+        self.workers = workers
+        self.users = users
+        self.vary_files = vary_files
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._submitted = 0
+        self._started = 0
+        self._statuses = Counter()
+        self._by_type = defaultdict(list)
+        self._samples = []
+
+    def _request(self, index):
+        kind = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        uid = f"benchmark-user-{self.rng.randrange(self.users)}"
+        headers = {"Authorization": f"Bearer benchmark-token-{uid}"}
+        if kind == "report":
+            url = f"https://{CORPUS_HOST}/{self.rng.choice(self.reports)}"
+            return kind, "/upload_healthcare_report", {"report_file": url}, headers
+        url = f"https://{CORPUS_HOST}/{self.rng.choice(self.labels)}"
+        if self.vary_files:
+            url += f"?v={index}"
+        form = {"ingredient_file": url}
+        if kind == "structured":
+            form["format"] = "structured"
+        elif kind == "stream":
+            form["stream"] = "true"
+        return kind, "/analyze", form, headers
+
+    def _run(self, index, scheduled):
+        kind, path, form, headers = self._request(index)
+        with self._lock:
+            self._busy += 1
+            self._started += 1
+        started = time.perf_counter()
+        self.timer.record("queue", started - scheduled)
+        try:
+            response = self.client.post(path, data=form, headers=headers)
+            response.get_data()  # drains streamed responses
+            status = response.status_code
+        except Exception:
+            logger.exception(f"Benchmark request to {path} failed")
+            status = "exception"
+        elapsed = time.perf_counter() - started
+        self.timer.record("request", elapsed)
+        with self._lock:
+            self._busy -= 1
+            self._statuses[status] += 1
+            self._by_type[kind].append((elapsed, status == 200))
+
+    def _sample(self, stop, interval):
+        guard = resilience.gemini_guard.limiter
+        while not stop.wait(interval):
+            with self._lock:
+                busy, backlog = self._busy, self._submitted - self._started
+            limiter = guard.stats()
+            self._samples.append({
+                "busy": busy,
+                "backlog": backlog,
+                "io_queue": self.service.io_executor._work_queue.qsize(),
+                "analysis_queue": self.service.analysis_executor._work_queue.qsize(),
+                "gemini_in_flight": limiter["in_flight"],
+                "gemini_limit": limiter["limit"],
+            })
+
+    def run(self, rps, duration, poisson=False, sample_interval=0.1):
+        """Send requests for ``duration`` seconds and wait for them to finish.
+
+        Returns:
+            dict: Request counts, achieved rate and saturation figures
+        """
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="worker")
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(stop, sample_interval), daemon=True)
+        sampler.start()
+
+        started = time.perf_counter()
+        next_at = started
+        index = 0
+        while next_at < started + duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with self._lock:
+                self._submitted += 1
+            pool.submit(self._run, index, next_at)
+            index += 1
+            next_at += self.rng.expovariate(rps) if poisson else 1 / rps
+        pool.shutdown(wait=True)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+        return self._results(rps, duration, elapsed)
+
+    def _results(self, rps, duration, elapsed):
+        samples = self._samples or [{"busy": 0, "backlog": 0, "io_queue": 0, "analysis_queue": 0,
+                                     "gemini_in_flight": 0, "gemini_limit": 0}]
+        completed = sum(self._statuses.values())
+        by_type = {}
+        for kind, results in sorted(self._by_type.items()):
+            latencies = [seconds for seconds, _ in results]
+            by_type[kind] = {
+                "count": len(results),
+                "ok": sum(1 for _, ok in results if ok),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            }
+        return {
+            "target_rps": rps,
+            "duration": duration,
+            "elapsed": round(elapsed, 2),
+            "sent": self._submitted,
+            "completed": completed,
+            "ok": self._statuses.get(200, 0),
+            "achieved_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+            "statuses": {str(status): count for status, count in self._statuses.items()},
+            "by_type": by_type,
+            "saturation": {
+                "workers": self.workers,
+                "busy_mean": round(sum(s["busy"] for s in samples) / len(samples), 2),
+                "busy_max": max(s["busy"] for s in samples),
+                "saturated_share": round(sum(1 for s in samples if s["busy"] >= self.workers) / len(samples), 3),
+                "backlog_max": max(s["backlog"] for s in samples),
+                "io_queue_max": max(s["io_queue"] for s in samples),
+                "analysis_queue_max": max(s["analysis_queue"] for s in samples),
+                "gemini_in_flight_max": max(s["gemini_in_flight"] for s in samples),
+                "gemini_limit_min": min(s["gemini_limit"] for s in samples),
+            },
+        }
+
+
+# --- Report ---
+def format_report(report):
+    load = report["load"]
+    lines = [
+        f"Requests: {load['sent']} sent over {load['elapsed']}s "
+        f"({load['target_rps']}/s target, {load['achieved_rps']}/s achieved), "
+        f"{load['ok']} ok, {load['completed'] - load['ok']} failed",
+        "  statuses: " + ", ".join(f"{status}={count}" for status, count in sorted(load["statuses"].items())),
+        "",
+        f"{'stage':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    rows = [("request", report["stages"]["request"])]
+    rows += [(f"  {kind}", summary) for kind, summary in load["by_type"].items()]
+    rows += [(stage, report["stages"][stage]) for stage in STAGES if stage in report["stages"]]
+    for name, summary in rows:
+        lines.append(f"{name:<20}{summary['count']:>8}{summary['p50_ms']:>10}{summary['p95_ms']:>10}"
+                     f"{summary['p99_ms']:>10}{summary.get('max_ms', ''):>10}")
+
+    saturation = load["saturation"]
+    lines += [
+        "",
+        f"Workers: {saturation['workers']}, busy mean {saturation['busy_mean']} / max {saturation['busy_max']}, "
+        f"all busy {saturation['saturated_share']:.0%} of the time, backlog max {saturation['backlog_max']}",
+        f"Pools: io queue max {saturation['io_queue_max']}, analysis queue max {saturation['analysis_queue_max']}, "
+        f"Gemini in flight max {saturation['gemini_in_flight_max']} "
+        f"(lowest limit {saturation['gemini_limit_min']})",
+        "Backends: " + "; ".join(
+            f"{name} " + " ".join(f"{key}={value}" for key, value in stats.items())
+            for name, stats in report["backends"].items()
+        ),
+    ]
+    return "\n".join(lines)
+
+
+def _prepare_environment(cache_dir):
+    """Point the service at throwaway caches and job store and skip network warm-up before it is imported."""
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("FIREBASE_PRIVATE_KEY_PATH", "benchmark")
+    os.environ.setdefault("CLIENT_WARM_UP", "false")
+    for name, file_name in (("EXTRACTION_CACHE_PATH", "extraction_cache.sqlite3"),
+                            ("ANALYSIS_CACHE_PATH", "analysis_cache.sqlite3"),
+                            ("VERDICT_CACHE_PATH", "verdict_cache.sqlite3"),
+                            ("JOB_STORE_PATH", "jobs.sqlite3")):
+        os.environ.setdefault(name, os.path.join(cache_dir, file_name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load-test the diet analysis API offline against fake Gemini, Firestore and storage backends. "
+                    "Service settings (pool sizes, cache backends, Gemini limits) come from the usual environment "
+                    "variables."
+    )
+    parser.add_argument("corpus", nargs="*", default=[DEFAULT_CORPUS], help="files or directories to replay")
+    parser.add_argument("--rps", type=float, default=5.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send requests for")
+    parser.add_argument("--workers", type=int, default=16, help="server worker threads")
+    parser.add_argument("--users", type=int, default=50, help="distinct users the load is spread over")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="request type weights (analyze, structured, stream, report)")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of a fixed interval")
+    parser.add_argument("--vary-files", action="store_true", help="make every label upload byte-unique")
+    for name, spec in DEFAULT_LATENCY.items():
+        parser.add_argument(f"--{name}-latency", default=spec,
+                            help=f"{name} latency in ms: fixed:MS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA "
+                                 f"(default {spec})")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="share of model calls that fail")
+    parser.add_argument("--gemini-rate-limit", type=float, default=0.0,
+                        help="model calls per second before 429s (0 = unlimited)")
+    parser.add_argument("--firestore-error-rate", type=float, default=0.0, help="share of Firestore RPCs that fail")
+    parser.add_argument("--cache-dir", help="directory for the service's SQLite caches (default: a fresh temp dir)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--json", help="also write the full report, including /metrics, to this file")
+    parser.add_argument("--log-level", default="WARNING", help="service log level")
+    args = parser.parse_args(argv)
+
+    # Configured before the service is imported, so its basicConfig() calls are no-ops
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    _prepare_environment(args.cache_dir or tempfile.mkdtemp(prefix="diet-benchmark-"))
+
+    rng = random.Random(args.seed)
+    timer = StageTimer()
+    latency = {name: parse_latency(getattr(args, f"{name}_latency"), rng) for name in DEFAULT_LATENCY}
+    backends = {
+        "generate": Backend("generate", latency["gemini"], timer, rng, args.gemini_error_rate, args.gemini_rate_limit),
+        "upload": Backend("upload", latency["upload"], timer, rng),
+        "firestore": Backend("firestore", latency["firestore"], timer, rng, args.firestore_error_rate),
+        "auth_verify": Backend("auth_verify", latency["auth"], timer, rng),
+        "storage": Backend("storage", latency["download"], timer, rng),
+    }
+
+    FakeGemini(backends["generate"], backends["upload"]).install()
+    db = FakeFirestore(backends["firestore"])
+    db.install()
+    install_fake_auth(backends["auth_verify"])
+
+    import app as service
+    import extract
+
+    corpus = load_corpus(args.corpus)
+    service.clients.get_session().mount("https://", CorpusAdapter(corpus, backends["storage"]))
+    service.verify_id_token_cached = timer.wrap("auth", service.verify_id_token_cached)
+    service.download_file = timer.wrap("download", service.download_file)
+    extract.sniff_mime_type = timer.wrap("sniff", extract.sniff_mime_type)
+    extract.parse_json_response = timer.wrap("parse", extract.parse_json_response)
+
+    # Seed profiles directly so setup doesn't count as Firestore traffic
+    for index in range(args.users):
+        db.write(f"users/benchmark-user-{index}",
+                 {"extracted_health_data": HEALTH_PROFILES[index % len(HEALTH_PROFILES)]})
+
+    generator = LoadGenerator(service, corpus, parse_mix(args.mix), timer, args.workers, args.users,
+                              args.vary_files, rng)
+    print(f"Replaying {len(generator.labels)} labels and {len(generator.reports)} reports "
+          f"at {args.rps}/s for {args.duration}s on {args.workers} workers...", file=sys.stderr)
+    load = generator.run(args.rps, args.duration, poisson=args.poisson)
+
+    report = {
+        "load": load,
+        "stages": {stage: timer.summary(stage) for stage in timer.stages()},
+        "backends": {name: backend.stats() for name, backend in backends.items()},
+    }
+    print(format_report(report))
+    if args.json:
+        report["metrics"] = generator.client.get("/metrics").get_json()
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Hit/miss/eviction counters shared by the cache backends."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def record_evictions(self, count=1):
+        with self._lock:
+            self.evictions += count
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class MemoryCache:
+    """In-process LRU cache with per-entry TTL and a memory cap.
+
+    Entry sizes are estimated from their JSON encoding. When either the entry
+    count or the total size exceeds its limit, least recently used entries are
+    evicted. Expired entries are dropped when read, and writes drop those at
+    the least recently used end, so an entry can outlive its TTL in memory
+    (never in results) until it is read or reaches that end.
+
+    Args:
+        max_entries (int): Maximum number of entries kept
+        max_bytes (int): Approximate memory budget for stored values
+        default_ttl (float): Default time-to-live in seconds (None = no expiry)
+        on_remove (callable): Called with the key whenever an entry is evicted,
+            expires or is deleted (not when it is overwritten)
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=32 * 1024 * 1024, default_ttl=None, on_remove=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.on_remove = on_remove
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._removed = []
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key`` or ``default`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.record_miss()
+                return default
+            value, expires_at, _ = entry
+            expired = expires_at is not None and expires_at <= time.time()
+            if expired:
+                self._remove(key)
+                self.stats.record_evictions()
+                self.stats.record_miss()
+            else:
+                self._entries.move_to_end(key)
+        if expired:
+            self._notify_removed()
+            return default
+        self.stats.record_hit()
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` under ``key``, evicting old entries if over budget."""
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        size = len(json.dumps(value, default=str))
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+        self._notify_removed()
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        self._notify_removed()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+        if self.on_remove:
+            self._removed.append(key)
+
+    def _notify_removed(self):
+        # Callbacks run outside the lock so they may use the cache themselves
+        if not self._removed:
+            return
+        with self._lock:
+            removed, self._removed = self._removed, []
+        for key in removed:
+            try:
+                self.on_remove(key)
+            except Exception as e:
+                logger.warning(f"Cache removal callback failed for {key}: {e}")
+
+    def _evict(self):
+        # Only look at the least recently used end; scanning every entry made each write O(n)
+        now = time.time()
+        evicted = 0
+        while self._entries:
+            key, (_, expires_at, _) = next(iter(self._entries.items()))
+            over_budget = len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            if not over_budget and (expires_at is None or expires_at > now):
+                break
+            self._remove(key)
+            evicted += 1
+        if evicted:
+            self.stats.record_evictions(evicted)
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and receive the same result (or exception).
+    A waiting caller gives up with TimeoutError after its own ``timeout``.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.collapsed = 0
+        self.timeouts = 0
+
+    def do(self, key, func, *args, timeout=None, **kwargs):
+        """Run ``func(*args, **kwargs)`` unless a call for ``key`` is already in flight.
+
+        Args:
+            timeout (float): Seconds to wait for an in-flight call (None = no limit);
+                the caller that runs ``func`` is not affected
+
+        Raises:
+            TimeoutError: If the in-flight call doesn't finish within ``timeout``
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.collapsed += 1
+                leader = False
+            else:
+                call = self._calls[key] = self._Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"Timed out after {timeout:.1f}s waiting for an in-flight call")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"executed": self.executed, "collapsed": self.collapsed, "timeouts": self.timeouts,
+                    "in_flight": len(self._calls)}
+
+
+class SQLiteCache:
+    """Persistent key/value cache backed by a single SQLite file.
+
+    Values are stored as JSON. Entries carry an optional expiry and a last-access
+    timestamp; once the table grows past ``max_entries`` the least recently used
+    rows are evicted. The file can be shared by several processes on one host.
+
+    Args:
+        path (str): Location of the SQLite database file
+        max_entries (int): Maximum number of rows kept before LRU eviction
+        default_ttl (float): Default time-to-live in seconds (None = no expiry)
+    """
+
+    def __init__(self, path, max_entries=10000, default_ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+            conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key`` or ``default`` on a miss."""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.stats.record_miss()
+                    return default
+                value, expires_at = row
+                if expires_at is not None and expires_at <= now:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    conn.commit()
+                    self.stats.record_evictions()
+                    self.stats.record_miss()
+                    return default
+                conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Cache read failed for {self.path}: {e}")
+            self.stats.record_miss()
+            return default
+
+        self.stats.record_hit()
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` under ``key``, evicting old rows if the cache is full."""
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl else None
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), expires_at, now)
+                )
+                self._evict(conn, now)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Cache write failed for {self.path}: {e}")
+
+    def delete(self, key):
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Cache delete failed for {self.path}: {e}")
+
+    def items(self, prefix=""):
+        """Yield ``(key, value)`` pairs for unexpired entries whose key starts with ``prefix``."""
+        now = time.time()
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM cache WHERE key >= ? AND key < ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (prefix, prefix + "\uffff", now)
+            ).fetchall()
+        for key, value in rows:
+            yield key, json.loads(value)
+
+    def keys(self, prefix=""):
+        """Return unexpired keys starting with ``prefix`` without decoding their values."""
+        now = time.time()
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key FROM cache WHERE key >= ? AND key < ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (prefix, prefix + "\uffff", now)
+            ).fetchall()
+        return [key for key, in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict(self, conn, now):
+        expired = conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        evicted = 0
+        if overflow > 0:
+            evicted = conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            ).rowcount
+        if expired or evicted:
+            self.stats.record_evictions(expired + evicted)
+
+
+def create_cache(backend="memory", path=None, max_entries=1000, max_bytes=32 * 1024 * 1024, default_ttl=None):
+    """Build a cache backend by name.
+
+    Args:
+        backend (str): "memory" for a per-process cache or "sqlite" for a store
+            shared by every worker on the host
+        path (str): SQLite file location (required for the "sqlite" backend)
+        max_entries (int): Maximum number of entries kept
+        max_bytes (int): Memory budget for the "memory" backend
+        default_ttl (float): Default time-to-live in seconds
+
+    Returns:
+        MemoryCache or SQLiteCache: The configured cache
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, max_bytes=max_bytes, default_ttl=default_ttl)
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("A path is required for the sqlite cache backend")
+        return SQLiteCache(path, max_entries=max_entries, default_ttl=default_ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import threading
+
+import google.generativeai as genai
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Connection pools kept per session: distinct hosts, and connections per host
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+# Hosts to open connections to at startup (comma-separated URLs)
+HTTP_WARM_URLS = [url.strip() for url in os.getenv(
+    "HTTP_WARM_URLS", "https://firebasestorage.googleapis.com"
+).split(",") if url.strip()]
+# Models whose endpoint connection is opened at startup (comma-separated names)
+GEMINI_WARM_MODELS = [name.strip() for name in os.getenv(
+    "GEMINI_WARM_MODELS", "gemini-1.5-flash"
+).split(",") if name.strip()]
+
+_lock = threading.Lock()
+_sessions = {}
+_models = {}
+_stats = {"models_created": 0, "model_reuses": 0}
+
+
+def get_session(name="default"):
+    """Return a process-wide requests.Session with a keep-alive connection pool.
+
+    Separate names get separate pools, so slow callbacks can't starve downloads.
+
+    Args:
+        name (str): Pool name
+
+    Returns:
+        requests.Session: Shared session
+    """
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+
+    with _lock:
+        if name not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[name] = session
+        return _sessions[name]
+
+
+def get_model(model_name="gemini-1.5-flash", generation_config=None, system_instruction=None):
+    """Return a cached GenerativeModel for a model name and configuration.
+
+    Args:
+        model_name (str): Gemini model to use
+        generation_config (dict): Generation settings (optional)
+        system_instruction (str): System prompt (optional)
+
+    Returns:
+        genai.GenerativeModel: Shared model instance
+    """
+    key = (model_name, json.dumps(generation_config, sort_keys=True, default=str), system_instruction)
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            _stats["model_reuses"] += 1
+            return model
+
+        kwargs = {}
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+        if system_instruction is not None:
+            kwargs["system_instruction"] = system_instruction
+        model = genai.GenerativeModel(model_name, **kwargs)
+        _models[key] = model
+        _stats["models_created"] += 1
+        return model
+
+
+def warm_up(urls=None, model_names=None):
+    """Open connections to storage and the model endpoint before the first request.
+
+    Failures are logged and ignored; the connection is simply opened later.
+
+    Args:
+        urls (list): URLs to connect to (default: HTTP_WARM_URLS)
+        model_names (list): Models to look up (default: GEMINI_WARM_MODELS)
+    """
+    session = get_session()
+    for url in HTTP_WARM_URLS if urls is None else urls:
+        try:
+            # Any response will do; the point is the TLS handshake and a pooled connection
+            session.head(url, timeout=5)
+            logger.info(f"Connection warmed: {url}")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Could not warm connection to {url}: {e}")
+
+    for model_name in GEMINI_WARM_MODELS if model_names is None else model_names:
+        try:
+            genai.get_model(f"models/{model_name}")
+            get_model(model_name)
+            logger.info(f"Gemini connection warmed for {model_name}")
+        except Exception as e:
+            logger.warning(f"Could not warm Gemini connection for {model_name}: {e}")
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result["models"] = len(_models)
+        result["sessions"] = sorted(_sessions)
+    return result
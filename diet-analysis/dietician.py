@@ -6,7 +6,16 @@ from dotenv import load_dotenv
 from google.cloud import firestore
 import logging
 import hashlib
+import queue
+import re
+import threading
 import time
+import cache
+import clients
+import extract
+import health_profile
+import resilience
+import rules
 
 # Load environment variables
 load_dotenv()
@@ -20,9 +29,64 @@ genai.configure(api_key=API_KEY)
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Simple in-memory cache for API responses (reduces API costs during testing)
-# In production, consider using Redis or another distributed cache
-_response_cache = {}
+# Analysis response cache. "memory" keeps a bounded LRU per process; "sqlite"
+# shares one on-disk store between all workers on the host.
+ANALYSIS_CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "memory")
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "cache/analysis_cache.sqlite3")
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "2000"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_response_cache = cache.create_cache(
+    ANALYSIS_CACHE_BACKEND,
+    path=ANALYSIS_CACHE_PATH,
+    max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+    default_ttl=3600
+)
+
+# Per-ingredient verdicts for the structured output mode, keyed by
+# (profile signature, ingredient) and shared across products
+VERDICT_CACHE_PATH = os.getenv("VERDICT_CACHE_PATH", "cache/verdict_cache.sqlite3")
+VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "50000"))
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", str(7 * 24 * 3600)))
+
+_verdict_cache = cache.create_cache(
+    ANALYSIS_CACHE_BACKEND,
+    path=VERDICT_CACHE_PATH,
+    max_entries=VERDICT_CACHE_MAX_ENTRIES,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+    default_ttl=VERDICT_CACHE_TTL
+)
+_verdict_stats_lock = threading.Lock()
+_verdict_stats = {"assessed": 0, "reused": 0, "model_calls": 0}
+
+VERDICT_EFFECTS = ("safe", "caution", "unsafe")
+VERDICTS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "name": {"type": "STRING"},
+            "effect": {"type": "STRING", "enum": list(VERDICT_EFFECTS)},
+            "reason": {"type": "STRING"},
+            "risk_tags": {"type": "ARRAY", "items": {"type": "STRING"}},
+        },
+        "required": ["name", "effect", "reason"],
+    },
+}
+
+# Local allergy/condition/medication rules run ahead of the LLM.
+#   "off":       LLM only
+#   "annotate":  rule findings are added to the prompt as verified facts
+#   "prefilter": the LLM only sees ingredients the rule table doesn't know, and
+#                is skipped entirely when every ingredient is resolved locally
+RULE_ENGINE_MODE = os.getenv("RULE_ENGINE_MODE", "annotate")
+
+_rule_stats_lock = threading.Lock()
+_rule_stats = {"rule_only": 0, "llm": 0, "degraded": 0}
+
+# Collapses concurrent identical analyses into one model call
+_analysis_flight = cache.SingleFlight()
 
 def serialize_firestore_data(data):
     """Convert Firestore data to JSON serializable format."""
@@ -44,94 +108,191 @@ def serialize_firestore_data(data):
             processed_data[key] = value
     return processed_data
 
+def normalize_ingredients(ingredients):
+    """Lowercase and collapse whitespace in ingredient names, keeping label order."""
+    return [" ".join(str(item).split()).lower() for item in ingredients]
+
+def prompt_profile(healthcare_data):
+    """Health data to show the model.
+    
+    With profile bucketing, analyses are shared by every user with the same
+    signature, so the model sees the canonical profile rather than one user's
+    exact values.
+    """
+    if health_profile.PROFILE_BUCKETING:
+        return health_profile.canonical_profile(healthcare_data)
+    # Convert Firestore timestamps and references to JSON-serializable format
+    return serialize_firestore_data(healthcare_data)
+
 def create_cache_key(healthcare_data, ingredients):
-    """Create a cache key based on input data."""
+    """Create a cache key based on input data.
+
+    The health profile contributes only its signature, so profiles in the
+    same clinical ranges with the same canonical conditions, allergies and
+    medications share a key. Capitalization or stray whitespace in ingredient
+    names does not change the key.
+    """
     combined = json.dumps({
-        "health": healthcare_data,
-        "ingredients": ingredients
+        "profile": health_profile.profile_signature(healthcare_data),
+        "ingredients": normalize_ingredients(ingredients)
     }, sort_keys=True)
-    return hashlib.md5(combined.encode()).hexdigest()
+    return hashlib.sha256(combined.encode()).hexdigest()
 
-def analyze(healthcare_data, ingredients, use_cache=True, cache_ttl=3600):
-    """Analyze product safety based on user's healthcare data and ingredients.
+def get_cache_stats():
+    """Return hit/miss/eviction counters for the analysis response cache."""
+    stats = _response_cache.stats.as_dict()
+    stats["backend"] = ANALYSIS_CACHE_BACKEND
+    stats["single_flight"] = _analysis_flight.stats()
+    stats["entries"] = len(_response_cache)
+    return stats
+
+def _record_verdict_stat(name, value=1):
+    with _verdict_stats_lock:
+        _verdict_stats[name] += value
+
+def _record_rule_stat(name):
+    with _rule_stats_lock:
+        _rule_stats[name] += 1
+
+def get_verdict_cache_stats():
+    """Return counters for the per-ingredient verdict cache."""
+    stats = _verdict_cache.stats.as_dict()
+    with _verdict_stats_lock:
+        stats.update(_verdict_stats)
+    stats["entries"] = len(_verdict_cache)
+    return stats
+
+def get_rule_stats():
+    """Return how many analyses were answered by the rule engine alone."""
+    with _rule_stats_lock:
+        stats = dict(_rule_stats)
+    stats["mode"] = RULE_ENGINE_MODE
+    return stats
+
+def _format_rule_findings(rule_result, prompt_ingredients):
+    """Describe locally verified findings for inclusion in the prompt."""
+    sections = []
+    if rule_result["warnings"]:
+        lines = [f"- {w['ingredient']}: {w['reason']} ({w['source']}: {w['trigger']}, {w['severity']} risk)"
+                 for w in rule_result["warnings"]]
+        sections.append("**Verified Risks (include these in Warnings):**\n" + "\n".join(lines))
+    already_assessed = [i for i in rule_result["resolved"] if i not in prompt_ingredients]
+    if already_assessed:
+        sections.append(
+            "**Already Assessed:** List these in Ingredient Analysis using the verified risks above "
+            "(safe if none apply) without further analysis: " + ", ".join(already_assessed)
+        )
+    return "\n\n".join(sections) + "\n\n" if sections else ""
+
+def build_analysis_prompt(healthcare_data, ingredients, rule_result=None):
+    """Build the dietician prompt, applying the configured rule engine mode.
     
     Args:
         healthcare_data (dict): User's healthcare data
         ingredients (list): List of ingredients to analyze
-        use_cache (bool): Whether to use caching (default: True)
-        cache_ttl (int): Cache time-to-live in seconds (default: 1 hour)
+        rule_result (dict): Precomputed rules.evaluate() output (optional)
         
     Returns:
-        str: Analysis results as formatted text
+        tuple: (prompt, None), or (None, rule-only analysis text) when the
+            rule engine resolved every ingredient in "prefilter" mode
     """
-    # Create cache key if caching is enabled
-    cache_key = create_cache_key(healthcare_data, ingredients) if use_cache else None
+    prompt_ingredients = ingredients
+    rule_findings = ""
+    if RULE_ENGINE_MODE != "off":
+        if rule_result is None:
+            rule_result = rules.evaluate(healthcare_data, ingredients)
+        if RULE_ENGINE_MODE == "prefilter":
+            if not rule_result["unresolved"]:
+                logger.info("All ingredients resolved by rule engine; skipping Gemini call")
+                _record_rule_stat("rule_only")
+                return None, rules.render_markdown(rule_result, ingredients)
+            prompt_ingredients = rule_result["unresolved"]
+        rule_findings = _format_rule_findings(rule_result, prompt_ingredients)
+    _record_rule_stat("llm")
+
+    serialized_data = prompt_profile(healthcare_data)
     
-    # Try to get from cache first
-    if use_cache and cache_key in _response_cache:
-        cache_entry = _response_cache[cache_key]
-        if time.time() - cache_entry["timestamp"] < cache_ttl:
-            logger.info(f"Using cached analysis result for key {cache_key[:8]}...")
-            return cache_entry["result"]
+    # Log input data for debugging (redact in production)
+    logger.info(f"Processing analysis for {len(prompt_ingredients)} ingredients")
     
+    # Create prompt for the AI model
+    prompt = (
+        "You are an expert dietician. Analyze the following ingredients based on the patient's health data. "
+        "Provide a structured response with the following sections:\n\n"
+        "1. **Summary:** A brief overview of the analysis.\n"
+        "2. **Ingredient Analysis:** For each ingredient, provide:\n"
+        "   - **Name:** The ingredient name.\n"
+        "   - **Effect:** Whether it is safe or unsafe for the patient.\n"
+        "   - **Reason:** A concise explanation of the effect.\n"
+        "3. **Warnings:** Any specific warnings or risks based on the patient's health conditions.\n"
+        "4. **Recommendations:** Actionable advice for the patient, including portion control, substitutions, or dietary modifications.\n\n"
+        "**Patient Data:**\n"
+        f"{json.dumps(serialized_data, indent=2)}\n\n"
+        f"{rule_findings}"
+        "**Ingredients:**\n"
+        f"{', '.join(prompt_ingredients)}\n\n"
+        "Ensure the response is concise, accurate, and tailored to the patient's health conditions."
+    )
+    return prompt, None
+
+# Shown above the rule-based analysis when Gemini cannot be called
+DEGRADED_NOTICE = (
+    "_AI analysis is temporarily unavailable. The assessment below is based only on "
+    "known ingredient interactions with your health data._\n\n"
+)
+
+def _degraded_analysis(healthcare_data, ingredients, rule_result=None):
+    """Build a rule-engine-only analysis for when Gemini is unavailable (never cached)."""
+    _record_rule_stat("degraded")
+    if rule_result is None:
+        rule_result = rules.evaluate(healthcare_data, ingredients)
+    return DEGRADED_NOTICE + rules.render_markdown(rule_result, ingredients)
+
+def _generate_analysis(healthcare_data, ingredients, rule_result, cache_key, cache_ttl, deadline=None):
+    """Produce an analysis with the rule engine or Gemini and cache it under ``cache_key``."""
+    deadline = deadline or resilience.Deadline()
     try:
-        # Convert Firestore timestamps and references to JSON-serializable format
-        serialized_data = serialize_firestore_data(healthcare_data)
-        
-        # Log input data for debugging (redact in production)
-        logger.info(f"Processing analysis for {len(ingredients)} ingredients")
-        
-        # Create prompt for the AI model
-        prompt = (
-            "You are an expert dietician. Analyze the following ingredients based on the patient's health data. "
-            "Provide a structured response with the following sections:\n\n"
-            "1. **Summary:** A brief overview of the analysis.\n"
-            "2. **Ingredient Analysis:** For each ingredient, provide:\n"
-            "   - **Name:** The ingredient name.\n"
-            "   - **Effect:** Whether it is safe or unsafe for the patient.\n"
-            "   - **Reason:** A concise explanation of the effect.\n"
-            "3. **Warnings:** Any specific warnings or risks based on the patient's health conditions.\n"
-            "4. **Recommendations:** Actionable advice for the patient, including portion control, substitutions, or dietary modifications.\n\n"
-            "**Patient Data:**\n"
-            f"{json.dumps(serialized_data, indent=2)}\n\n"
-            "**Ingredients:**\n"
-            f"{', '.join(ingredients)}\n\n"
-            "Ensure the response is concise, accurate, and tailored to the patient's health conditions."
-        )
+        prompt, rule_only_text = build_analysis_prompt(healthcare_data, ingredients, rule_result)
+        if rule_only_text is not None:
+            if cache_key:
+                _response_cache.set(cache_key, rule_only_text, ttl=cache_ttl)
+            return rule_only_text
 
         # Select the appropriate model
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        model = clients.get_model("gemini-1.5-flash")
         
         # Implement exponential backoff for API calls
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 logger.info(f"Calling Gemini API (attempt {attempt+1}/{max_retries})...")
-                result = model.generate_content([prompt])
+                with resilience.gemini_guard.slot(deadline):
+                    result = model.generate_content([prompt], request_options={"timeout": deadline.remaining()})
                 
                 # Ensure AI output exists before accessing parts
                 if result and hasattr(result, 'candidates') and result.candidates and result.candidates[0].content and result.candidates[0].content.parts:
                     response_text = result.candidates[0].content.parts[0].text
                     
                     # Cache the result if caching is enabled
-                    if use_cache and cache_key:
-                        _response_cache[cache_key] = {
-                            "result": response_text,
-                            "timestamp": time.time()
-                        }
+                    if cache_key:
+                        _response_cache.set(cache_key, response_text, ttl=cache_ttl)
                         
                     return response_text
                 else:
                     logger.warning("Received empty response from Gemini API")
                     
+            except resilience.GeminiUnavailableError as e:
+                logger.warning(f"{e}; serving rule-based analysis")
+                return _degraded_analysis(healthcare_data, ingredients, rule_result)
             except (PermissionDenied, GoogleAPICallError) as e:
-                if attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) + 1  # Exponential backoff with jitter
-                    logger.warning(f"API error: {e}. Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                else:
+                if attempt == max_retries - 1:
                     logger.error(f"API error after {max_retries} attempts: {e}")
                     raise
+                wait_time = (2 ** attempt) + 1  # Exponential backoff with jitter
+                logger.warning(f"API error: {e}. Retrying in {wait_time}s...")
+                if not deadline.sleep(wait_time):
+                    logger.error(f"API error and no time left before the deadline to retry: {e}")
+                    raise
         
         # Fallback response if all retries fail
         return "Unable to generate analysis after multiple attempts. Please try again later."
@@ -139,3 +300,303 @@ def analyze(healthcare_data, ingredients, use_cache=True, cache_ttl=3600):
     except Exception as e:
         logger.exception(f"Unexpected error in analysis: {e}")
         return f"Error in generating analysis: {str(e)}"
+
+def analyze(healthcare_data, ingredients, use_cache=True, cache_ttl=3600, rule_result=None, deadline=None):
+    """Analyze product safety based on user's healthcare data and ingredients.
+    
+    Args:
+        healthcare_data (dict): User's healthcare data
+        ingredients (list): List of ingredients to analyze
+        use_cache (bool): Whether to use caching (default: True)
+        cache_ttl (int): Cache time-to-live in seconds (default: 1 hour)
+        rule_result (dict): Precomputed rules.evaluate() output (optional)
+        deadline (resilience.Deadline): Time budget for the model call (optional)
+        
+    Returns:
+        str: Analysis results as formatted text. A rule-based analysis is
+            returned when Gemini is rate limited or its circuit breaker is open.
+    """
+    # Create cache key if caching is enabled
+    cache_key = create_cache_key(healthcare_data, ingredients) if use_cache else None
+    
+    # Try to get from cache first
+    if use_cache:
+        cached_result = _response_cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"Using cached analysis result for key {cache_key[:8]}...")
+            return cached_result
+    
+    # Concurrent requests for the same analysis wait on a single model call
+    flight_key = cache_key or create_cache_key(healthcare_data, ingredients)
+    try:
+        return _analysis_flight.do(
+            flight_key, _generate_analysis,
+            healthcare_data, ingredients, rule_result, cache_key, cache_ttl, deadline,
+            timeout=deadline.remaining() if deadline else None
+        )
+    except TimeoutError as e:
+        logger.warning(f"{e}; serving rule-based analysis")
+        return _degraded_analysis(healthcare_data, ingredients, rule_result)
+
+# Section headers in the dietician response, used to label streamed chunks
+SECTION_PATTERN = re.compile(
+    r"\*\*\s*(Summary|Ingredient Analysis|Warnings|Recommendations)\s*:?\s*\*\*", re.IGNORECASE
+)
+
+def _read_stream(model, prompt, deadline, chunks):
+    """Read a streaming model response into ``chunks`` as text, then an error if any, then None.
+
+    The Gemini slot is held only while the model is producing output, not
+    while the client is reading it.
+    """
+    try:
+        with resilience.gemini_guard.slot(deadline):
+            stream = model.generate_content([prompt], stream=True, request_options={"timeout": deadline.remaining()})
+            for chunk in stream:
+                if not (chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts):
+                    continue
+                text = "".join(part.text for part in chunk.candidates[0].content.parts if hasattr(part, "text"))
+                if text:
+                    chunks.put(text)
+    except Exception as e:
+        chunks.put(e)
+    finally:
+        chunks.put(None)
+
+def analyze_stream(healthcare_data, ingredients, use_cache=True, cache_ttl=3600, rule_result=None, deadline=None):
+    """Stream the dietician analysis as the model generates it.
+    
+    Cached and rule-only results are yielded as a single chunk. If the stream
+    fails before producing any text, falls back to the non-streaming analyze().
+    The complete text is cached once the stream finishes. The model response
+    is read on a separate thread, so a slow client never holds a Gemini slot.
+    
+    Args:
+        healthcare_data (dict): User's healthcare data
+        ingredients (list): List of ingredients to analyze
+        use_cache (bool): Whether to use caching (default: True)
+        cache_ttl (int): Cache time-to-live in seconds (default: 1 hour)
+        rule_result (dict): Precomputed rules.evaluate() output (optional)
+        deadline (resilience.Deadline): Time budget for the model call (optional)
+        
+    Yields:
+        dict: {"section": current section name or None, "text": chunk text}
+    """
+    cache_key = create_cache_key(healthcare_data, ingredients) if use_cache else None
+    if use_cache:
+        cached_result = _response_cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"Using cached analysis result for key {cache_key[:8]}...")
+            yield {"section": None, "text": cached_result}
+            return
+
+    prompt, rule_only_text = build_analysis_prompt(healthcare_data, ingredients, rule_result)
+    if rule_only_text is not None:
+        if use_cache and cache_key:
+            _response_cache.set(cache_key, rule_only_text, ttl=cache_ttl)
+        yield {"section": None, "text": rule_only_text}
+        return
+
+    deadline = deadline or resilience.Deadline()
+    full_text = ""
+    section = None
+    try:
+        model = clients.get_model("gemini-1.5-flash")
+        logger.info("Calling Gemini API (streaming)...")
+        chunks = queue.Queue()
+        threading.Thread(target=_read_stream, args=(model, prompt, deadline, chunks),
+                         name="gemini-stream", daemon=True).start()
+        while True:
+            text = chunks.get()
+            if text is None:
+                break
+            if isinstance(text, Exception):
+                raise text
+            # Rescan a little of the previous text in case a header spans two chunks
+            scan_from = max(0, len(full_text) - 40)
+            full_text += text
+            for match in SECTION_PATTERN.finditer(full_text, scan_from):
+                section = match.group(1).title()
+            yield {"section": section, "text": text}
+    except resilience.GeminiUnavailableError as e:
+        logger.warning(f"{e}; serving rule-based analysis")
+        yield {"section": None, "text": _degraded_analysis(healthcare_data, ingredients, rule_result)}
+        return
+    except Exception as e:
+        if not full_text:
+            logger.warning(f"Streaming analysis failed ({e}); falling back to non-streaming call")
+            yield {"section": None, "text": analyze(healthcare_data, ingredients, use_cache, cache_ttl, rule_result, deadline)}
+            return
+        logger.exception(f"Streaming analysis interrupted: {e}")
+        yield {"section": section, "text": "\n\nError in generating analysis: the response was interrupted."}
+        return
+
+    if use_cache and cache_key and full_text:
+        _response_cache.set(cache_key, full_text, ttl=cache_ttl)
+
+# --- Structured Output ---
+def _verdict_key(signature, ingredient):
+    return f"{signature}:{ingredient}"
+
+def _merge_rule_verdict(verdict, rule_verdict):
+    """Raise a verdict to at least the severity the rule engine found."""
+    if VERDICT_EFFECTS.index(rule_verdict["effect"]) <= VERDICT_EFFECTS.index(verdict["effect"]):
+        return verdict
+    merged = dict(verdict)
+    merged["effect"] = rule_verdict["effect"]
+    merged["reason"] = f"{rule_verdict['reason']} {verdict['reason']}".strip()
+    merged["risk_tags"] = sorted(set(verdict.get("risk_tags", [])) | set(rule_verdict["risk_tags"]))
+    return merged
+
+def _summarize_verdicts(verdicts):
+    unsafe = [v["name"] for v in verdicts if v["effect"] == "unsafe"]
+    caution = [v["name"] for v in verdicts if v["effect"] == "caution"]
+    unknown = [v["name"] for v in verdicts if v["effect"] not in VERDICT_EFFECTS]
+    # Unassessed ingredients are never reported as suitable
+    not_assessed = f"{len(unknown)} of {len(verdicts)} ingredients could not be assessed ({', '.join(unknown)})."
+    if not unsafe and not caution:
+        if unknown:
+            return f"No problems found, but {not_assessed}"
+        return f"All {len(verdicts)} ingredients are suitable for your health profile."
+    parts = []
+    if unsafe:
+        parts.append(f"unsafe: {', '.join(unsafe)}")
+    if caution:
+        parts.append(f"use with caution: {', '.join(caution)}")
+    summary = f"{len(unsafe) + len(caution)} of {len(verdicts)} ingredients need attention ({'; '.join(parts)})."
+    return f"{summary} {not_assessed}" if unknown else summary
+
+def _generate_verdicts(healthcare_data, ingredients, rule_result, signature, use_cache, deadline):
+    """Ask Gemini for verdicts on ``ingredients`` (normalized names) and cache them.
+    
+    Returns:
+        dict: ingredient -> verdict for every ingredient the model assessed
+    """
+    rule_findings = _format_rule_findings(rule_result, ingredients) if rule_result else ""
+    prompt = (
+        "You are an expert dietician. For each ingredient below, decide whether it is safe, needs caution, "
+        "or is unsafe for the patient, give a one-sentence reason, and list short risk tags "
+        "(e.g. \"high sodium\", \"added sugar\", \"allergen\"). "
+        "Return one entry per ingredient, using the ingredient name exactly as given.\n\n"
+        "**Patient Data:**\n"
+        f"{json.dumps(prompt_profile(healthcare_data), indent=2, default=str)}\n\n"
+        f"{rule_findings}"
+        "**Ingredients:**\n"
+        f"{json.dumps(ingredients)}"
+    )
+    model = clients.get_model(
+        "gemini-1.5-flash",
+        {"response_mime_type": "application/json", "response_schema": VERDICTS_SCHEMA}
+    )
+
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            logger.info(f"Requesting verdicts for {len(ingredients)} ingredients (attempt {attempt+1}/{max_retries})...")
+            with resilience.gemini_guard.slot(deadline):
+                result = model.generate_content([prompt], request_options={"timeout": deadline.remaining()})
+            _record_verdict_stat("model_calls")
+            if result and result.candidates and result.candidates[0].content and result.candidates[0].content.parts:
+                entries = extract.parse_json_response(
+                    "".join(part.text for part in result.candidates[0].content.parts if hasattr(part, "text")), list
+                )
+                if entries:
+                    break
+                logger.warning("Verdict response had no JSON list")
+            else:
+                logger.warning("Received empty response from Gemini API")
+        except (PermissionDenied, GoogleAPICallError) as e:
+            logger.warning(f"API error: {e}")
+        if attempt == max_retries - 1 or not deadline.sleep((2 ** attempt) + 1):
+            return {}
+
+    requested = set(ingredients)
+    verdicts = {}
+    for entry in entries if isinstance(entries, list) else []:
+        name = normalize_ingredients([entry.get("name", "")])[0]
+        if name in requested and entry.get("effect") in VERDICT_EFFECTS:
+            verdict = {
+                "name": name,
+                "effect": entry["effect"],
+                "reason": str(entry.get("reason", "")).strip(),
+                "risk_tags": sorted({str(tag).strip().lower() for tag in entry.get("risk_tags", []) if str(tag).strip()}),
+            }
+            verdicts[name] = verdict
+            if use_cache:
+                _verdict_cache.set(_verdict_key(signature, name), verdict)
+    return verdicts
+
+def analyze_structured(healthcare_data, ingredients, use_cache=True, deadline=None):
+    """Analyze a product as per-ingredient verdicts plus a summary.
+    
+    Verdicts are cached per (profile signature, ingredient), so only
+    ingredients not yet assessed for this profile go to the model, in a single
+    call. Rule engine warnings are applied on top of every verdict; in
+    "prefilter" mode ingredients the rule table knows are not sent at all.
+    
+    Args:
+        healthcare_data (dict): User's healthcare data
+        ingredients (list): List of ingredients to analyze
+        use_cache (bool): Whether to use the verdict cache (default: True)
+        deadline (resilience.Deadline): Time budget for the model call (optional)
+        
+    Returns:
+        dict: {"summary": str, "verdicts": [{"name", "effect", "reason", "risk_tags"}],
+            "cached": verdicts served from cache, "assessed": verdicts from the model}.
+            Ingredients that could not be assessed have effect "unknown".
+    """
+    deadline = deadline or resilience.Deadline()
+    names = list(dict.fromkeys(normalize_ingredients(ingredients)))
+    # Evaluated on the normalized names so results line up with cache keys
+    rule_result = rules.evaluate(healthcare_data, names) if RULE_ENGINE_MODE != "off" else None
+    rule_verdicts = rules.ingredient_verdicts(rule_result, names) if rule_result else {}
+
+    signature = health_profile.profile_signature(healthcare_data)
+    verdicts, missing = {}, []
+    for name in names:
+        if RULE_ENGINE_MODE == "prefilter" and name in rule_result["resolved"]:
+            verdicts[name] = rule_verdicts[name]
+            continue
+        cached_verdict = _verdict_cache.get(_verdict_key(signature, name)) if use_cache else None
+        if cached_verdict is not None:
+            verdicts[name] = cached_verdict
+        else:
+            missing.append(name)
+    cached_count = len(names) - len(missing)
+    _record_verdict_stat("reused", cached_count)
+
+    assessed = {}
+    if missing:
+        try:
+            # Concurrent requests needing the same verdicts share one model call
+            assessed = _analysis_flight.do(
+                f"verdicts:{signature}:" + "|".join(sorted(missing)), _generate_verdicts,
+                healthcare_data, missing, rule_result, signature, use_cache, deadline,
+                timeout=deadline.remaining()
+            )
+        except (resilience.GeminiUnavailableError, TimeoutError) as e:
+            logger.warning(f"{e}; serving rule-based verdicts")
+            _record_rule_stat("degraded")
+        except Exception as e:
+            logger.exception(f"Unexpected error generating verdicts: {e}")
+        _record_verdict_stat("assessed", len(assessed))
+
+    results = []
+    for name in names:
+        verdict = verdicts.get(name) or assessed.get(name)
+        if verdict is None:
+            verdict = rule_verdicts.get(name) if name in (rule_result or {}).get("resolved", []) else None
+            verdict = verdict or {
+                "name": name, "effect": "unknown", "risk_tags": [],
+                "reason": "This ingredient could not be assessed right now."
+            }
+        elif name in rule_verdicts:
+            verdict = _merge_rule_verdict(verdict, rule_verdicts[name])
+        results.append(verdict)
+
+    return {
+        "summary": _summarize_verdicts(results),
+        "verdicts": results,
+        "cached": cached_count,
+        "assessed": len(assessed),
+    }
@@ -1,15 +1,28 @@
 import json
 import google.generativeai as genai
-from google.api_core.exceptions import PermissionDenied, GoogleAPICallError
+from google.api_core.exceptions import PermissionDenied, NotFound, GoogleAPICallError
 import logging
 import os
 import re
-import mimetypes
 import time
 from io import BytesIO
-from werkzeug.utils import secure_filename
-import tempfile
+import hashlib
+import threading
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+import cache
+import clients
+import file_types
+import lab_report
+import ocr
+import pdf_pipeline
+import resilience
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Perceptual hashing and image preprocessing are optional
+    Image = None
+    ImageOps = None
 
 # Load environment variables
 load_dotenv()
@@ -31,186 +44,595 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Allowed MIME types for security
-ALLOWED_MIME_TYPES = {"image/png", "image/jpeg", "application/pdf"}
+# Files up to this size are sent inline with the prompt instead of via the File API
+# Larger files are uploaded once through the File API and the handle is reused
+INLINE_UPLOAD_MAX_BYTES = int(os.getenv("INLINE_UPLOAD_MAX_BYTES", str(1024 * 1024)))
+
+# Uploaded Gemini files expire after 48 hours; refresh handles a little early
+FILE_HANDLE_TTL = float(os.getenv("FILE_HANDLE_TTL", str(47 * 3600)))
+FILE_HANDLE_REFRESH_MARGIN = float(os.getenv("FILE_HANDLE_REFRESH_MARGIN", "600"))
+FILE_HANDLE_MAX_ENTRIES = int(os.getenv("FILE_HANDLE_MAX_ENTRIES", "2000"))
+
+_file_handles = cache.MemoryCache(max_entries=FILE_HANDLE_MAX_ENTRIES, default_ttl=FILE_HANDLE_TTL)
+_upload_stats_lock = threading.Lock()
+_upload_stats = {"uploads": 0, "reuses": 0, "bytes_uploaded": 0, "bytes_saved": 0, "bytes_inline": 0}
+
+# Image preprocessing applied to label and report photos before upload
+IMAGE_PREPROCESSING = os.getenv("IMAGE_PREPROCESSING", "true").lower() == "true"
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1600"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "false").lower() == "true"
+IMAGE_CROP_TO_TEXT = os.getenv("IMAGE_CROP_TO_TEXT", "false").lower() == "true"
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+
+# Optional offline OCR fast path for ingredient labels
+LOCAL_OCR_ENABLED = os.getenv("LOCAL_OCR_ENABLED", "false").lower() == "true"
+LOCAL_OCR_MIN_CONFIDENCE = float(os.getenv("LOCAL_OCR_MIN_CONFIDENCE", "0.8"))
+
+_ocr_stats_lock = threading.Lock()
+_ocr_stats = {"fast_path": 0, "fallback": 0}
+
+# Digital PDFs: read the text layer locally, parse known lab layouts without a
+# model call, and otherwise send the text instead of the file
+LOCAL_TEXT_EXTRACTION = os.getenv("LOCAL_TEXT_EXTRACTION", "true").lower() == "true"
+# Longer text layers go through the page-group pipeline instead
+LOCAL_TEXT_MAX_CHARS = int(os.getenv("LOCAL_TEXT_MAX_CHARS", "30000"))
+# Lab values the local parser must find before its result is used on its own
+LAB_PARSER_MIN_FIELDS = int(os.getenv("LAB_PARSER_MIN_FIELDS", "2"))
+
+_text_layer_stats_lock = threading.Lock()
+_text_layer_stats = {"parsed_locally": 0, "text_prompt": 0, "no_findings": 0}
+
+# Ask Gemini for schema-constrained JSON instead of parsing free-form replies
+JSON_RESPONSE_MODE = os.getenv("JSON_RESPONSE_MODE", "true").lower() == "true"
+
+_STRING_LIST = {"type": "ARRAY", "items": {"type": "STRING"}}
+INGREDIENTS_SCHEMA = _STRING_LIST
+HEALTHCARE_DATA_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "blood_pressure": {"type": "STRING"},
+        "blood_sugar": {"type": "STRING"},
+        "hba1c": {"type": "STRING"},
+        "cholesterol": {
+            "type": "OBJECT",
+            "properties": {
+                "total": {"type": "STRING"},
+                "hdl": {"type": "STRING"},
+                "ldl": {"type": "STRING"},
+                "triglycerides": {"type": "STRING"},
+            },
+        },
+        "conditions": _STRING_LIST,
+        "allergies": _STRING_LIST,
+        "medications": _STRING_LIST,
+        # Free-form metrics, flattened into top-level keys after parsing
+        "other_metrics": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"name": {"type": "STRING"}, "value": {"type": "STRING"}},
+                "required": ["name", "value"],
+            },
+        },
+    },
+}
+
+
+# Content-addressed cache for ingredient extraction results
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "cache/extraction_cache.sqlite3")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "5000"))
+EXTRACTION_CACHE_TTL = float(os.getenv("EXTRACTION_CACHE_TTL", str(30 * 24 * 3600)))
+# Near-duplicate lookup by perceptual hash. Off by default: labels that share a
+# layout can hash identically while listing different ingredients, so a hit is
+# only served when local OCR of the new label confirms the cached list.
+PERCEPTUAL_CACHE_ENABLED = os.getenv("PERCEPTUAL_CACHE_ENABLED", "false").lower() == "true"
+# Maximum Hamming distance (out of 64 bits) for two labels to count as the same photo
+PERCEPTUAL_HASH_MAX_DISTANCE = int(os.getenv("PERCEPTUAL_HASH_MAX_DISTANCE", "6"))
+# Word overlap (Jaccard) required between the OCR'd ingredient list and the cached one
+PERCEPTUAL_MATCH_MIN_OVERLAP = float(os.getenv("PERCEPTUAL_MATCH_MIN_OVERLAP", "0.8"))
+
+_ingredient_cache = cache.SQLiteCache(
+    EXTRACTION_CACHE_PATH,
+    max_entries=EXTRACTION_CACHE_MAX_ENTRIES,
+    default_ttl=EXTRACTION_CACHE_TTL
+)
+_perceptual_stats_lock = threading.Lock()
+_perceptual_stats = {"hits": 0, "rejections": 0}
+# Collapses concurrent extractions of the same file into one model call
+_extraction_flight = cache.SingleFlight()
 
 # --- Helper Functions ---
-def save_file_temporarily(file_storage_object) -> str:
-    """Save uploaded file temporarily with validation.
+def sniff_mime_type(data):
+    """Detect the MIME type of a file from its contents.
     
     Args:
-        file_storage_object (BytesIO): File-like object to save
+        data (bytes): File contents
         
     Returns:
-        str: Path to temporarily saved file
+        str: Detected MIME type (see file_types for the supported types)
         
     Raises:
         ValueError: If file type is not allowed
-        IOError: If file saving fails
     """
-    temp_path = None
+    return file_types.sniff(data)
+
+def load_file_part(file_storage_object):
+    """Build an in-memory Gemini file part from a file-like object.
+    
+    For BytesIO objects the underlying buffer is returned without copying.
+    
+    Args:
+        file_storage_object (BytesIO): File-like object to send
+        
+    Returns:
+        dict: {"mime_type": str, "data": bytes} suitable for generate_content
+        
+    Raises:
+        ValueError: If file type is not allowed
+    """
+    if not (hasattr(file_storage_object, 'read') and callable(file_storage_object.read)):
+        raise ValueError("Invalid file object provided")
+
+    if isinstance(file_storage_object, BytesIO):
+        data = file_storage_object.getvalue()
+    else:
+        file_storage_object.seek(0)
+        data = file_storage_object.read()
+        file_storage_object.seek(0)
+
+    return {"mime_type": sniff_mime_type(data), "data": data}
+
+def _crop_to_text_region(img, padding=0.02):
+    """Crop an image to the bounding box of its dark (ink) pixels."""
+    gray = ImageOps.autocontrast(img.convert("L"))
+    ink = gray.point(lambda value: 255 if value < 128 else 0)
+    bbox = ink.getbbox()
+    if not bbox:
+        return img
+
+    left, top, right, bottom = bbox
+    # Ignore boxes that are too small to be a label (likely noise)
+    if (right - left) * (bottom - top) < 0.1 * img.width * img.height:
+        return img
+    pad_x, pad_y = int(img.width * padding), int(img.height * padding)
+    return img.crop((
+        max(0, left - pad_x), max(0, top - pad_y),
+        min(img.width, right + pad_x), min(img.height, bottom + pad_y)
+    ))
+
+def preprocess_image(file_part):
+    """Downscale, optionally crop/grayscale, and recompress an image part.
+    
+    The re-encoded image is only used when it is smaller than the original.
+    PDFs and undecodable files are returned unchanged.
+    
+    Args:
+        file_part (dict): In-memory part from load_file_part
+        
+    Returns:
+        dict: Possibly recompressed {"mime_type", "data"} part
+    """
+    if not IMAGE_PREPROCESSING or Image is None:
+        return file_part
+    if file_part["mime_type"] in file_types.HEIF_MIME_TYPES and file_types.pillow_heif is None:
+        logger.warning(f"pillow_heif is not installed; sending {file_part['mime_type']} image "
+                       f"({len(file_part['data'])} bytes) to Gemini without preprocessing")
+        return file_part
+    if not file_types.can_decode(file_part["mime_type"]):
+        return file_part
+
+    bytes_in = len(file_part["data"])
     try:
-        # Check if we're dealing with BytesIO or similar
-        if hasattr(file_storage_object, 'read') and callable(file_storage_object.read):
-            # Read the first few bytes to check file type
-            file_storage_object.seek(0)
-            file_header = file_storage_object.read(2048)
-            file_storage_object.seek(0)
-            
-            # Guess MIME type from file content
-            mime_type = mimetypes.guess_type("file.pdf")[0]  # Default to PDF
-            
-            # Check for JPEG/PNG signatures
-            if file_header.startswith(b'\xff\xd8'):
-                mime_type = "image/jpeg"
-            elif file_header.startswith(b'\x89PNG\r\n\x1a\n'):
-                mime_type = "image/png"
-            elif b'%PDF-' in file_header:
-                mime_type = "application/pdf"
-                
-            if mime_type not in ALLOWED_MIME_TYPES:
-                raise ValueError(f"Unsupported file type detected: {mime_type}")
-                
-            # Create temporary file with appropriate extension
-            ext = ".pdf" if mime_type == "application/pdf" else ".jpg"
-            temp_fd, temp_path = tempfile.mkstemp(suffix=ext)
-            
-            with os.fdopen(temp_fd, "wb") as tmp_file:
-                # Reset the file pointer and copy all content
-                file_storage_object.seek(0)
-                tmp_file.write(file_storage_object.read())
-                
-            logger.info(f"File saved temporarily at: {temp_path}")
-            return temp_path
-            
-        else:
-            raise ValueError("Invalid file object provided")
-            
+        with Image.open(BytesIO(file_part["data"])) as img:
+            img = ImageOps.exif_transpose(img)
+            if IMAGE_CROP_TO_TEXT:
+                img = _crop_to_text_region(img)
+            img.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+            img = img.convert("L") if IMAGE_GRAYSCALE else img.convert("RGB")
+
+            output = BytesIO()
+            img.save(output, format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_QUALITY, optimize=True)
+    except Exception as e:
+        logger.warning(f"Image preprocessing skipped: {e}")
+        return file_part
+
+    bytes_out = output.tell()
+    if bytes_out >= bytes_in:
+        logger.info(f"Image preprocessing kept original ({bytes_in} bytes, re-encoded {bytes_out} bytes)")
+        return file_part
+
+    logger.info(f"Image preprocessed: {bytes_in} bytes in, {bytes_out} bytes out "
+                f"({img.width}x{img.height} {IMAGE_OUTPUT_FORMAT})")
+    return {"mime_type": f"image/{IMAGE_OUTPUT_FORMAT.lower()}", "data": output.getvalue()}
+
+def content_hash(file_storage_object):
+    """Return the SHA-256 hex digest of a file-like object's bytes."""
+    if isinstance(file_storage_object, BytesIO):
+        # Hash the buffer in place instead of reading a copy
+        with file_storage_object.getbuffer() as view:
+            return hashlib.sha256(view).hexdigest()
+    file_storage_object.seek(0)
+    digest = hashlib.sha256(file_storage_object.read()).hexdigest()
+    file_storage_object.seek(0)
+    return digest
+
+def perceptual_hash(file_storage_object):
+    """Compute a 64-bit difference hash (dHash) of an image.
+
+    Re-photographed or recompressed copies of the same label produce hashes
+    that differ in only a few bits.
+
+    Args:
+        file_storage_object (BytesIO): File-like object containing an image
+
+    Returns:
+        int: 64-bit perceptual hash, or None if the file is not a decodable image
+    """
+    if Image is None:
+        return None
+    try:
+        file_storage_object.seek(0)
+        with Image.open(file_storage_object) as img:
+            img = img.convert("L").resize((9, 8), Image.LANCZOS)
+            pixels = list(img.getdata())
+        value = 0
+        for row in range(8):
+            for col in range(8):
+                left = pixels[row * 9 + col]
+                right = pixels[row * 9 + col + 1]
+                value = (value << 1) | (1 if left > right else 0)
+        return value
     except Exception as e:
-        # Clean up the temp file if something goes wrong
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        logger.error(f"Error saving temp file: {e}")
-        raise
-
-def call_gemini_api(prompt, file_path, retries=3, model_name="gemini-1.5-flash"):
+        logger.info(f"Perceptual hash unavailable for file: {e}")
+        return None
+    finally:
+        file_storage_object.seek(0)
+
+def _ingredient_words(ingredients):
+    return {word for item in ingredients for word in re.findall(r"[a-z]+", str(item).lower())}
+
+def confirm_perceptual_match(file_storage_object, ingredients):
+    """Check a perceptual-hash hit against the new label's own text.
+
+    Two labels can share a layout (and a hash) while listing different
+    ingredients, so the cached list is only trusted if local OCR of the new
+    label reads an ingredient list with mostly the same words.
+
+    Returns:
+        bool: True if the cached ingredients match the label
+    """
+    if ocr.pytesseract is None:
+        return False
+    text, _ = ocr.read_text(load_file_part(file_storage_object)["data"])
+    seen, _ = ocr.parse_ingredient_list(text)
+    if not seen:
+        return False
+    cached_words, seen_words = _ingredient_words(ingredients), _ingredient_words(seen)
+    overlap = len(cached_words & seen_words) / len(cached_words | seen_words)
+    return overlap >= PERCEPTUAL_MATCH_MIN_OVERLAP
+
+def get_cached_ingredients(file_storage_object):
+    """Look up previously extracted ingredients for a label.
+
+    Only exact content-hash matches are served, unless PERCEPTUAL_CACHE_ENABLED
+    is set; then the nearest perceptual hash within
+    ``PERCEPTUAL_HASH_MAX_DISTANCE`` bits is used if local OCR confirms it.
+
+    Returns:
+        tuple: (ingredients or None, sha256 digest, perceptual hash or None)
+    """
+    digest = content_hash(file_storage_object)
+    ingredients = _ingredient_cache.get(f"sha256:{digest}")
+    if ingredients is not None or not PERCEPTUAL_CACHE_ENABLED:
+        return ingredients, digest, None
+
+    phash = perceptual_hash(file_storage_object)
+    if phash is None:
+        return None, digest, None
+
+    best_match, best_distance = None, PERCEPTUAL_HASH_MAX_DISTANCE + 1
+    for key in _ingredient_cache.keys("phash:"):
+        distance = bin(int(key.split(":", 1)[1], 16) ^ phash).count("1")
+        if distance < best_distance:
+            best_match, best_distance = key, distance
+    if best_match is None:
+        return None, digest, phash
+
+    ingredients = _ingredient_cache.get(best_match)
+    if ingredients is None or not confirm_perceptual_match(file_storage_object, ingredients):
+        _record_perceptual_stat("rejections")
+        logger.info(f"Perceptual cache match at distance {best_distance} not confirmed by OCR")
+        return None, digest, phash
+
+    _record_perceptual_stat("hits")
+    logger.info(f"Perceptual cache match at distance {best_distance}")
+    _ingredient_cache.set(f"sha256:{digest}", ingredients)
+    return ingredients, digest, phash
+
+def _record_perceptual_stat(name):
+    with _perceptual_stats_lock:
+        _perceptual_stats[name] += 1
+
+def cache_ingredients(ingredients, digest, phash=None):
+    """Store extracted ingredients under the content hash (and perceptual hash)."""
+    _ingredient_cache.set(f"sha256:{digest}", ingredients)
+    if phash is not None:
+        _ingredient_cache.set(f"phash:{phash:016x}", ingredients)
+
+def get_extraction_cache_stats():
+    """Return hit/miss/eviction counters for the ingredient extraction cache."""
+    stats = _ingredient_cache.stats.as_dict()
+    with _perceptual_stats_lock:
+        stats["perceptual_hits"] = _perceptual_stats["hits"]
+        stats["perceptual_rejections"] = _perceptual_stats["rejections"]
+    stats["single_flight"] = _extraction_flight.stats()
+    stats["entries"] = len(_ingredient_cache)
+    return stats
+
+def _record_upload_stat(name, value=1):
+    with _upload_stats_lock:
+        _upload_stats[name] += value
+
+def get_remote_file(file_part):
+    """Return a Gemini File API handle for in-memory data, uploading only once.
+    
+    Handles are keyed by the SHA-256 of the data and reused across retries and
+    requests until shortly before the remote file expires.
+    
+    Args:
+        file_part (dict): In-memory part from load_file_part
+        
+    Returns:
+        tuple: (file handle, content digest)
+    """
+    data = file_part["data"]
+    digest = hashlib.sha256(data).hexdigest()
+    handle = _file_handles.get(digest)
+    if handle is not None:
+        _record_upload_stat("reuses")
+        _record_upload_stat("bytes_saved", len(data))
+        logger.info(f"Reusing uploaded file {getattr(handle, 'name', '')} for {digest[:8]}...")
+        return handle, digest
+
+    logger.info(f"Uploading {len(data)} bytes to Gemini API ({file_part['mime_type']})")
+    handle = genai.upload_file(BytesIO(data), mime_type=file_part["mime_type"])
+    if not handle:
+        return None, digest
+    _record_upload_stat("uploads")
+    _record_upload_stat("bytes_uploaded", len(data))
+
+    ttl = FILE_HANDLE_TTL
+    expiration = getattr(handle, "expiration_time", None)
+    if isinstance(expiration, datetime):
+        if expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=timezone.utc)
+        ttl = (expiration - datetime.now(timezone.utc)).total_seconds() - FILE_HANDLE_REFRESH_MARGIN
+    if ttl > 0:
+        _file_handles.set(digest, handle, ttl=ttl)
+    return handle, digest
+
+def get_ocr_stats():
+    """Return how many ingredient extractions took the local OCR fast path."""
+    with _ocr_stats_lock:
+        stats = dict(_ocr_stats)
+    attempts = stats["fast_path"] + stats["fallback"]
+    stats["enabled"] = LOCAL_OCR_ENABLED and ocr.pytesseract is not None
+    stats["fast_path_ratio"] = round(stats["fast_path"] / attempts, 4) if attempts else 0.0
+    return stats
+
+def extract_ingredients_with_ocr(file_part):
+    """Try the local OCR engine and return its result if confident enough.
+    
+    Args:
+        file_part (dict): In-memory image part
+        
+    Returns:
+        list: Ingredients, or None if the LLM path should be used
+    """
+    if not LOCAL_OCR_ENABLED or ocr.pytesseract is None or not file_types.can_decode(file_part["mime_type"]):
+        return None
+
+    started = time.time()
+    ingredients, confidence = ocr.extract_ingredients_locally(file_part["data"])
+    elapsed_ms = (time.time() - started) * 1000
+    if ingredients and confidence >= LOCAL_OCR_MIN_CONFIDENCE:
+        with _ocr_stats_lock:
+            _ocr_stats["fast_path"] += 1
+        logger.info(f"Local OCR extracted {len(ingredients)} ingredients "
+                    f"(confidence {confidence:.2f}, {elapsed_ms:.0f}ms)")
+        return ingredients
+
+    with _ocr_stats_lock:
+        _ocr_stats["fallback"] += 1
+    logger.info(f"Local OCR confidence {confidence:.2f} below {LOCAL_OCR_MIN_CONFIDENCE}; using Gemini")
+    return None
+
+def get_upload_stats():
+    """Return counters for bytes uploaded to Gemini versus bytes saved by handle reuse."""
+    with _upload_stats_lock:
+        stats = dict(_upload_stats)
+    stats["cached_handles"] = len(_file_handles)
+    return stats
+
+def call_gemini_api(prompt, file_part, retries=3, model_name="gemini-1.5-flash", deadline=None,
+                    generation_config=None):
     """Handle Gemini API calls with error handling and retries.
     
+    Files up to INLINE_UPLOAD_MAX_BYTES are sent inline with the request;
+    larger ones are uploaded once through the File API and the handle reused.
+    Calls go through the shared rate limiter and circuit breaker, and retries
+    stop once the deadline would be exceeded.
+    
     Args:
         prompt (str): The prompt to send to the AI
-        file_path (str): Path to the file to analyze
+        file_part (dict): In-memory part from load_file_part, or None for a text-only prompt
         retries (int): Number of retry attempts
         model_name (str): Gemini model to use
+        deadline (resilience.Deadline): Time budget for all attempts (default: REQUEST_DEADLINE_SECONDS)
+        generation_config (dict): Generation settings such as a JSON response schema (optional)
         
     Returns:
         object: Gemini API response object or None if failed
     """
+    deadline = deadline or resilience.Deadline()
     for attempt in range(retries):
+        handle_digest = None
         try:
-            logger.info(f"Uploading file to Gemini API: {file_path}")
-            report_file = genai.upload_file(file_path)
-            if not report_file:
-                logger.error("Gemini file upload failed.")
-                time.sleep(2 ** attempt)
-                continue
+            with resilience.gemini_guard.slot(deadline):
+                if file_part is None:
+                    report_file = None
+                elif len(file_part["data"]) <= INLINE_UPLOAD_MAX_BYTES:
+                    logger.info(f"Sending {len(file_part['data'])} bytes inline ({file_part['mime_type']})")
+                    _record_upload_stat("bytes_inline", len(file_part["data"]))
+                    report_file = file_part
+                else:
+                    report_file, handle_digest = get_remote_file(file_part)
 
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content([report_file, prompt])
+                if file_part is not None and not report_file:
+                    logger.error("Gemini file upload failed.")
+                else:
+                    model = clients.get_model(model_name, generation_config)
+                    response = model.generate_content(
+                        [report_file, prompt] if report_file else [prompt],
+                        request_options={"timeout": deadline.remaining()}
+                    )
 
-            logger.info(f"Gemini API response received")
-            if response and hasattr(response, "candidates") and response.candidates:
-                return response
+                    logger.info(f"Gemini API response received")
+                    if response and hasattr(response, "candidates") and response.candidates:
+                        return response
 
-            logger.warning(f"AI returned no candidates. Attempt {attempt + 1} failed.")
+                    logger.warning(f"AI returned no candidates. Attempt {attempt + 1} failed.")
             
-        except (PermissionDenied, GoogleAPICallError) as e:
+        except resilience.GeminiUnavailableError as e:
+            logger.warning(f"Gemini call not attempted: {e}")
+            return None
+        except (PermissionDenied, NotFound) as e:
+            logger.error(f"Gemini API error: {e}")
+            if handle_digest:
+                # The remote file may have expired or been deleted; upload again next attempt
+                _file_handles.delete(handle_digest)
+        except GoogleAPICallError as e:
             logger.error(f"Gemini API error: {e}")
         except Exception as e:
             logger.error(f"Unexpected error in API call: {e}")
 
-        # Exponential backoff before retrying
+        if attempt == retries - 1:
+            break
+
+        # Exponential backoff before retrying, but never past the deadline
         wait_time = (2 ** attempt) + (attempt * 0.1)  # adding jitter
         logger.info(f"Waiting {wait_time:.2f}s before retry...")
-        time.sleep(wait_time)
+        if not deadline.sleep(wait_time):
+            logger.warning("Not enough time left before the deadline to retry")
+            break
 
     return None
 
-def clean_and_parse_json(raw_text):
-    """Cleans and parses JSON safely from AI response.
+def _balanced_spans(text, opener):
+    """Yield each outermost balanced span that starts with ``opener``, in one pass over ``text``.
+
+    Brackets inside JSON strings are ignored; a mismatched closer abandons the
+    current span and scanning resumes after it.
+    """
+    closers = {"{": "}", "[": "]"}
+    expected, start, in_string, escaped = [], None, False, False
+    for index, char in enumerate(text):
+        if start is None:
+            if char == opener:
+                start, expected = index, [closers[opener]]
+        elif in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in closers:
+            expected.append(closers[char])
+        elif char in "}]":
+            if char != expected.pop():
+                start = None
+            elif not expected:
+                yield text[start:index + 1]
+                start = None
+
+def parse_json_response(raw_text, expected_type):
+    """Parse the first JSON value of ``expected_type`` from a model reply.
+    
+    Replies produced in JSON response mode parse directly. Anything else
+    (code fences, leading prose) is scanned once for outermost balanced
+    '{...}' or '[...]' spans, and each span is decoded until one parses.
     
     Args:
-        raw_text (str): Raw text containing JSON
+        raw_text (str): Raw model reply
+        expected_type (type): dict or list
         
     Returns:
-        dict/list: Parsed JSON object or empty dict/list on failure
+        dict/list: Parsed JSON value, or an empty one of ``expected_type`` on failure
     """
-    # Check if empty
     if not raw_text or not raw_text.strip():
-        return {}
-        
-    # Try multiple approaches to extract valid JSON
-    try:
-        # First try: Direct parse
-        return json.loads(raw_text)
-    except json.JSONDecodeError:
-        pass
-        
-    try:
-        # Second try: Look for JSON in code blocks
-        json_pattern = r'```(?:json)?\s*([\s\S]*?)\s*```'
-        matches = re.findall(json_pattern, raw_text)
-        if matches:
-            return json.loads(matches[0].strip())
-    except json.JSONDecodeError:
-        pass
-        
-    try:
-        # Third try: Clean up common issues and retry
-        cleaned_text = re.sub(r"`json\n|\n`", "", raw_text).replace('"null"', 'null')
-        cleaned_text = re.sub(r",\s*}", "}", cleaned_text).replace(", ]", "]")
-        return json.loads(cleaned_text)
-    except json.JSONDecodeError:
-        pass
-        
+        return expected_type()
+
     try:
-        # Fourth try: More aggressive cleanup
-        text = raw_text.strip()
-        
-        # Find first { or [ and last } or ]
-        start_idx = min((text.find('{') if text.find('{') != -1 else float('inf')), 
-                         (text.find('[') if text.find('[') != -1 else float('inf')))
-        end_idx_brace = text.rfind('}')
-        end_idx_bracket = text.rfind(']')
-        end_idx = max(end_idx_brace, end_idx_bracket)
-        
-        if start_idx < float('inf') and end_idx != -1:
-            potential_json = text[start_idx:end_idx+1]
-            return json.loads(potential_json)
-    except (json.JSONDecodeError, ValueError):
+        value = json.loads(raw_text)
+        if isinstance(value, expected_type):
+            return value
+    except (json.JSONDecodeError, RecursionError):
         pass
-        
-    # Last resort: Return empty object based on context
+
+    for span in _balanced_spans(raw_text, "{" if expected_type is dict else "["):
+        try:
+            value = json.loads(span)
+        except (json.JSONDecodeError, RecursionError):
+            continue
+        if isinstance(value, expected_type):
+            return value
+
     logger.error(f"Failed to parse JSON: {raw_text[:100]}...")
-    return {} if '{' in raw_text else []
+    return expected_type()
 
-# --- Healthcare Data Extraction ---
-def extract_healthcare_data(file_storage_object):
-    """Extract healthcare data from an image or PDF file using AI.
-    
-    Args:
-        file_storage_object (BytesIO): File-like object containing healthcare report
-        
-    Returns:
-        dict: Extracted healthcare data as key-value pairs
-    """
-    temp_path = None
-    try:
-        logger.info("Processing healthcare report...")
-        temp_path = save_file_temporarily(file_storage_object)
+def _response_text(response):
+    """Join the text parts of the first candidate in a Gemini response."""
+    return "".join(part.text for part in response.candidates[0].content.parts if hasattr(part, "text"))
+
+def _drop_empty(value):
+    """Remove empty strings, lists and objects the schema made the model fill in."""
+    if isinstance(value, dict):
+        cleaned = {key: _drop_empty(item) for key, item in value.items()}
+        return {key: item for key, item in cleaned.items() if item not in ("", [], {}, None)}
+    if isinstance(value, list):
+        return [item for item in (_drop_empty(item) for item in value) if item not in ("", [], {}, None)]
+    return value.strip() if isinstance(value, str) else value
+
+def _json_generation_config(schema):
+    """Generation config for a JSON reply matching ``schema`` (None when disabled)."""
+    if not JSON_RESPONSE_MODE:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": schema}
 
+def _flatten_health_data(data):
+    """Turn the schema's other_metrics list back into top-level key-value pairs."""
+    data = _drop_empty(data)
+    for metric in data.pop("other_metrics", []):
+        name = re.sub(r"[^a-z0-9]+", "_", str(metric.get("name", "")).lower()).strip("_")
+        if name and metric.get("value") and name not in data:
+            data[name] = metric["value"]
+    return data
+
+# --- Healthcare Data Extraction ---
+def _extract_healthcare_part(file_part, deadline=None, report_text=None):
+    """Run one Gemini healthcare extraction over an in-memory file part or report text."""
+    if JSON_RESPONSE_MODE:
+        prompt = """
+        Extract structured healthcare data from this medical report.
+        Values keep their units, e.g. "120/80" or "100 mg/dL".
+        Put any other measured values in other_metrics.
+        Leave out fields that are not present in the document.
+        """
+    else:
         prompt = """
         Extract structured healthcare data from this medical report.
         Return a JSON object with key health metrics and conditions.
@@ -225,81 +647,196 @@ def extract_healthcare_data(file_storage_object):
         }
         Include only fields that are present in the document.
         """
+    if report_text:
+        prompt += f"\nReport text:\n{report_text}\n"
+    
+    response = call_gemini_api(
+        prompt, file_part, deadline=deadline,
+        generation_config=_json_generation_config(HEALTHCARE_DATA_SCHEMA)
+    )
+
+    if response and hasattr(response, "candidates") and response.candidates:
+        extracted_data = _flatten_health_data(parse_json_response(_response_text(response), dict))
         
-        response = call_gemini_api(prompt, temp_path)
+        if extracted_data and isinstance(extracted_data, dict):
+            return extracted_data
+        logger.warning("Extracted data is not a valid dictionary.")
+        return {}
 
-        if response and hasattr(response, "candidates") and response.candidates:
-            raw_text = "".join(part.text for part in response.candidates[0].content.parts if hasattr(part, "text"))
-            extracted_data = clean_and_parse_json(raw_text)
-            
-            if extracted_data and isinstance(extracted_data, dict):
-                logger.info("Healthcare data extraction successful.")
-                return extracted_data
-            else:
-                logger.warning("Extracted data is not a valid dictionary.")
-                return {}
-
-        logger.warning("No healthcare data found in AI response.")
+    logger.warning("No healthcare data found in AI response.")
+    return {}
+
+def get_text_layer_stats():
+    """Return how reports with a local text layer (digital PDFs, DOCX) were handled."""
+    with _text_layer_stats_lock:
+        stats = dict(_text_layer_stats)
+    stats["enabled"] = LOCAL_TEXT_EXTRACTION and pdf_pipeline.available()
+    return stats
+
+def _extract_healthcare_from_text_layer(data, deadline=None):
+    """Extract healthcare data from a digital PDF's embedded text.
+    
+    Returns:
+        dict: Extracted data ({} if no page has lab values), or None if the
+            PDF has no usable text layer
+    """
+    text = pdf_pipeline.text_layer(data)
+    if text is None or len(text) > LOCAL_TEXT_MAX_CHARS:
+        return None
+    return _extract_healthcare_from_text(text, deadline)
+
+def _extract_healthcare_from_text(text, deadline=None):
+    """Parse report text locally, or send it to Gemini as a text-only prompt."""
+    if not text.strip():
+        # Every page was filtered out (or the document is empty): nothing to ask the model about
+        logger.info("Report text has no lab values or clinical sections")
+        with _text_layer_stats_lock:
+            _text_layer_stats["no_findings"] += 1
         return {}
+    extracted_data, complete = lab_report.parse_lab_report(text, LAB_PARSER_MIN_FIELDS)
+    if complete:
+        logger.info(f"Lab report parsed locally ({len(text)} characters of text)")
+        with _text_layer_stats_lock:
+            _text_layer_stats["parsed_locally"] += 1
+        return extracted_data
+
+    logger.info(f"Sending {len(text)} characters of report text instead of the file")
+    with _text_layer_stats_lock:
+        _text_layer_stats["text_prompt"] += 1
+    compact_text = "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+    return _extract_healthcare_part(None, deadline, report_text=compact_text)
+
+def extract_healthcare_data(file_storage_object, deadline=None):
+    """Extract healthcare data from an image, PDF or DOCX file using AI.
+    
+    DOCX files and digital PDFs are read locally: known lab layouts are parsed without a model
+    call, anything else is sent as text. Scanned multi-page PDFs are split into
+    page groups; pages without lab values are skipped and the rest are
+    extracted in parallel and merged (see pdf_pipeline).
+    
+    Args:
+        file_storage_object (BytesIO): File-like object containing healthcare report
+        deadline (resilience.Deadline): Time budget for each model call
+        
+    Returns:
+        dict: Extracted healthcare data as key-value pairs
+    """
+    try:
+        logger.info("Processing healthcare report...")
+        file_part = preprocess_image(load_file_part(file_storage_object))
+
+        extracted_data = None
+        if file_part["mime_type"] == file_types.DOCX_MIME_TYPE:
+            # Gemini can't read DOCX files; their text is extracted locally instead
+            extracted_data = _extract_healthcare_from_text(
+                file_types.docx_text(file_part["data"])[:LOCAL_TEXT_MAX_CHARS], deadline
+            )
+        elif file_part["mime_type"] == "application/pdf" and LOCAL_TEXT_EXTRACTION:
+            extracted_data = _extract_healthcare_from_text_layer(file_part["data"], deadline)
+        if extracted_data is None and file_part["mime_type"] == "application/pdf":
+            extracted_data, _ = pdf_pipeline.extract_pages(
+                file_part["data"], lambda part: _extract_healthcare_part(part, deadline)
+            )
+        if extracted_data is None:
+            extracted_data = _extract_healthcare_part(file_part, deadline)
+
+        if extracted_data:
+            logger.info("Healthcare data extraction successful.")
+        return extracted_data
 
     except Exception as e:
         logger.error(f"Unexpected error in extract_healthcare_data: {e}", exc_info=True)
         return {}
-    finally:
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-                logger.info(f"Deleted temp file: {temp_path}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to delete temp file {temp_path}: {cleanup_error}")
 
 # --- Ingredient Extraction ---
-def extract_ingredients(file_storage_object):
+def _extract_ingredients_uncached(file_storage_object, digest=None, phash=None, deadline=None):
+    """Run local OCR or Gemini extraction and cache the result under ``digest``."""
+    file_part = load_file_part(file_storage_object)
+
+    label_text = None
+    if file_part["mime_type"] == file_types.DOCX_MIME_TYPE:
+        # Parse the document text locally; only unparseable text goes to Gemini
+        label_text = file_types.docx_text(file_part["data"])[:LOCAL_TEXT_MAX_CHARS]
+        if not label_text.strip():
+            logger.warning("DOCX file contains no text.")
+            return []
+        local_ingredients, score = ocr.parse_ingredient_list(label_text)
+        if score < LOCAL_OCR_MIN_CONFIDENCE:
+            local_ingredients = []
+        file_part = None
+    else:
+        local_ingredients = extract_ingredients_with_ocr(file_part)
+    if local_ingredients:
+        if digest:
+            cache_ingredients(local_ingredients, digest, phash)
+        return local_ingredients
+
+    if file_part is not None:
+        file_part = preprocess_image(file_part)
+
+    prompt = """
+    Extract all ingredients from this food product label or image.
+    Return a JSON array of ingredients, one per item.
+    Format example: ["sugar", "salt", "milk", "wheat flour", "preservatives"]
+    Be comprehensive and include all visible ingredients.
+    """
+    if label_text:
+        prompt += f"\nLabel text:\n{label_text}\n"
+    
+    response = call_gemini_api(
+        prompt, file_part, deadline=deadline,
+        generation_config=_json_generation_config(INGREDIENTS_SCHEMA)
+    )
+
+    if response and hasattr(response, "candidates") and response.candidates:
+        extracted_ingredients = _drop_empty(parse_json_response(_response_text(response), list))
+        
+        if extracted_ingredients and isinstance(extracted_ingredients, list):
+            logger.info(f"Successfully extracted {len(extracted_ingredients)} ingredients.")
+            if digest:
+                cache_ingredients(extracted_ingredients, digest, phash)
+            return extracted_ingredients
+        else:
+            logger.warning("Extracted data is not a valid ingredient list.")
+            return []
+
+    logger.warning("No ingredients found in AI response.")
+    return []
+
+def extract_ingredients(file_storage_object, use_cache=True, deadline=None):
     """Extract ingredients from an image file using AI.
     
     Args:
         file_storage_object (BytesIO): File-like object containing ingredient list image
+        use_cache (bool): Whether to consult the extraction cache (default: True)
+        deadline (resilience.Deadline): Time budget for the model call
         
     Returns:
         list: Extracted list of ingredients
     """
-    temp_path = None
     try:
         logger.info("Processing ingredient image...")
-        temp_path = save_file_temporarily(file_storage_object)
+        phash = None
+        if use_cache:
+            cached, digest, phash = get_cached_ingredients(file_storage_object)
+            if cached:
+                logger.info(f"Using cached ingredients for {digest[:8]}...")
+                return cached
+        else:
+            digest = content_hash(file_storage_object)
 
-        prompt = """
-        Extract all ingredients from this food product label or image.
-        Return a JSON array of ingredients, one per item.
-        Format example: ["sugar", "salt", "milk", "wheat flour", "preservatives"]
-        Be comprehensive and include all visible ingredients.
-        """
-        
-        response = call_gemini_api(prompt, temp_path)
+        # Concurrent requests for the same label wait on a single extraction
+        ingredients = _extraction_flight.do(
+            digest, _extract_ingredients_uncached,
+            file_storage_object, digest if use_cache else None, phash, deadline,
+            timeout=deadline.remaining() if deadline else None
+        )
+        return list(ingredients)
 
-        if response and hasattr(response, "candidates") and response.candidates:
-            raw_text = "".join(part.text for part in response.candidates[0].content.parts if hasattr(part, "text"))
-            extracted_ingredients = clean_and_parse_json(raw_text)
-            
-            if extracted_ingredients and isinstance(extracted_ingredients, list):
-                logger.info(f"Successfully extracted {len(extracted_ingredients)} ingredients.")
-                return extracted_ingredients
-            else:
-                logger.warning("Extracted data is not a valid ingredient list.")
-                return []
-
-        logger.warning("No ingredients found in AI response.")
+    except TimeoutError as e:
+        logger.warning(f"Ingredient extraction for {digest[:8]} gave up: {e}")
         return []
 
     except Exception as e:
         logger.error(f"Unexpected error in extract_ingredients: {e}", exc_info=True)
         return []
-    finally:
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-                logger.info(f"Deleted temp file: {temp_path}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to delete temp file {temp_path}: {cleanup_error}")
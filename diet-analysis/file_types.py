@@ -0,0 +1,130 @@
+import logging
+import zipfile
+from io import BytesIO
+from xml.etree import ElementTree
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:  # HEIC/HEIF photos are then sent to Gemini as-is
+    pillow_heif = None
+
+logger = logging.getLogger(__name__)
+
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+HEIF_MIME_TYPES = {"image/heic", "image/heif"}
+# Stop reading a DOCX after this much text (guards against compression bombs)
+DOCX_MAX_TEXT_CHARS = 200000
+
+_HEIC_BRANDS = {b"heic", b"heix", b"hevc", b"hevx"}
+_HEIF_BRANDS = {b"mif1", b"msf1", b"heim", b"heis"}
+_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Registered file types in match order: (MIME type, matcher)
+_file_types = []
+
+
+def register_file_type(mime_type, matcher):
+    """Accept a new upload type.
+
+    Args:
+        mime_type (str): MIME type reported for matching files
+        matcher (callable): Takes the file contents (bytes) and returns True on a match
+    """
+    _file_types.append((mime_type, matcher))
+
+
+def sniff(data):
+    """Detect the type of a file from its contents.
+
+    Args:
+        data (bytes): File contents (the first 2 KB is enough for everything but DOCX)
+
+    Returns:
+        str: Detected MIME type
+
+    Raises:
+        ValueError: If the file is not a supported type
+    """
+    for mime_type, matcher in _file_types:
+        if matcher(data):
+            return mime_type
+    raise ValueError("Unsupported file type. Upload a PDF, DOCX, JPEG, PNG, WebP or HEIC file.")
+
+
+def can_decode(mime_type):
+    """Whether Pillow can open images of this type (HEIC/HEIF needs pillow_heif)."""
+    return mime_type.startswith("image/") and (mime_type not in HEIF_MIME_TYPES or pillow_heif is not None)
+
+
+def _is_docx(data):
+    if data[:4] != b"PK\x03\x04":
+        return False
+    try:
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            return "word/document.xml" in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+def docx_text(data, max_chars=DOCX_MAX_TEXT_CHARS):
+    """Extract the text of a DOCX file without a model call.
+
+    word/document.xml is decompressed and parsed as a stream, and parsed
+    elements are released as soon as their paragraph is read. Table cells in
+    one row are joined with tabs so lab tables keep one test per line.
+
+    Args:
+        data (bytes): DOCX file contents
+        max_chars (int): Stop after this much text
+
+    Returns:
+        str: Document text, one paragraph or table row per line
+    """
+    lines, runs, cells = [], [], []
+    in_row = False
+    total = 0
+    with zipfile.ZipFile(BytesIO(data)) as archive, archive.open("word/document.xml") as stream:
+        for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == _WORD + "tr":
+                    in_row, cells = True, []
+                continue
+
+            if tag == _WORD + "t":
+                runs.append(element.text or "")
+            elif tag == _WORD + "tab":
+                runs.append("\t")
+            elif tag in (_WORD + "br", _WORD + "cr"):
+                runs.append("\n")
+            elif tag == _WORD + "p":
+                text = "".join(runs).strip()
+                runs = []
+                if in_row:
+                    cells.append(text)
+                elif text:
+                    lines.append(text)
+                    total += len(text)
+                element.clear()
+            elif tag == _WORD + "tr":
+                row = "\t".join(cell for cell in cells if cell)
+                if row:
+                    lines.append(row)
+                    total += len(row)
+                in_row = False
+                element.clear()
+
+            if total > max_chars:
+                logger.warning(f"DOCX text truncated at {max_chars} characters")
+                break
+    return "\n".join(lines)
+
+
+register_file_type("image/jpeg", lambda data: data[:3] == b"\xff\xd8\xff")
+register_file_type("image/png", lambda data: data[:8] == b"\x89PNG\r\n\x1a\n")
+register_file_type("image/webp", lambda data: data[:4] == b"RIFF" and data[8:12] == b"WEBP")
+register_file_type("image/heic", lambda data: data[4:8] == b"ftyp" and data[8:12] in _HEIC_BRANDS)
+register_file_type("image/heif", lambda data: data[4:8] == b"ftyp" and data[8:12] in _HEIF_BRANDS)
+register_file_type("application/pdf", lambda data: b"%PDF-" in data[:1024])
+register_file_type(DOCX_MIME_TYPE, _is_docx)
@@ -0,0 +1,121 @@
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Firestore accepts at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class WriteBehindBuffer:
+    """Buffer document writes and flush them with Firestore batch writes.
+
+    A background thread commits a batch whenever ``max_batch`` writes are
+    pending or ``flush_interval`` seconds have passed. Failed commits are
+    retried with exponential backoff; pending writes are drained when the
+    process exits. Document references are created by the caller, so their
+    ids are known before the write happens.
+
+    Args:
+        db: Firestore client
+        max_batch (int): Writes per batch commit (capped at 500)
+        flush_interval (float): Maximum seconds a write waits before flushing
+        max_retries (int): Commit attempts before a batch is dropped
+        max_pending (int): Pending writes allowed before callers write directly
+    """
+
+    def __init__(self, db, max_batch=FIRESTORE_BATCH_LIMIT, flush_interval=1.0, max_retries=5, max_pending=10000):
+        self.db = db
+        self.max_batch = min(max_batch, FIRESTORE_BATCH_LIMIT)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self._pending = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._stats = {"enqueued": 0, "written": 0, "direct": 0, "batches": 0, "retries": 0, "dropped": 0}
+
+        self._thread = threading.Thread(target=self._run, name="firestore-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, doc_ref, data):
+        """Schedule ``doc_ref.set(data)``; writes directly if the buffer is full or closed."""
+        with self._condition:
+            if not self._closed and len(self._pending) < self.max_pending:
+                self._pending.append((doc_ref, data))
+                self._stats["enqueued"] += 1
+                if len(self._pending) >= self.max_batch:
+                    self._condition.notify()
+                return
+
+        logger.warning(f"Write-behind buffer unavailable; writing {doc_ref.id} directly")
+        doc_ref.set(data)
+        with self._condition:
+            self._stats["direct"] += 1
+
+    def flush(self):
+        """Commit every pending write now."""
+        while True:
+            with self._condition:
+                writes = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            if not writes:
+                return
+            self._commit(writes)
+
+    def close(self):
+        """Stop the background thread and drain pending writes."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        # Wait out a commit that is still being retried, otherwise its batch dies with the process
+        self._thread.join()
+        self.flush()
+        logger.info(f"Write-behind buffer drained: {self.stats()}")
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.max_batch:
+                    self._condition.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def _commit(self, writes):
+        for attempt in range(self.max_retries):
+            try:
+                batch = self.db.batch()
+                for doc_ref, data in writes:
+                    batch.set(doc_ref, data)
+                batch.commit()
+                with self._condition:
+                    self._stats["batches"] += 1
+                    self._stats["written"] += len(writes)
+                return
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    logger.warning(f"Batch commit of {len(writes)} writes failed (attempt {attempt + 1}): {e}")
+                    break
+                wait_time = min(2 ** attempt * 0.5, 30)
+                logger.warning(f"Batch commit of {len(writes)} writes failed (attempt {attempt + 1}): {e}. "
+                               f"Retrying in {wait_time:.1f}s...")
+                with self._condition:
+                    self._stats["retries"] += 1
+                time.sleep(wait_time)
+
+        logger.error(f"Dropping {len(writes)} writes after {self.max_retries} attempts: "
+                     f"{[doc_ref.id for doc_ref, _ in writes]}")
+        with self._condition:
+            self._stats["dropped"] += len(writes)
@@ -0,0 +1,267 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import Counter
+
+import rules
+
+logger = logging.getLogger(__name__)
+
+# Bin metrics and canonicalize names so similar profiles share cache entries.
+# When disabled, signatures hash the whole (normalized) profile.
+PROFILE_BUCKETING = os.getenv("PROFILE_BUCKETING", "true").lower() == "true"
+
+# (upper bound exclusive, label) in ascending order; values at or above the
+# last bound get the final label. Units are mg/dL unless noted.
+METRIC_BINS = {
+    "blood_sugar": [(70, "low"), (100, "normal"), (126, "prediabetes"), (None, "diabetes")],
+    "hba1c": [(5.7, "normal"), (6.5, "prediabetes"), (None, "diabetes")],  # percent
+    "total": [(200, "desirable"), (240, "borderline"), (None, "high")],
+    "ldl": [(100, "optimal"), (130, "near optimal"), (160, "borderline"), (190, "high"), (None, "very high")],
+    "hdl": [(40, "low"), (60, "normal"), (None, "high")],
+    "triglycerides": [(150, "normal"), (200, "borderline"), (500, "high"), (None, "very high")],
+    "bmi": [(18.5, "underweight"), (25, "normal"), (30, "overweight"), (None, "obese")],
+    "egfr": [(15, "kidney failure"), (30, "severely decreased"), (60, "moderately decreased"),
+             (90, "mildly decreased"), (None, "normal")],  # mL/min/1.73m²
+    "creatinine": [(0.6, "low"), (1.3, "normal"), (2.0, "elevated"), (None, "high")],
+    "potassium": [(3.5, "low"), (5.1, "normal"), (6.0, "high"), (None, "very high")],  # mmol/L
+    "uric_acid": [(7.0, "normal"), (9.0, "high"), (None, "very high")],
+}
+# Top-level metrics binned by canonical_profile()
+PROFILE_METRICS = ("blood_sugar", "hba1c", "bmi", "egfr", "creatinine", "potassium", "uric_acid")
+
+# mmol/L -> mg/dL factors for values reported in SI units
+MMOL_FACTORS = {"blood_sugar": 18.0, "total": 38.67, "ldl": 38.67, "hdl": 38.67, "triglycerides": 88.57,
+                "uric_acid": 16.81}
+# µmol/L -> mg/dL factors
+UMOL_FACTORS = {"creatinine": 1 / 88.42, "uric_acid": 1 / 59.48}
+
+# Names the extraction's free-form metrics use for the fields above
+FIELD_ALIASES = {
+    "gfr": "egfr",
+    "estimated_gfr": "egfr",
+    "serum_creatinine": "creatinine",
+    "serum_potassium": "potassium",
+    "serum_uric_acid": "uric_acid",
+    "urate": "uric_acid",
+    "pregnant": "pregnancy",
+    "pregnancy_status": "pregnancy",
+    "breast_feeding": "breastfeeding",
+    "lactating": "breastfeeding",
+    "lactation": "breastfeeding",
+}
+# Yes/no states that change dietary advice; other unbinned fields (routine labs
+# such as hemoglobin or TSH, names, dates) are left out so signatures stay shared
+FLAG_FIELDS = ("pregnancy", "breastfeeding")
+_NEGATIVE = re.compile(r"^(?:no|not|none|negative|false|n/?a|0)\b")
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_BLOOD_PRESSURE = re.compile(r"(\d{2,3})\s*/\s*(\d{2,3})")
+
+
+def normalize_value(value):
+    """Canonicalize health data so equivalent profiles serialize identically."""
+    if isinstance(value, dict):
+        return {str(k).strip().lower(): normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        items = [normalize_value(v) for v in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    return value
+
+
+def _measurement(value, metric):
+    """Read a number from a reported value, converting SI units to mg/dL (HbA1c to percent)."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number, unit = float(value), ""
+    else:
+        match = _NUMBER.search(str(value))
+        if not match:
+            return None
+        number, unit = float(match.group()), str(value).lower()
+    if metric == "hba1c":
+        # IFCC units; a percentage never comes close to 20
+        if "mmol/mol" in unit or number >= 20:
+            number = number / 10.929 + 2.15
+    elif "mmol" in unit and metric in MMOL_FACTORS:
+        number *= MMOL_FACTORS[metric]
+    elif ("µmol" in unit or "umol" in unit) and metric in UMOL_FACTORS:
+        number *= UMOL_FACTORS[metric]
+    return number
+
+
+def bin_metric(metric, value):
+    """Map a reported value to its clinical range label, or None if unreadable."""
+    number = _measurement(value, metric)
+    if number is None:
+        return None
+    for bound, label in METRIC_BINS[metric]:
+        if bound is None or number < bound:
+            return label
+
+
+def bin_blood_pressure(value):
+    """Classify a "systolic/diastolic" reading using the ACC/AHA categories."""
+    match = _BLOOD_PRESSURE.search(str(value))
+    if not match:
+        return None
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if systolic > 180 or diastolic > 120:
+        return "crisis"
+    if systolic >= 140 or diastolic >= 90:
+        return "stage 2"
+    if systolic >= 130 or diastolic >= 80:
+        return "stage 1"
+    if systolic >= 120:
+        return "elevated"
+    return "normal"
+
+
+def _binned(metric, value):
+    """Clinical range label for a metric, or the value itself if it cannot be binned."""
+    return bin_metric(metric, value) or value
+
+
+def _flag(value):
+    """Reduce a yes/no field to True, or None when it is negative."""
+    if isinstance(value, str):
+        return None if _NEGATIVE.match(value) else True
+    return True if value else None
+
+
+def _canonical_names(values, canonicalize):
+    if isinstance(values, str):
+        values = re.split(r"[,;]", values)
+    elif not isinstance(values, (list, tuple, set)):
+        return []
+    names = {canonicalize(value) for value in values if isinstance(value, str) and value.strip()}
+    return sorted(name for name in names if name)
+
+
+def canonical_profile(healthcare_data):
+    """Reduce a profile to the fields that affect dietary analysis.
+
+    Metrics are replaced by their clinical range and condition, allergy and
+    medication names are canonicalized. A known metric whose value cannot
+    be read is kept as reported, pregnancy and breastfeeding become flags,
+    and everything else (names, dates, unrelated lab values) is dropped.
+
+    Args:
+        healthcare_data (dict): Profile in the extract_healthcare_data schema
+
+    Returns:
+        dict: Canonical profile; empty fields are omitted
+    """
+    fields = {}
+    for key, value in normalize_value(healthcare_data or {}).items():
+        if value not in (None, "", [], {}):
+            fields.setdefault(FIELD_ALIASES.get(key, key), value)
+    profile = {}
+
+    if "blood_pressure" in fields:
+        value = fields.pop("blood_pressure")
+        profile["blood_pressure"] = bin_blood_pressure(value) or value
+
+    for metric in PROFILE_METRICS:
+        if metric in fields:
+            profile[metric] = _binned(metric, fields.pop(metric))
+
+    cholesterol = fields.pop("cholesterol", None)
+    lipids = dict(cholesterol) if isinstance(cholesterol, dict) else ({"total": cholesterol} if cholesterol else {})
+    # The extraction schema reports triglycerides with the lipid panel; older profiles at the top level
+    triglycerides = lipids.pop("triglycerides", None) or fields.pop("triglycerides", None)
+    fields.pop("triglycerides", None)
+    if triglycerides:
+        profile["triglycerides"] = _binned("triglycerides", triglycerides)
+    lipids = {key: _binned(key, lipids[key]) for key in ("total", "ldl", "hdl") if lipids.get(key) not in (None, "")}
+    if lipids:
+        profile["cholesterol"] = lipids
+
+    for field, canonicalize in (("conditions", rules.canonical_condition),
+                                ("allergies", rules.canonical_allergy),
+                                ("medications", rules.canonical_medication)):
+        names = _canonical_names(fields.pop(field, None), canonicalize)
+        if names:
+            profile[field] = names
+
+    for field in FLAG_FIELDS:
+        if field in fields and _flag(fields[field]):
+            profile[field] = True
+    return profile
+
+
+def profile_signature(healthcare_data):
+    """Compact hash identifying a profile class; equal classes share cached analyses.
+
+    Uses canonical_profile() when PROFILE_BUCKETING is enabled, otherwise the
+    whole normalized profile.
+    """
+    profile = canonical_profile(healthcare_data) if PROFILE_BUCKETING else normalize_value(healthcare_data or {})
+    encoded = json.dumps(profile, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:32]
+
+
+def signature_report(profiles, top=10):
+    """Summarize how many distinct signatures cover a set of profiles.
+
+    Args:
+        profiles (iterable): Healthcare data dicts, one per user
+        top (int): Number of most common signatures to list
+
+    Returns:
+        dict: users, distinct signatures, signatures needed to cover 50/80/90/100%
+            of users, and the most common canonical profiles
+    """
+    counts = Counter()
+    examples = {}
+    for healthcare_data in profiles:
+        signature = profile_signature(healthcare_data)
+        counts[signature] += 1
+        examples.setdefault(signature, canonical_profile(healthcare_data))
+
+    users = sum(counts.values())
+    coverage = {}
+    covered = 0
+    ranked = counts.most_common()
+    targets = [50, 80, 90, 100]
+    for index, (_, count) in enumerate(ranked, start=1):
+        covered += count
+        while targets and covered * 100 >= targets[0] * users:
+            coverage[f"{targets.pop(0)}%"] = index
+
+    return {
+        "users": users,
+        "distinct_signatures": len(counts),
+        "signatures_for_coverage": coverage,
+        "top": [
+            {"signature": signature, "users": count, "profile": examples[signature]}
+            for signature, count in ranked[:top]
+        ],
+    }
+
+
+def _load_user_profiles(db):
+    for user_doc in db.collection("users").stream():
+        healthcare_data = (user_doc.to_dict() or {}).get("extracted_health_data")
+        if healthcare_data:
+            yield healthcare_data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report how many profile signatures cover the user base.")
+    parser.add_argument("--top", type=int, default=10, help="number of most common signatures to list")
+    args = parser.parse_args()
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    firebase_admin.initialize_app(credentials.Certificate(os.getenv("FIREBASE_PRIVATE_KEY_PATH")))
+    print(json.dumps(signature_report(_load_user_profiles(firestore.client()), top=args.top), indent=2))
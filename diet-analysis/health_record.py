@@ -0,0 +1,207 @@
+import copy
+import logging
+import threading
+
+from google.cloud import firestore
+
+import health_profile
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLLECTION = "health_history"
+# Lists a full report states completely; one it leaves out or empty means "none"
+REPORT_LIST_FIELDS = ("conditions", "allergies", "medications")
+
+
+def _same(old, new):
+    if isinstance(old, str) and isinstance(new, str):
+        return " ".join(old.split()).lower() == " ".join(new.split()).lower()
+    return old == new
+
+
+def _markers(items):
+    return {" ".join(str(item).split()).lower() for item in items}
+
+
+def _union(current, new):
+    merged = list(current)
+    seen = {" ".join(str(item).split()).lower() for item in current}
+    for item in new:
+        marker = " ".join(str(item).split()).lower()
+        if marker not in seen:
+            seen.add(marker)
+            merged.append(item)
+    return merged
+
+
+def diff_fields(current, update, prefix=(), replace_lists=False):
+    """Compute the per-field changes an incremental extraction makes to a record.
+
+    Nested maps are compared key by key, lists are unioned (a report that
+    doesn't mention a medication doesn't remove it) unless ``replace_lists``
+    is set, and other values replace the stored one. Empty values in
+    ``update`` are ignored, except that with ``replace_lists`` an empty list
+    clears a stored one.
+
+    Args:
+        current (dict): Stored healthcare data
+        update (dict): Newly extracted healthcare data
+        replace_lists (bool): The update lists every condition, allergy and
+            medication, so its lists replace the stored ones and items it
+            leaves out are removed
+
+    Returns:
+        dict: field path tuple -> (previous value, new value)
+    """
+    changes = {}
+    for key, value in (update or {}).items():
+        path = prefix + (key,)
+        old = current.get(key) if isinstance(current, dict) else None
+        if value in (None, "", [], {}) and not (replace_lists and value == [] and old):
+            continue
+        if isinstance(value, dict) and isinstance(old, dict):
+            changes.update(diff_fields(old, value, path, replace_lists))
+        elif isinstance(value, list) and isinstance(old, list):
+            merged = value if replace_lists else _union(old, value)
+            if _markers(merged) != _markers(old):
+                changes[path] = (old, merged)
+        elif not _same(old, value):
+            changes[path] = (old, value)
+    return changes
+
+
+def _nested(items):
+    """Build a nested dict from (path tuple, value) pairs."""
+    root = {}
+    for path, value in items:
+        node = root
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return root
+
+
+def _apply_changes(record, changes):
+    merged = copy.deepcopy(record or {})
+    for path, (_, new) in changes.items():
+        node = merged
+        for key in path[:-1]:
+            if not isinstance(node.get(key), dict):
+                node[key] = {}
+            node = node[key]
+        node[path[-1]] = new
+    return merged
+
+
+@firestore.transactional
+def _commit_update(transaction, doc_ref, update, source, replace_lists):
+    snapshot = doc_ref.get(transaction=transaction)
+    stored = (snapshot.to_dict() or {}) if snapshot.exists else {}
+    current = stored.get("extracted_health_data") or {}
+    version = stored.get("health_record_version", 0)
+
+    changes = diff_fields(current, update, replace_lists=replace_lists)
+    if not changes:
+        return current, current, {}, version
+
+    version += 1
+    meta = {"updated_at": firestore.SERVER_TIMESTAMP, "version": version, "source": source}
+    # merge=True writes only the listed leaves, so unchanged fields are never rewritten
+    transaction.set(doc_ref, {
+        "extracted_health_data": _nested((path, new) for path, (_, new) in changes.items()),
+        "health_record_meta": _nested((path, meta) for path in changes),
+        "health_record_version": version,
+    }, merge=True)
+
+    history = doc_ref.collection(HISTORY_COLLECTION)
+    for path, (old, new) in changes.items():
+        transaction.set(history.document(), {
+            "field": ".".join(path),
+            "value": new,
+            "previous": old,
+            "version": version,
+            "source": source,
+            "recorded_at": firestore.SERVER_TIMESTAMP,
+        })
+    return current, _apply_changes(current, changes), changes, version
+
+
+class HealthRecordStore:
+    """Versioned, per-field health records in users/{uid}.
+
+    Each extraction is merged into ``extracted_health_data`` field by field
+    inside a transaction. Only changed fields are written, each with an
+    update time and version under ``health_record_meta``, and every change is
+    appended to the users/{uid}/health_history subcollection for trends.
+
+    Args:
+        db: Firestore client
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._stats = {"updates": 0, "unchanged": 0, "fields_written": 0, "signature_changes": 0}
+
+    def apply(self, uid, update, source=None, replace_lists=False):
+        """Merge an incremental extraction into a user's record.
+
+        Args:
+            uid (str): User id
+            update (dict): Newly extracted healthcare data
+            source (str): Where the data came from (stored with each change)
+            replace_lists (bool): Replace stored lists with the update's instead
+                of adding to them, so items missing from a full report are removed;
+                conditions, allergies or medications it doesn't list are cleared
+
+        Returns:
+            dict: {"record": merged healthcare data, "changed": changed field
+                paths, "version": record version, "signature_changed": whether
+                the analysis-relevant profile changed}
+        """
+        if replace_lists:
+            # Extraction drops empty lists, so a field the full report leaves out has no entries
+            update = {**{field: [] for field in REPORT_LIST_FIELDS}, **update}
+        doc_ref = self.db.collection("users").document(uid)
+        current, merged, changes, version = _commit_update(
+            self.db.transaction(), doc_ref, update, source, replace_lists
+        )
+        signature_changed = bool(changes) and (
+            health_profile.profile_signature(current) != health_profile.profile_signature(merged)
+        )
+
+        with self._lock:
+            if changes:
+                self._stats["updates"] += 1
+                self._stats["fields_written"] += len(changes)
+                self._stats["signature_changes"] += int(signature_changed)
+            else:
+                self._stats["unchanged"] += 1
+
+        changed = sorted(".".join(path) for path in changes)
+        logger.info(f"Health record for UID {uid} at version {version}: {len(changed)} fields changed"
+                    f"{', profile signature changed' if signature_changed else ''}")
+        return {"record": merged, "changed": changed, "version": version, "signature_changed": signature_changed}
+
+    def history(self, uid, field, limit=100):
+        """Return recorded values of one field, newest first.
+
+        Needs a composite index on health_history (field ascending, recorded_at descending).
+        """
+        query = (self.db.collection("users").document(uid).collection(HISTORY_COLLECTION)
+                 .where("field", "==", field)
+                 .order_by("recorded_at", direction=firestore.Query.DESCENDING)
+                 .limit(limit))
+        return [
+            {
+                "value": entry.get("value"),
+                "previous": entry.get("previous"),
+                "version": entry.get("version"),
+                "recorded_at": entry["recorded_at"].isoformat() if entry.get("recorded_at") else None,
+            }
+            for entry in (doc.to_dict() for doc in query.stream())
+        ]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
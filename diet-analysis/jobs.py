@@ -0,0 +1,175 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+
+import requests
+
+import cache
+import clients
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """A unit of background work and its lifecycle timestamps."""
+
+    def __init__(self, uid, func, args, callback_url=None):
+        self.id = uuid.uuid4().hex
+        self.uid = uid
+        self.func = func
+        self.args = args
+        self.callback_url = callback_url
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def as_dict(self):
+        """Return a JSON-serializable view of the job for status responses."""
+        timing = {"created_at": self.created_at}
+        if self.started_at:
+            timing["started_at"] = self.started_at
+            timing["queue_wait_seconds"] = round(self.started_at - self.created_at, 3)
+        if self.finished_at:
+            timing["finished_at"] = self.finished_at
+            timing["run_seconds"] = round(self.finished_at - self.started_at, 3)
+
+        data = {"job_id": self.id, "status": self.status, "timing": timing}
+        if self.status == "succeeded":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """Bounded queue served by a fixed pool of worker threads.
+
+    Submissions beyond ``max_queue_size`` waiting jobs are rejected with
+    ``QueueFullError`` so callers can apply backpressure. Job status is written
+    to ``store`` on every state change, so with a shared store (the "sqlite"
+    cache backend) any worker process on the host can answer a status poll.
+
+    Args:
+        num_workers (int): Number of worker threads
+        max_queue_size (int): Maximum number of jobs waiting to start
+        store: Cache for job status records (default: a per-process MemoryCache)
+        max_retained (int): Number of jobs kept for status lookups when no store is given
+        retention (float): Seconds a job's status is kept when no store is given
+        callback_timeout (float): Timeout in seconds for completion callbacks
+    """
+
+    def __init__(self, num_workers=4, max_queue_size=100, store=None, max_retained=1000, retention=3600,
+                 callback_timeout=10):
+        self.num_workers = num_workers
+        self.callback_timeout = callback_timeout
+        if store is None:
+            store = cache.MemoryCache(max_entries=max_retained, default_ttl=retention)
+        self.store = store
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+
+    def submit(self, uid, func, *args, callback_url=None):
+        """Queue ``func(*args)`` for background execution.
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        job = Job(uid, func, args, callback_url)
+        self._save(job)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.store.delete(job.id)
+            raise QueueFullError("Job queue is full. Please retry later.")
+        logger.info(f"Queued job {job.id} for UID: {uid}")
+        return job
+
+    def get(self, job_id):
+        """Return a job's status record ({"uid", "job_id", "status", ...}) or None."""
+        return self.store.get(job_id)
+
+    def _save(self, job):
+        self.store.set(job.id, {"uid": job.uid, **job.as_dict()})
+
+    def stats(self):
+        """Return queue depth, worker utilisation and average job timings."""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "workers": self.num_workers,
+                "running": self._running,
+                "queued": self._queue.qsize(),
+                "max_queue_size": self._queue.maxsize,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_queue_wait_seconds": round(self._total_wait / finished, 3) if finished else 0.0,
+                "avg_run_seconds": round(self._total_run / finished, 3) if finished else 0.0,
+            }
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.time()
+            job.status = "running"
+            with self._lock:
+                self._running += 1
+            self._save(job)
+            try:
+                job.result = job.func(*job.args)
+                job.status = "succeeded"
+            except ValueError as e:
+                job.error = str(e)
+                job.status = "failed"
+            except Exception:
+                logger.exception(f"Job {job.id} failed")
+                job.error = "An unexpected error occurred."
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                self._record_finished(job)
+                self._save(job)
+                self._queue.task_done()
+
+            logger.info(f"Job {job.id} {job.status} in {job.finished_at - job.started_at:.2f}s "
+                        f"(waited {job.started_at - job.created_at:.2f}s)")
+            if job.callback_url:
+                self._send_callback(job)
+
+    def _record_finished(self, job):
+        with self._lock:
+            self._running -= 1
+            if job.status == "succeeded":
+                self._completed += 1
+            else:
+                self._failed += 1
+            self._total_wait += job.started_at - job.created_at
+            self._total_run += job.finished_at - job.started_at
+
+    def _send_callback(self, job):
+        try:
+            # Redirects are not followed, so results only go to the allow-listed host
+            clients.get_session("callbacks").post(job.callback_url, json=job.as_dict(),
+                                                  timeout=self.callback_timeout, allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Callback for job {job.id} failed: {e}")
@@ -0,0 +1,127 @@
+import re
+
+# Analytes the parser recognizes, checked in order so "HDL Cholesterol" is
+# not read as total cholesterol. Each maps to a (section, field) in the
+# extract_healthcare_data schema and the units it may be reported in, the
+# first being the default when no unit is printed.
+_CONCENTRATION_UNITS = ("mg/dL", "mmol/L")
+ANALYTES = [
+    ("hba1c", None, re.compile(r"\b(?:hba1c|hb\s*a1c|a1c|glyc(?:at)?ed\s+ha?emoglobin)\b"), ("%",)),
+    ("cholesterol", "hdl", re.compile(r"\bhdl(?:[\s-]*c\b|[\s-]+cholesterol\b)?"), _CONCENTRATION_UNITS),
+    ("cholesterol", "ldl", re.compile(r"\bldl(?:[\s-]*c\b|[\s-]+cholesterol\b)?"), _CONCENTRATION_UNITS),
+    ("cholesterol", "triglycerides", re.compile(r"\b(?:triglycerides?|tg)\b"), _CONCENTRATION_UNITS),
+    ("cholesterol", "total", re.compile(r"\b(?:total\s+cholesterol|cholesterol(?:,\s*|\s+)total|cholesterol)\b"),
+     _CONCENTRATION_UNITS),
+    ("blood_sugar", None, re.compile(
+        r"\b(?:fasting\s+(?:blood\s+|plasma\s+)?(?:glucose|sugar)|(?:blood|plasma|serum)?\s*glucose"
+        r"(?:\s*[,(-]?\s*fasting\)?)?|blood\s+sugar|fbs|fpg)\b"
+    ), _CONCENTRATION_UNITS),
+    ("bmi", None, re.compile(r"\b(?:bmi|body\s+mass\s+index)\b"), ("", "kg/m2")),
+    ("egfr", None, re.compile(r"\b(?:e-?gfr|estimated\s+glomerular\s+filtration\s+rate)\b"), ("mL/min/1.73m2",)),
+    ("creatinine", None, re.compile(r"\b(?:serum\s+)?creatinine\b"), ("mg/dL", "µmol/L")),
+    ("potassium", None, re.compile(r"\b(?:serum\s+)?potassium\b|^\s*k\b\+?"), ("mmol/L", "mEq/L")),
+    ("uric_acid", None, re.compile(r"\b(?:serum\s+)?(?:uric\s+acid|urate)\b"), ("mg/dL", "µmol/L")),
+]
+# Any number followed by a unit ("13.5 g/dL", "2.1 µIU/mL", "140 mEq/L");
+# a line like this that no analyte claims means the parse is partial
+_LAB_VALUE_LINE = re.compile(r"\d(?:\.\d+)?\s*(?:%|[a-zµ][a-zµ0-9.²]*/[a-zµ0-9.²/]+)", re.IGNORECASE)
+
+# A value after the analyte name: up to 40 non-digit characters (method,
+# specimen, colons, dots), then the number and the word after it, which is
+# the unit if it looks like one.
+_VALUE = re.compile(
+    r"[^\d\n]{0,40}?(\d+(?:\.\d+)?)\s*\(?([a-zµ%][^\s)]*)?",
+    re.IGNORECASE
+)
+_UNIT_LIKE = re.compile(r"[/%²]|mol")
+# Reference ranges ("70-110", "< 200") and their labels, removed before reading the value
+_REFERENCE = re.compile(
+    r"\b(?:biological\s+)?(?:ref(?:erence)?|normal)\.?(?:\s+(?:range|interval|value)s?)?\b\s*:?"
+    r"|[<>≤≥]\s*=?\s*\d+(?:\.\d+)?|\d+(?:\.\d+)?\s*[-–]\s*\d+(?:\.\d+)?",
+    re.IGNORECASE
+)
+_BLOOD_PRESSURE = re.compile(
+    r"\b(?:blood\s+pressure|bp)\b[^\d\n]{0,20}(\d{2,3}\s*/\s*\d{2,3})", re.IGNORECASE
+)
+# Narrative sections whose content (conditions, allergies, medications) needs the model
+NARRATIVE_SECTIONS = re.compile(
+    r"\b(diagnos\w*|allerg\w*|medications?|current\s+medicines|prescri\w*|impression|"
+    r"(?:clinical|medical|past)\s+history|known\s+conditions?|co-?morbidit\w*)\b",
+    re.IGNORECASE
+)
+
+# Derived values and non-fasting glucose that would be misread as a base analyte
+_SKIP_LINE = re.compile(
+    r"\b(?:ratio|non[\s-]?hdl|vldl|pp|post[\s-]?prandial|random|eag|average\s+glucose"
+    r"|mean\s+(?:blood\s+|plasma\s+)?glucose)\b"
+)
+
+_UNITS = {
+    "mg/dl": "mg/dL", "mmol/l": "mmol/L", "µmol/l": "µmol/L", "umol/l": "µmol/L", "meq/l": "mEq/L",
+    "%": "%", "kg/m2": "kg/m2", "kg/m²": "kg/m2",
+    "ml/min/1.73m2": "mL/min/1.73m2", "ml/min/1.73m²": "mL/min/1.73m2", "ml/min": "mL/min/1.73m2",
+}
+
+
+def _reading_unit(word, units):
+    """Unit of a reading, the default if none is printed, or None if it is not one of ``units``."""
+    word = (word or "").rstrip(".,;:")
+    if word in _UNITS:
+        unit = _UNITS[word]
+        return unit if unit in units else None
+    if _UNIT_LIKE.search(word):
+        return None
+    return units[0]
+
+
+def parse_lab_report(text, min_fields=2):
+    """Fill the healthcare schema from the text of a tabular lab report.
+
+    Each line is matched against known analyte names; the first value found
+    for an analyte wins. Reference ranges are skipped, and a value printed
+    in a unit the analyte isn't expected in is ignored. The result is only
+    complete when every line carrying a lab value was read; reports with
+    other tests or narrative sections (diagnoses, allergies, medications)
+    are flagged as incomplete, since those need the model.
+
+    Args:
+        text (str): Text layer of the report
+        min_fields (int): Analytes required before the result counts as complete
+
+    Returns:
+        tuple: (healthcare data dict, complete flag)
+    """
+    data = {}
+    found = 0
+    unread = 0
+    for line in text.splitlines():
+        lowered = line.lower()
+        if _SKIP_LINE.search(lowered):
+            continue
+        read = False
+        for section, field, pattern, units in ANALYTES:
+            match = pattern.search(lowered)
+            if not match:
+                continue
+            value = _VALUE.match(_REFERENCE.sub(" ", lowered[match.end():]))
+            unit = _reading_unit(value.group(2), units) if value else None
+            if unit is not None:
+                reading = f"{value.group(1)}{unit}" if unit == "%" else f"{value.group(1)} {unit}".strip()
+                target = data.setdefault(section, {}) if field else data
+                key = field or section
+                if key not in target:
+                    target[key] = reading
+                    found += 1
+                read = True
+            # One analyte per line; tables put each test on its own row
+            break
+        if not read and _LAB_VALUE_LINE.search(lowered):
+            unread += 1
+
+    blood_pressure = _BLOOD_PRESSURE.search(text)
+    if blood_pressure:
+        data["blood_pressure"] = re.sub(r"\s+", "", blood_pressure.group(1))
+        found += 1
+
+    complete = found >= min_fields and not unread and not NARRATIVE_SECTIONS.search(text)
+    return data, complete
@@ -0,0 +1,143 @@
+import logging
+import re
+from io import BytesIO
+
+try:
+    import pytesseract
+    from PIL import Image, ImageOps
+except ImportError:  # Local OCR is optional; callers fall back to Gemini
+    pytesseract = None
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Start of the ingredient list on a label ("Ingredients:", "INGREDIENTS -")
+INGREDIENTS_HEADER = re.compile(r"\bingredients?\s*[:\-]", re.IGNORECASE)
+# Sections that usually follow the ingredient list (only outside brackets)
+SECTION_END = re.compile(
+    r"\b(allergen\w*|contains|may contain|nutrition\w*|storage|store in|best before|"
+    r"manufactured|mfd|packed|net (?:wt|weight|qty)|mrp)\b",
+    re.IGNORECASE
+)
+# Allergen statements also appear inside the list ("chocolate (contains milk)"),
+# so they only end it when they start a new sentence or line
+ALLERGEN_STATEMENT = re.compile(r"^(?:allergen\w*|contains|may contain)$", re.IGNORECASE)
+# Applied to the score when the list looks cut off (no closing full stop, unbalanced brackets)
+TRUNCATED_PENALTY = 0.5
+PERCENTAGE = re.compile(r"\d+(?:[.,]\d+)?\s*%")
+E_NUMBER = re.compile(r"\b(?:e|ins)\s*-?\s*\d{3,4}[a-z]?(?:\s*\([iv]+\))?\b", re.IGNORECASE)
+SEPARATORS = re.compile(r"[,;()\[\]]")
+
+
+def parse_ingredient_list(text):
+    """Deterministically parse an ingredient list out of label text.
+
+    The text after an "Ingredients:" header is cut at the next known section
+    outside brackets, split on commas, semicolons and brackets, and stripped
+    of percentages and E-number/INS annotations. Lists that look cut off score
+    lower.
+
+    Args:
+        text (str): OCR text of a food label
+
+    Returns:
+        tuple: (list of ingredient names, parse score between 0 and 1)
+    """
+    header = INGREDIENTS_HEADER.search(text or "")
+    if not header:
+        return [], 0.0
+
+    body = text[header.end():]
+    end = _find_section_end(body)
+    if end is not None:
+        body = body[:end]
+    body = " ".join(body.split())
+
+    ingredients = []
+    for token in SEPARATORS.split(body):
+        token = E_NUMBER.sub("", PERCENTAGE.sub("", token))
+        token = re.sub(r"^\s*(?:and|&|contains|may contain)\s+", "", token, flags=re.IGNORECASE)
+        token = " ".join(token.split()).strip(" .:*-").lower()
+        if token and token not in ingredients:
+            ingredients.append(token)
+
+    if not ingredients:
+        return [], 0.0
+
+    # Real ingredient names are short and mostly letters; OCR noise is not
+    plausible = [
+        item for item in ingredients
+        if len(item.split()) <= 5 and sum(c.isalpha() for c in item) >= 0.8 * len(item.replace(" ", ""))
+    ]
+    score = len(plausible) / len(ingredients)
+    if _bracket_depth(body) != 0 or not (body.endswith(".") or end is not None):
+        score *= TRUNCATED_PENALTY
+    return ingredients, score
+
+
+def _bracket_depth(text):
+    return text.count("(") + text.count("[") - text.count(")") - text.count("]")
+
+
+def _find_section_end(body):
+    """Return where the ingredient list in ``body`` ends, or None if no section follows it."""
+    for match in SECTION_END.finditer(body):
+        before = body[:match.start()]
+        if _bracket_depth(before) > 0:
+            continue
+        sentence_start = not before.strip() or before.rstrip(" \t")[-1:] in (".", "\n")
+        if ALLERGEN_STATEMENT.match(match.group(1)) and not sentence_start:
+            continue
+        return match.start()
+    return None
+
+
+def read_text(image_bytes):
+    """Run offline OCR over an image.
+
+    Args:
+        image_bytes (bytes): Encoded image
+
+    Returns:
+        tuple: (text with one OCR line per line, mean word confidence between 0 and 1)
+    """
+    if pytesseract is None:
+        return "", 0.0
+
+    try:
+        with Image.open(BytesIO(image_bytes)) as img:
+            gray = ImageOps.autocontrast(ImageOps.exif_transpose(img).convert("L"))
+            data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        logger.warning(f"Local OCR failed: {e}")
+        return "", 0.0
+
+    lines, confidences = {}, []
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        conf = float(data["conf"][i])
+        if conf >= 0:
+            confidences.append(conf)
+
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    return text, (sum(confidences) / len(confidences) / 100 if confidences else 0.0)
+
+
+def extract_ingredients_locally(image_bytes):
+    """Run offline OCR over a label image and parse its ingredient list.
+
+    Args:
+        image_bytes (bytes): Encoded label image
+
+    Returns:
+        tuple: (list of ingredients, confidence between 0 and 1)
+    """
+    text, ocr_score = read_text(image_bytes)
+    ingredients, parse_score = parse_ingredient_list(text)
+    if not ingredients or not ocr_score:
+        return [], 0.0
+    return ingredients, round(ocr_score * parse_score, 3)
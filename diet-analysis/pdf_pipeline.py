@@ -0,0 +1,196 @@
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # Without pypdf, PDFs are sent to the model whole
+    PdfReader = None
+    PdfWriter = None
+
+logger = logging.getLogger(__name__)
+
+# PDFs with fewer pages than this are sent whole
+PDF_SPLIT_MIN_PAGES = int(os.getenv("PDF_SPLIT_MIN_PAGES", "4"))
+# Pages sent to the model per extraction call
+PDF_PAGES_PER_GROUP = int(os.getenv("PDF_PAGES_PER_GROUP", "2"))
+# Page groups extracted concurrently (Gemini-wide limits still apply)
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", "4"))
+# Pages with less text than this are probably scanned images and are always kept
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "200"))
+# Share of pages that need a text layer for a PDF to count as digital rather than scanned
+PDF_TEXT_LAYER_MIN_RATIO = float(os.getenv("PDF_TEXT_LAYER_MIN_RATIO", "0.8"))
+
+# A measured value with a unit ("5.6 mmol/L", "120/80 mmHg", "6.1 %")
+LAB_VALUE = re.compile(
+    r"\d+(?:[.,]\d+)?\s*(?:mg/dl|mmol/l|g/dl|g/l|u/l|iu/l|ng/ml|pg/ml|µg/l|ug/l|meq/l|"
+    r"mm\s?hg|kg/m2|kg/m²|%|x\s?10)",
+    re.IGNORECASE
+)
+# Sections that carry conditions, allergies or medications rather than lab values
+CLINICAL_TERMS = re.compile(
+    r"\b(diagnos\w*|allerg\w*|medication\w*|prescri\w*|impression|history|condition\w*|blood pressure)\b",
+    re.IGNORECASE
+)
+
+_executor = ThreadPoolExecutor(max_workers=PDF_MAX_WORKERS, thread_name_prefix="pdf")
+_stats_lock = threading.Lock()
+_stats = {"documents": 0, "pages": 0, "pages_skipped": 0, "groups": 0, "seconds": 0.0}
+
+
+def available():
+    return PdfReader is not None
+
+
+def page_has_findings(text):
+    """Cheap local check for whether a page is worth sending to the model.
+
+    Pages without a usable text layer are kept, since they can't be judged.
+    """
+    if len(text.strip()) < PDF_MIN_TEXT_CHARS:
+        return True
+    return bool(LAB_VALUE.search(text) or CLINICAL_TERMS.search(text))
+
+
+def _page_text(page):
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        logger.warning(f"Could not read PDF text layer: {e}")
+        return ""
+
+
+def text_layer(data):
+    """Return the embedded text of a digital PDF, or None if it looks scanned.
+
+    Pages without lab values or clinical sections are left out.
+    """
+    if not available():
+        return None
+    try:
+        texts = [_page_text(page) for page in PdfReader(BytesIO(data)).pages]
+    except Exception as e:
+        logger.warning(f"Could not read PDF: {e}")
+        return None
+
+    with_text = sum(1 for text in texts if len(text.strip()) >= PDF_MIN_TEXT_CHARS)
+    if not texts or with_text < PDF_TEXT_LAYER_MIN_RATIO * len(texts):
+        return None
+    return "\n\n".join(text for text in texts if page_has_findings(text))
+
+
+def _write_pages(reader, page_numbers):
+    writer = PdfWriter()
+    for number in page_numbers:
+        writer.add_page(reader.pages[number])
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def merge_partials(partials):
+    """Merge partial extraction results in page order.
+
+    Later values win, lists are unioned (case-insensitively, first spelling
+    kept) and nested dicts are merged key by key.
+    """
+    merged = {}
+    for partial in partials:
+        for key, value in (partial or {}).items():
+            current = merged.get(key)
+            if isinstance(value, dict) and isinstance(current, dict):
+                merged[key] = merge_partials([current, value])
+            elif isinstance(value, list) and isinstance(current, list):
+                union = list(current)
+                seen = {str(item).strip().lower() for item in current}
+                for item in value:
+                    marker = str(item).strip().lower()
+                    if marker not in seen:
+                        seen.add(marker)
+                        union.append(item)
+                merged[key] = union
+            elif value not in (None, "", [], {}):
+                merged[key] = value
+    return merged
+
+
+def extract_pages(data, extract_part):
+    """Extract a multi-page PDF page group by page group and merge the results.
+
+    Args:
+        data (bytes): PDF file contents
+        extract_part (callable): Takes a {"mime_type", "data"} part and returns
+            the extracted dict for it
+
+    Returns:
+        tuple: (merged dict, timing report), or (None, None) if the PDF should
+            be sent whole (pypdf missing, unreadable, or too short)
+    """
+    if not available():
+        return None, None
+
+    started = time.perf_counter()
+    try:
+        reader = PdfReader(BytesIO(data))
+        page_count = len(reader.pages)
+    except Exception as e:
+        logger.warning(f"Could not split PDF, sending it whole: {e}")
+        return None, None
+    if page_count < PDF_SPLIT_MIN_PAGES:
+        return None, None
+
+    kept = [number for number in range(page_count) if page_has_findings(_page_text(reader.pages[number]))]
+    groups = [kept[i:i + PDF_PAGES_PER_GROUP] for i in range(0, len(kept), PDF_PAGES_PER_GROUP)]
+    logger.info(f"PDF split: {page_count} pages, {page_count - len(kept)} skipped, {len(groups)} groups")
+
+    # PdfReader isn't thread-safe, so the group documents are written up front
+    parts = [{"mime_type": "application/pdf", "data": _write_pages(reader, page_numbers)} for page_numbers in groups]
+
+    def run_group(page_numbers, part):
+        group_started = time.perf_counter()
+        try:
+            result = extract_part(part)
+        except Exception as e:
+            logger.error(f"Extraction failed for PDF pages {[n + 1 for n in page_numbers]}: {e}")
+            result = {}
+        return result, time.perf_counter() - group_started
+
+    # map() keeps page order, so later pages win when the partial results are merged
+    results = list(_executor.map(run_group, groups, parts))
+    merged = merge_partials(result for result, _ in results)
+    total_seconds = time.perf_counter() - started
+
+    report = {
+        "pages": page_count,
+        "pages_skipped": page_count - len(kept),
+        "groups": [
+            {"pages": [n + 1 for n in page_numbers], "seconds": round(seconds, 3), "fields": len(result)}
+            for page_numbers, (result, seconds) in zip(groups, results)
+        ],
+        "seconds": round(total_seconds, 3),
+    }
+    logger.info(f"PDF extraction finished in {total_seconds:.2f}s: " + ", ".join(
+        f"pages {group['pages']} {group['seconds']:.2f}s" for group in report["groups"]
+    ))
+
+    with _stats_lock:
+        _stats["documents"] += 1
+        _stats["pages"] += page_count
+        _stats["pages_skipped"] += page_count - len(kept)
+        _stats["groups"] += len(groups)
+        _stats["seconds"] += total_seconds
+    return merged, report
+
+
+def get_stats():
+    """Return page counts and timings for split PDF extractions."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["enabled"] = available()
+    stats["seconds"] = round(stats["seconds"], 3)
+    stats["avg_seconds"] = round(stats["seconds"] / stats["documents"], 3) if stats["documents"] else 0.0
+    return stats
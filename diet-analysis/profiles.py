@@ -0,0 +1,118 @@
+import logging
+import threading
+
+import cache
+
+logger = logging.getLogger(__name__)
+
+USER_NOT_FOUND = "User data not found. Please upload healthcare report first."
+HEALTH_DATA_NOT_FOUND = "Healthcare data not found. Please upload healthcare report first."
+
+
+class ProfileStore:
+    """Read-through cache of users' extracted_health_data.
+
+    Works with any client exposing Firestore's collection().document() API,
+    so the Firestore emulator or an in-memory stand-in can be used in tests.
+    Only users that have health data are cached; a missing profile is
+    looked up again on the next request.
+
+    Args:
+        db: Firestore client
+        ttl (float): Seconds a cached profile with a snapshot listener is trusted
+        unwatched_ttl (float): Seconds a cached profile without a listener is
+            trusted; this bounds how long another worker's update goes unseen
+        max_entries (int): Maximum number of cached profiles
+        max_bytes (int): Approximate memory budget for cached profiles
+        use_listeners (bool): Attach a snapshot listener to cached user
+            documents so changes made by other workers replace the entry
+        max_listeners (int): Listeners kept open at once; each is a separate
+            Firestore stream, so this stays far below ``max_entries``
+    """
+
+    def __init__(self, db, ttl=600, unwatched_ttl=60, max_entries=10000, max_bytes=16 * 1024 * 1024,
+                 use_listeners=False, max_listeners=100):
+        self.db = db
+        self.unwatched_ttl = unwatched_ttl
+        self.use_listeners = use_listeners
+        self.max_listeners = max_listeners
+        self._cache = cache.MemoryCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            default_ttl=ttl,
+            on_remove=self._stop_listener if use_listeners else None
+        )
+        self._listeners = {}
+        self._listener_lock = threading.Lock()
+
+    def _document(self, uid):
+        return self.db.collection("users").document(uid)
+
+    def get(self, uid):
+        """Return a user's healthcare data, reading Firestore only on a miss.
+
+        Returns:
+            tuple: (healthcare data or None, error message or None)
+        """
+        healthcare_data = self._cache.get(uid)
+        if healthcare_data is not None:
+            return healthcare_data, None
+
+        user_doc = self._document(uid).get()
+        if not user_doc.exists:
+            return None, USER_NOT_FOUND
+
+        healthcare_data = (user_doc.to_dict() or {}).get("extracted_health_data")
+        if not healthcare_data:
+            return None, HEALTH_DATA_NOT_FOUND
+
+        self._cache_profile(uid, healthcare_data)
+        return healthcare_data, None
+
+    def refresh(self, uid, healthcare_data):
+        """Replace the cached copy with a record already saved to Firestore."""
+        self._cache_profile(uid, healthcare_data)
+
+    def stats(self):
+        stats = self._cache.stats.as_dict()
+        stats["entries"] = len(self._cache)
+        stats["listeners"] = len(self._listeners)
+        return stats
+
+    def _cache_profile(self, uid, healthcare_data):
+        watched = self._start_listener(uid)
+        self._cache.set(uid, healthcare_data, ttl=None if watched else self.unwatched_ttl)
+
+    def _start_listener(self, uid):
+        """Attach a snapshot listener for ``uid`` if there is room; returns whether one is attached."""
+        if not self.use_listeners:
+            return False
+        with self._listener_lock:
+            if uid in self._listeners:
+                return True
+            if len(self._listeners) >= self.max_listeners:
+                return False
+            try:
+                self._listeners[uid] = self._document(uid).on_snapshot(
+                    lambda snapshots, changes, read_time: self._on_snapshot(uid, snapshots)
+                )
+                return True
+            except Exception as e:
+                logger.warning(f"Could not attach profile listener for UID {uid}: {e}")
+                return False
+
+    def _on_snapshot(self, uid, snapshots):
+        for snapshot in snapshots:
+            data = snapshot.to_dict() if snapshot.exists else None
+            healthcare_data = (data or {}).get("extracted_health_data")
+            if healthcare_data:
+                self._cache.set(uid, healthcare_data)
+            else:
+                self._cache.delete(uid)
+
+    def _stop_listener(self, uid):
+        with self._listener_lock:
+            watch = self._listeners.pop(uid, None)
+        if watch is not None:
+            # Unsubscribing from inside a snapshot callback can block, so do it off-thread
+            threading.Thread(target=watch.unsubscribe, daemon=True).start()
@@ -0,0 +1,272 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Outbound Gemini call limits shared by every request in the process
+GEMINI_RATE_PER_SECOND = float(os.getenv("GEMINI_RATE_PER_SECOND", "10"))
+GEMINI_RATE_BURST = int(os.getenv("GEMINI_RATE_BURST", "20"))
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "16"))
+GEMINI_MIN_IN_FLIGHT = int(os.getenv("GEMINI_MIN_IN_FLIGHT", "1"))
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+# Default time budget for a model call including retries (should stay below client timeouts)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+
+
+class GeminiUnavailableError(Exception):
+    """Raised when a Gemini call is refused locally instead of being attempted."""
+
+
+class CircuitOpenError(GeminiUnavailableError):
+    """Raised while the circuit breaker is open."""
+
+
+class RateLimitedError(GeminiUnavailableError):
+    """Raised when no call slot frees up before the deadline."""
+
+
+class Deadline:
+    """A point in time after which a request's work is no longer useful."""
+
+    def __init__(self, seconds=None):
+        self.expires_at = time.monotonic() + (REQUEST_DEADLINE_SECONDS if seconds is None else seconds)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def sleep(self, seconds, reserve=1.0):
+        """Sleep for ``seconds`` if enough time would remain afterwards.
+
+        Returns:
+            bool: False (without sleeping) if the sleep would leave less than
+                ``reserve`` seconds for the next attempt
+        """
+        if self.remaining() - seconds < reserve:
+            return False
+        time.sleep(seconds)
+        return True
+
+
+class TokenBucket:
+    """Token-bucket rate limiter.
+
+    Args:
+        rate (float): Tokens added per second
+        burst (int): Bucket capacity
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """Take one token, waiting up to ``timeout`` seconds. Returns False on timeout."""
+        give_up_at = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > give_up_at:
+                return False
+            time.sleep(wait)
+
+    @property
+    def tokens(self):
+        with self._lock:
+            return round(self._tokens, 2)
+
+
+class AIMDLimiter:
+    """Concurrency limit that adapts with additive increase / multiplicative decrease.
+
+    Every successful call raises the limit by ``1 / limit`` (about +1 per
+    window of calls); a throttled call multiplies it by ``decrease``.
+
+    Args:
+        initial (int): Starting in-flight limit
+        minimum (int): Lower bound for the limit
+        maximum (int): Upper bound for the limit
+        decrease (float): Factor applied on throttling
+    """
+
+    def __init__(self, initial, minimum=1, maximum=64, decrease=0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout):
+        """Wait up to ``timeout`` seconds for an in-flight slot. Returns False on timeout."""
+        give_up_at = time.monotonic() + timeout
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self._in_flight += 1
+            return True
+
+    def release(self, throttled=False):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._limit = max(self.minimum, self._limit * self.decrease)
+                logger.warning(f"Gemini throttled; in-flight limit lowered to {int(self._limit)}")
+            else:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {"limit": int(self._limit), "in_flight": self._in_flight}
+
+
+class CircuitBreaker:
+    """Stop calling a failing dependency for a while.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds, then lets a single trial call
+    through (half-open). A successful trial closes it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = "half_open"
+                self._trial_in_flight = False
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != "closed":
+                logger.info("Gemini circuit breaker closed")
+            self._state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    logger.error(f"Gemini circuit breaker opened after {self._failures} failures")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give back a half-open trial that was granted but never used."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+
+def _is_throttle(error):
+    return getattr(error, "code", None) == 429 or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+def _is_outage(error):
+    code = getattr(error, "code", None)
+    return _is_throttle(error) or (isinstance(code, int) and code >= 500) or isinstance(error, TimeoutError) \
+        or type(error).__name__ in ("DeadlineExceeded", "ServiceUnavailable", "InternalServerError")
+
+
+class GeminiGuard:
+    """Rate limiter, adaptive concurrency limit and circuit breaker for model calls."""
+
+    def __init__(self, rate, burst, max_in_flight, min_in_flight, breaker_failures, breaker_reset):
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AIMDLimiter(max_in_flight, minimum=min_in_flight, maximum=max_in_flight)
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset)
+        self._rejections = {"circuit_open": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+
+    def _reject(self, reason, error):
+        with self._lock:
+            self._rejections[reason] += 1
+        raise error
+
+    @contextmanager
+    def slot(self, deadline=None):
+        """Hold permission for one outbound call.
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            RateLimitedError: If no token or in-flight slot frees up before the deadline
+        """
+        if not self.breaker.allow():
+            self._reject("circuit_open", CircuitOpenError("Gemini circuit breaker is open"))
+        timeout = deadline.remaining() if deadline else REQUEST_DEADLINE_SECONDS
+        if not self.bucket.acquire(timeout):
+            self.breaker.release_trial()
+            self._reject("rate_limited", RateLimitedError("Gemini rate limit reached"))
+        if not self.limiter.acquire(deadline.remaining() if deadline else timeout):
+            self.breaker.release_trial()
+            self._reject("rate_limited", RateLimitedError("Gemini concurrency limit reached"))
+
+        failure = None
+        try:
+            yield
+        except Exception as e:
+            failure = e
+            raise
+        finally:
+            # Also runs when a streaming caller closes its generator mid-call
+            self.limiter.release(throttled=failure is not None and _is_throttle(failure))
+            if failure is not None and _is_outage(failure):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            rejections = dict(self._rejections)
+        return {
+            "circuit": self.breaker.state,
+            "tokens": self.bucket.tokens,
+            **self.limiter.stats(),
+            "rejections": rejections,
+        }
+
+
+# Shared by extraction and dietician analysis
+gemini_guard = GeminiGuard(
+    GEMINI_RATE_PER_SECOND, GEMINI_RATE_BURST,
+    GEMINI_MAX_IN_FLIGHT, GEMINI_MIN_IN_FLIGHT,
+    GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_SECONDS
+)
@@ -0,0 +1,441 @@
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# --- Ingredient Risk Table ---
+# Canonical ingredient term -> risk tags. Terms with no tags are known to be
+# harmless for every rule below, so they count as resolved.
+INGREDIENT_TAGS = {
+    # Sugars and refined carbohydrates
+    "sugar": {"added_sugar"},
+    "glucose": {"added_sugar"},
+    "glucose syrup": {"added_sugar"},
+    "corn syrup": {"added_sugar"},
+    "high fructose corn syrup": {"added_sugar", "fructose"},
+    "fructose": {"added_sugar", "fructose"},
+    "dextrose": {"added_sugar"},
+    "sucrose": {"added_sugar"},
+    "invert syrup": {"added_sugar"},
+    "honey": {"added_sugar"},
+    "jaggery": {"added_sugar"},
+    "maltodextrin": {"high_gi"},
+    "refined wheat flour": {"high_gi", "gluten", "wheat"},
+    # Sodium
+    "salt": {"sodium"},
+    "monosodium glutamate": {"sodium"},
+    "sodium bicarbonate": {"sodium"},
+    "sodium benzoate": {"sodium"},
+    "soy sauce": {"sodium", "soy", "tyramine", "gluten", "wheat"},
+    # Fats
+    "palm oil": {"saturated_fat"},
+    "palmolein": {"saturated_fat"},
+    "coconut oil": {"saturated_fat"},
+    "ghee": {"saturated_fat", "milk"},
+    # Nut, seed and cocoa butters are matched before plain (dairy) butter
+    "peanut butter": {"peanut"},
+    "almond butter": {"tree_nut"},
+    "cashew butter": {"tree_nut"},
+    "sesame butter": {"sesame"},
+    "cocoa butter": {"saturated_fat"},
+    "shea butter": {"saturated_fat"},
+    "butter": {"saturated_fat", "milk", "lactose"},
+    "cream": {"saturated_fat", "milk", "lactose"},
+    "hydrogenated vegetable oil": {"trans_fat", "saturated_fat"},
+    "partially hydrogenated oil": {"trans_fat", "saturated_fat"},
+    "shortening": {"trans_fat", "saturated_fat"},
+    # Allergens
+    "peanut": {"peanut"},
+    "almond": {"tree_nut"},
+    "cashew": {"tree_nut"},
+    "walnut": {"tree_nut"},
+    "pistachio": {"tree_nut"},
+    "hazelnut": {"tree_nut"},
+    "pecan": {"tree_nut"},
+    "milk": {"milk", "lactose"},
+    "milk solid": {"milk", "lactose"},
+    "whey": {"milk", "lactose"},
+    "casein": {"milk"},
+    "cheese": {"milk", "lactose", "saturated_fat"},
+    "aged cheese": {"milk", "tyramine", "saturated_fat"},
+    "lactose": {"milk", "lactose"},
+    "egg": {"egg"},
+    "soy": {"soy"},
+    "soy lecithin": {"soy"},
+    "soybean oil": {"soy"},
+    "wheat": {"gluten", "wheat"},
+    "wheat flour": {"gluten", "wheat", "high_gi"},
+    "semolina": {"gluten", "wheat"},
+    "barley": {"gluten"},
+    "rye": {"gluten"},
+    "malt extract": {"gluten", "added_sugar"},
+    "shrimp": {"shellfish"},
+    "crab": {"shellfish"},
+    "lobster": {"shellfish"},
+    "fish": {"fish"},
+    "anchovy": {"fish"},
+    "tuna": {"fish"},
+    "sesame": {"sesame"},
+    "mustard": {"mustard"},
+    # Drug interactions
+    "grapefruit": {"grapefruit"},
+    "spinach": {"vitamin_k"},
+    "kale": {"vitamin_k"},
+    "yeast extract": {"tyramine", "sodium"},
+    "potassium chloride": {"potassium"},
+    "alcohol": {"alcohol"},
+    "caffeine": {"caffeine"},
+    # Common ingredients with no rule-relevant risk
+    "water": set(),
+    "gram flour": set(),
+    "rice flour": set(),
+    "rice": set(),
+    "oat": set(),
+    "spice": set(),
+    "condiment": set(),
+    "turmeric": set(),
+    "black pepper": set(),
+    "chilli": set(),
+    "clove": set(),
+    "cumin": set(),
+    "ginger": set(),
+    "garlic": set(),
+    "onion": set(),
+    "tomato": set(),
+    "citric acid": set(),
+    "acidity regulator": set(),
+    "antioxidant": set(),
+    "emulsifier": set(),
+    "vinegar": set(),
+    "cocoa": {"caffeine"},
+    "sunflower oil": set(),
+    "olive oil": set(),
+    "vegetable oil": set(),
+    "edible vegetable oil": set(),
+}
+
+# Alternative spellings and regional names -> canonical term
+INGREDIENT_ALIASES = {
+    "sodium chloride": "salt",
+    "iodised salt": "salt",
+    "iodized salt": "salt",
+    "rock salt": "salt",
+    "msg": "monosodium glutamate",
+    "baking soda": "sodium bicarbonate",
+    "groundnut": "peanut",
+    "peanut oil": "peanut",
+    "groundnut oil": "peanut",
+    "arachis oil": "peanut",
+    "maida": "refined wheat flour",
+    "atta": "wheat flour",
+    "sooji": "semolina",
+    "rava": "semolina",
+    "besan": "gram flour",
+    "soya": "soy",
+    "soya lecithin": "soy lecithin",
+    "soybean": "soy",
+    "prawn": "shrimp",
+    "til": "sesame",
+    "vanaspati": "hydrogenated vegetable oil",
+    "hydrogenated fat": "hydrogenated vegetable oil",
+    "hfcs": "high fructose corn syrup",
+    "cane sugar": "sugar",
+    "brown sugar": "sugar",
+    "icing sugar": "sugar",
+    "milk powder": "milk solid",
+    "skimmed milk powder": "milk solid",
+    "ethanol": "alcohol",
+    "coffee": "caffeine",
+}
+
+# --- Profile Vocabulary ---
+CONDITION_ALIASES = {
+    "type 2 diabetes": "diabetes",
+    "type 1 diabetes": "diabetes",
+    "diabetes mellitus": "diabetes",
+    "t2dm": "diabetes",
+    "prediabetes": "diabetes",
+    "high blood sugar": "diabetes",
+    "high blood pressure": "hypertension",
+    "htn": "hypertension",
+    "hypercholesterolemia": "high cholesterol",
+    "hyperlipidemia": "high cholesterol",
+    "dyslipidemia": "high cholesterol",
+    "cardiovascular disease": "heart disease",
+    "coronary artery disease": "heart disease",
+    "cad": "heart disease",
+    "celiac": "celiac disease",
+    "coeliac disease": "celiac disease",
+    "gluten intolerance": "celiac disease",
+    "lactose intolerant": "lactose intolerance",
+    "chronic kidney disease": "kidney disease",
+    "ckd": "kidney disease",
+}
+
+ALLERGY_TAGS = {
+    "peanut": {"peanut"},
+    "tree nut": {"tree_nut"},
+    "nut": {"peanut", "tree_nut"},
+    "shellfish": {"shellfish"},
+    "fish": {"fish"},
+    "milk": {"milk"},
+    "dairy": {"milk"},
+    "lactose": {"lactose"},
+    "egg": {"egg"},
+    "soy": {"soy"},
+    "wheat": {"wheat"},
+    "gluten": {"gluten"},
+    "sesame": {"sesame"},
+    "mustard": {"mustard"},
+}
+
+# Condition -> {risk tag: (severity, reason)}
+CONDITION_RULES = {
+    "diabetes": {
+        "added_sugar": ("high", "Added sugars raise blood glucose quickly."),
+        "high_gi": ("medium", "Refined carbohydrates have a high glycaemic index."),
+    },
+    "hypertension": {
+        "sodium": ("high", "Sodium raises blood pressure."),
+    },
+    "high cholesterol": {
+        "trans_fat": ("high", "Trans fats raise LDL and lower HDL cholesterol."),
+        "saturated_fat": ("medium", "Saturated fats raise LDL cholesterol."),
+    },
+    "heart disease": {
+        "trans_fat": ("high", "Trans fats increase cardiovascular risk."),
+        "saturated_fat": ("medium", "Saturated fats increase cardiovascular risk."),
+        "sodium": ("medium", "High sodium intake strains the heart."),
+    },
+    "celiac disease": {
+        "gluten": ("high", "Gluten triggers an immune reaction in celiac disease."),
+    },
+    "lactose intolerance": {
+        "lactose": ("medium", "Lactose may cause digestive symptoms."),
+    },
+    "kidney disease": {
+        "sodium": ("high", "Sodium must be restricted in kidney disease."),
+        "potassium": ("high", "Potassium additives can build up with reduced kidney function."),
+    },
+    "gout": {
+        "alcohol": ("high", "Alcohol raises uric acid levels."),
+        "fructose": ("medium", "Fructose raises uric acid levels."),
+    },
+    "obesity": {
+        "added_sugar": ("medium", "Added sugars contribute excess calories."),
+        "trans_fat": ("medium", "Trans fats are energy dense and harmful."),
+    },
+}
+
+# Medication (generic name) -> {risk tag: (severity, reason)}
+_STATIN_RULE = {"grapefruit": ("high", "Grapefruit raises statin levels in the blood.")}
+_ACE_RULE = {"potassium": ("medium", "Potassium salt substitutes can cause high potassium with this medication.")}
+_MAOI_RULE = {"tyramine": ("high", "Tyramine-rich foods can cause a dangerous blood pressure spike with MAO inhibitors.")}
+MEDICATION_RULES = {
+    "warfarin": {"vitamin_k": ("medium", "Vitamin K counteracts warfarin; keep intake consistent.")},
+    "atorvastatin": _STATIN_RULE,
+    "simvastatin": _STATIN_RULE,
+    "lovastatin": _STATIN_RULE,
+    "lisinopril": _ACE_RULE,
+    "enalapril": _ACE_RULE,
+    "ramipril": _ACE_RULE,
+    "losartan": _ACE_RULE,
+    "phenelzine": _MAOI_RULE,
+    "tranylcypromine": _MAOI_RULE,
+    "selegiline": _MAOI_RULE,
+    "metformin": {"alcohol": ("medium", "Alcohol increases the risk of lactic acidosis with metformin.")},
+}
+
+# Words around an allergy name ("Allergy to peanuts", "Peanuts (severe)")
+ALLERGY_QUALIFIERS = {"allergy", "allergies", "allergic", "to", "severe", "mild", "moderate", "known"}
+# Dosage forms written before or after a medication name ("Tab. Atorvastatin 10 mg")
+DOSAGE_FORMS = {"tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules", "inj", "injection",
+                "syp", "syrup", "susp", "suspension", "oral", "sr", "er", "xr", "mg", "mcg", "ml", "g", "iu"}
+# Words that negate an ingredient term ("sugar-free", "no added sugar")
+NEGATIONS_BEFORE = {"no", "without", "zero"}
+NEGATIONS_AFTER = {"free"}
+
+SEVERITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+_MAX_TERM_WORDS = max(len(term.split()) for term in list(INGREDIENT_TAGS) + list(INGREDIENT_ALIASES))
+
+
+# --- Normalization ---
+def normalize_term(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", str(text).lower()).split())
+
+def _singular(word):
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def canonical_condition(name):
+    term = normalize_term(name)
+    return CONDITION_ALIASES.get(term, term)
+
+def canonical_allergy(name):
+    words = [word for word in normalize_term(name).split() if word not in ALLERGY_QUALIFIERS]
+    return " ".join(_singular(word) for word in words)
+
+def canonical_medication(name):
+    # Drop doses and forms ("Tab. Metformin 500 mg" -> "metformin")
+    words = [word for word in normalize_term(name).split() if word not in DOSAGE_FORMS and not word[0].isdigit()]
+    return words[0] if words else ""
+
+def _table_term(words):
+    """Canonical risk-table term for a phrase, trying it as written and singularized."""
+    for phrase in (" ".join(words), " ".join(_singular(word) for word in words)):
+        term = INGREDIENT_ALIASES.get(phrase, phrase)
+        if term in INGREDIENT_TAGS:
+            return term
+    return None
+
+def lookup_ingredient(ingredient):
+    """Resolve an ingredient against the risk table.
+
+    Phrases of the ingredient are looked up longest first (with aliases and
+    simple singularization), so "Edible Vegetable Oil (Palmolein)" resolves
+    through "palmolein" and "Roasted Peanuts" through "peanut". Words that are
+    part of a longer match are not matched again, so "Peanut Butter" is not
+    also dairy butter, and negated terms ("sugar-free") are skipped.
+
+    Returns:
+        tuple: (set of matched canonical terms, set of risk tags)
+    """
+    words = normalize_term(ingredient).split()
+    covered = [False] * len(words)
+    matched, tags = set(), set()
+    for size in range(min(_MAX_TERM_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            end = start + size
+            if any(covered[start:end]):
+                continue
+            term = _table_term(words[start:end])
+            if term is None:
+                continue
+            covered[start:end] = [True] * size
+            if set(words[max(0, start - 2):start]) & NEGATIONS_BEFORE or set(words[end:end + 1]) & NEGATIONS_AFTER:
+                continue
+            matched.add(term)
+            tags |= INGREDIENT_TAGS[term]
+    return matched, tags
+
+
+# --- Rule Evaluation ---
+def _as_list(value):
+    if isinstance(value, str):
+        return [item for item in re.split(r"[,;]", value) if item.strip()]
+    if isinstance(value, (list, tuple, set)):
+        return [item for item in value if isinstance(item, str) and item.strip()]
+    return []
+
+def evaluate(healthcare_data, ingredients):
+    """Evaluate allergy, condition and medication rules for a product.
+
+    Args:
+        healthcare_data (dict): Profile in the extract_healthcare_data schema
+        ingredients (list): Ingredient names
+
+    Returns:
+        dict: {"warnings": [...], "resolved": [...], "unresolved": [...]} where
+            each warning has ingredient, trigger, source, severity and reason.
+            An ingredient is resolved only when one table entry covers its
+            whole name; "Rice wine" still gets the tags of "rice" but stays
+            unresolved.
+    """
+    healthcare_data = healthcare_data or {}
+    allergies = [canonical_allergy(a) for a in _as_list(healthcare_data.get("allergies"))]
+    conditions = [canonical_condition(c) for c in _as_list(healthcare_data.get("conditions"))]
+    medications = [canonical_medication(m) for m in _as_list(healthcare_data.get("medications"))]
+
+    warnings, resolved, unresolved = [], [], []
+    for ingredient in ingredients:
+        _, tags = lookup_ingredient(ingredient)
+        normalized = normalize_term(ingredient)
+        (resolved if _table_term(normalized.split()) else unresolved).append(ingredient)
+
+        for allergy in allergies:
+            allergy_tags = ALLERGY_TAGS.get(allergy, set())
+            # Unknown allergens match when the allergen name appears in the ingredient
+            if (allergy_tags & tags) or (not allergy_tags and allergy and re.search(rf"\b{re.escape(allergy)}", normalized)):
+                warnings.append({
+                    "ingredient": ingredient, "trigger": allergy, "source": "allergy",
+                    "severity": "high", "reason": f"Contains {allergy}, which is listed as an allergy."
+                })
+
+        for source, names, table in (("condition", conditions, CONDITION_RULES),
+                                     ("medication", medications, MEDICATION_RULES)):
+            for name in names:
+                for tag, (severity, reason) in table.get(name, {}).items():
+                    if tag in tags:
+                        warnings.append({
+                            "ingredient": ingredient, "trigger": name, "source": source,
+                            "severity": severity, "reason": reason
+                        })
+
+    warnings.sort(key=lambda w: SEVERITY_ORDER[w["severity"]])
+    return {"warnings": warnings, "resolved": resolved, "unresolved": unresolved}
+
+def _warnings_by_ingredient(rule_result):
+    by_ingredient = {}
+    for warning in rule_result["warnings"]:
+        by_ingredient.setdefault(warning["ingredient"], []).append(warning)
+    return by_ingredient
+
+def _effect(found):
+    return "Unsafe" if found and found[0]["severity"] == "high" else "Caution" if found else "Safe"
+
+def ingredient_verdicts(rule_result, ingredients):
+    """Per-ingredient verdicts in the dietician's structured output format.
+
+    Returns:
+        dict: ingredient -> {"name", "effect", "reason", "risk_tags"} where
+            effect is "safe", "caution" or "unsafe"
+    """
+    by_ingredient = _warnings_by_ingredient(rule_result)
+    verdicts = {}
+    for name in ingredients:
+        found = by_ingredient.get(name, [])
+        verdicts[name] = {
+            "name": name,
+            "effect": _effect(found).lower(),
+            "reason": " ".join(w["reason"] for w in found) if found else "No known conflict with your health profile.",
+            "risk_tags": sorted({w["trigger"] for w in found}),
+        }
+    return verdicts
+
+def render_markdown(rule_result, ingredients):
+    """Render a rule-only analysis in the same sections the dietician prompt uses."""
+    by_ingredient = _warnings_by_ingredient(rule_result)
+
+    unsafe = [name for name in ingredients if name in by_ingredient]
+    lines = ["1. **Summary:** "]
+    if unsafe:
+        lines[0] += (f"{len(unsafe)} of {len(ingredients)} ingredients conflict with your health profile: "
+                     f"{', '.join(unsafe)}.")
+    else:
+        lines[0] += "No ingredients conflict with your listed conditions, allergies or medications."
+
+    lines.append("\n2. **Ingredient Analysis:**")
+    for name in ingredients:
+        found = by_ingredient.get(name)
+        effect = _effect(found)
+        reason = " ".join(w["reason"] for w in found) if found else "No known conflict with your health profile."
+        lines.append(f"   - **Name:** {name}\n     **Effect:** {effect}\n     **Reason:** {reason}")
+
+    lines.append("\n3. **Warnings:**")
+    if rule_result["warnings"]:
+        for w in rule_result["warnings"]:
+            lines.append(f"   - {w['ingredient']} ({w['source']}: {w['trigger']}, {w['severity']} risk): {w['reason']}")
+    else:
+        lines.append("   - None.")
+
+    lines.append("\n4. **Recommendations:**")
+    if unsafe:
+        lines.append(f"   - Avoid or strictly limit this product because of: {', '.join(unsafe)}.")
+        lines.append("   - Look for alternatives without these ingredients and check labels for hidden sources.")
+    else:
+        lines.append("   - Suitable in normal portions as part of a balanced diet.")
+    return "\n".join(lines)
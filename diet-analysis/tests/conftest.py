@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The service modules are flat siblings of app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# extract and dietician configure the Gemini client at import; tests never call it
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+import cache
+
+
+def _slow(release, result=None, error=None):
+    def func():
+        release.wait(2)
+        if error:
+            raise error
+        return result
+    return func
+
+
+def _start_follower(flight, key, outcome, timeout=None):
+    def follow():
+        try:
+            outcome["result"] = flight.do(key, lambda: "follower ran", timeout=timeout)
+        except Exception as e:
+            outcome["error"] = e
+    thread = threading.Thread(target=follow)
+    thread.start()
+    return thread
+
+
+def _wait_for_follower(flight):
+    for _ in range(200):
+        if flight.stats()["collapsed"]:
+            return
+        time.sleep(0.005)
+
+
+def test_follower_gets_the_leaders_result():
+    flight, release, outcome = cache.SingleFlight(), threading.Event(), {}
+    leader = threading.Thread(target=lambda: outcome.setdefault("leader", flight.do("k", _slow(release, "done"))))
+    leader.start()
+    time.sleep(0.02)
+    follower = _start_follower(flight, "k", outcome)
+    _wait_for_follower(flight)
+    release.set()
+    leader.join()
+    follower.join()
+    assert outcome == {"leader": "done", "result": "done"}
+    assert flight.stats() == {"executed": 1, "collapsed": 1, "timeouts": 0, "in_flight": 0}
+
+
+def test_follower_gets_the_leaders_error():
+    flight, release, outcome = cache.SingleFlight(), threading.Event(), {}
+    leader = threading.Thread(target=lambda: pytest.raises(ValueError, flight.do, "k", _slow(release, error=ValueError("bad"))))
+    leader.start()
+    time.sleep(0.02)
+    follower = _start_follower(flight, "k", outcome)
+    _wait_for_follower(flight)
+    release.set()
+    leader.join()
+    follower.join()
+    assert isinstance(outcome["error"], ValueError)
+
+
+def test_follower_times_out_without_affecting_the_leader():
+    flight, release, outcome = cache.SingleFlight(), threading.Event(), {}
+    leader = threading.Thread(target=lambda: outcome.setdefault("leader", flight.do("k", _slow(release, "done"))))
+    leader.start()
+    time.sleep(0.02)
+    started = time.monotonic()
+    _start_follower(flight, "k", outcome, timeout=0.05).join()
+    assert isinstance(outcome["error"], TimeoutError)
+    assert time.monotonic() - started < 1
+    release.set()
+    leader.join()
+    assert outcome["leader"] == "done"
+    assert flight.stats()["timeouts"] == 1
+
+
+def test_calls_after_completion_run_again():
+    flight = cache.SingleFlight()
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+    assert flight.stats()["executed"] == 2
+
+
+def test_memory_cache_never_returns_expired_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    memory = cache.MemoryCache(default_ttl=10)
+    memory.set("long", "kept", ttl=100)
+    memory.set("short", "stale")
+    now[0] += 20
+    memory.set("new", "value")
+    # "short" sits behind a live entry, so the write leaves it for the next read
+    assert len(memory) == 3
+    assert memory.get("short") is None
+    assert memory.get("long") == "kept"
+    assert len(memory) == 2
+
+
+def test_memory_cache_write_drops_expired_entries_at_the_lru_end(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    memory = cache.MemoryCache(default_ttl=10)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    now[0] += 20
+    memory.set("c", 3)
+    assert len(memory) == 1
+    assert memory.stats.as_dict()["evictions"] == 2
+
+
+def test_memory_cache_evicts_least_recently_used_over_budget():
+    memory = cache.MemoryCache(max_entries=2)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    memory.get("a")
+    memory.set("c", 3)
+    assert memory.get("b") is None
+    assert memory.get("a") == 1 and memory.get("c") == 3
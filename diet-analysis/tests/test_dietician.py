@@ -0,0 +1,48 @@
+import time
+from types import SimpleNamespace
+
+import dietician
+
+
+def _verdict(name, effect):
+    return {"name": name, "effect": effect, "reason": "", "risk_tags": []}
+
+
+def test_unassessed_ingredients_are_not_reported_suitable():
+    summary = dietician._summarize_verdicts([_verdict("sugar", "unknown"), _verdict("salt", "unknown")])
+    assert "suitable" not in summary
+    assert "2 of 2 ingredients could not be assessed (sugar, salt)" in summary
+
+
+def test_unknown_ingredients_are_listed_next_to_warnings():
+    summary = dietician._summarize_verdicts([_verdict("sugar", "unsafe"), _verdict("e471", "unknown"),
+                                             _verdict("water", "safe")])
+    assert "1 of 3 ingredients need attention (unsafe: sugar)" in summary
+    assert "could not be assessed (e471)" in summary
+
+
+def test_all_safe_verdicts_are_suitable():
+    summary = dietician._summarize_verdicts([_verdict("water", "safe"), _verdict("oat", "safe")])
+    assert summary == "All 2 ingredients are suitable for your health profile."
+
+
+def _chunk(text):
+    part = SimpleNamespace(text=text)
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+def test_stream_releases_the_gemini_slot_before_the_client_reads(monkeypatch):
+    model = SimpleNamespace(generate_content=lambda contents, stream, request_options: iter(
+        [_chunk("**Summary:** fine. "), _chunk("**Warnings:** none.")]
+    ))
+    monkeypatch.setattr(dietician.clients, "get_model", lambda *args, **kwargs: model)
+    stream = dietician.analyze_stream({"conditions": ["diabetes"]}, ["water"], use_cache=False)
+
+    assert next(stream) == {"section": "Summary", "text": "**Summary:** fine. "}
+    # The client is paused mid-stream, but the model call has finished and freed its slot
+    for _ in range(200):
+        if dietician.resilience.gemini_guard.limiter.stats()["in_flight"] == 0:
+            break
+        time.sleep(0.005)
+    assert dietician.resilience.gemini_guard.limiter.stats()["in_flight"] == 0
+    assert list(stream) == [{"section": "Warnings", "text": "**Warnings:** none."}]
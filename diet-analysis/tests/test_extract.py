@@ -0,0 +1,35 @@
+import time
+
+import extract
+
+
+def test_plain_json_parses_directly():
+    assert extract.parse_json_response('["sugar", "salt"]', list) == ["sugar", "salt"]
+
+
+def test_json_inside_fences_and_prose():
+    reply = 'Here you go:\n```json\n{"blood_sugar": "95 mg/dL", "notes": "range [70-100] {ok}"}\n```\nThanks!'
+    assert extract.parse_json_response(reply, dict) == {"blood_sugar": "95 mg/dL", "notes": "range [70-100] {ok}"}
+
+
+def test_skips_spans_of_the_wrong_shape_or_invalid_json():
+    reply = 'Ingredients [see label] are: ["sugar", "salt"]'
+    assert extract.parse_json_response(reply, list) == ["sugar", "salt"]
+    assert extract.parse_json_response('{"a": 1,} then {"b": 2}', dict) == {"b": 2}
+
+
+def test_escaped_quotes_in_strings():
+    assert extract.parse_json_response('x ["say \\"]\\" twice"] y', list) == ['say "]" twice']
+
+
+def test_failure_returns_an_empty_value():
+    assert extract.parse_json_response("no json here", dict) == {}
+    assert extract.parse_json_response('["unterminated', list) == []
+
+
+def test_bad_output_is_scanned_in_linear_time():
+    reply = "[" * 20000 + "{" * 20000
+    started = time.monotonic()
+    assert extract.parse_json_response(reply, list) == []
+    assert extract.parse_json_response(reply, dict) == {}
+    assert time.monotonic() - started < 1
@@ -0,0 +1,51 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import firestore_writer
+
+
+class FlakyDb:
+    """Batches fail ``failures`` times, each attempt taking ``delay`` seconds."""
+
+    def __init__(self, failures=0, delay=0.0):
+        self.failures, self.delay = failures, delay
+        self.attempts, self.written = 0, []
+        self._lock = threading.Lock()
+
+    def batch(self):
+        db, writes = self, []
+
+        def commit():
+            if db.delay:
+                time.sleep(db.delay)
+            with db._lock:
+                db.attempts += 1
+                if db.attempts <= db.failures:
+                    raise RuntimeError("unavailable")
+                db.written.extend(writes)
+
+        return SimpleNamespace(set=lambda ref, data: writes.append(ref.id), commit=commit)
+
+
+def _ref(doc_id):
+    return SimpleNamespace(id=doc_id)
+
+
+def test_close_waits_for_a_commit_that_is_being_retried():
+    db = FlakyDb(failures=2, delay=0.05)
+    buffer = firestore_writer.WriteBehindBuffer(db, max_batch=1, flush_interval=0.01)
+    buffer.enqueue(_ref("a"), {})
+    time.sleep(0.02)
+    buffer.close()
+    assert db.written == ["a"]
+    assert buffer.stats()["dropped"] == 0
+
+
+def test_no_backoff_after_the_final_attempt(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(firestore_writer.time, "sleep", sleeps.append)
+    buffer = firestore_writer.WriteBehindBuffer(FlakyDb(failures=10), max_retries=3, flush_interval=60)
+    buffer._commit([(_ref("a"), {})])
+    assert sleeps == [0.5, 1.0]
+    assert buffer.stats()["dropped"] == 1
@@ -0,0 +1,45 @@
+import health_profile
+
+
+def test_ifcc_hba1c_is_converted_to_percent():
+    assert health_profile.bin_metric("hba1c", "42 mmol/mol") == "prediabetes"
+    assert health_profile.bin_metric("hba1c", "36 mmol/mol") == "normal"
+    assert health_profile.bin_metric("hba1c", "48 mmol/mol") == "diabetes"
+    assert health_profile.bin_metric("hba1c", "5.4%") == "normal"
+
+
+def test_kidney_and_electrolyte_metrics_are_binned():
+    profile = health_profile.canonical_profile({
+        "egfr": "45 mL/min/1.73m2",
+        "serum_creatinine": "150 µmol/L",
+        "potassium": "5.6 mmol/L",
+        "uric_acid": "8.1 mg/dL",
+    })
+    assert profile == {"egfr": "moderately decreased", "creatinine": "elevated",
+                       "potassium": "high", "uric_acid": "high"}
+
+
+def test_pregnancy_is_kept_as_a_flag():
+    base = {"blood_sugar": "95 mg/dL"}
+    assert health_profile.canonical_profile(dict(base, pregnancy="Yes (24 weeks)"))["pregnancy"] is True
+    assert health_profile.profile_signature(dict(base, pregnant="yes, 24 weeks")) == \
+        health_profile.profile_signature(dict(base, pregnancy_status="Pregnant - 30 weeks"))
+    assert health_profile.profile_signature(base) == health_profile.profile_signature(dict(base, pregnancy="No"))
+    assert health_profile.profile_signature(base) != health_profile.profile_signature(dict(base, pregnancy="yes"))
+
+
+def test_routine_labs_do_not_split_signatures():
+    first = {"blood_sugar": "101 mg/dL", "hemoglobin": "13.1 g/dL", "tsh": "2.2", "vitamin_d": "18 ng/mL"}
+    second = {"blood_sugar": "102 mg/dL", "hemoglobin": "14.0 g/dL", "vitamin_d": "31 ng/mL"}
+    assert health_profile.profile_signature(first) == health_profile.profile_signature(second)
+
+
+def test_report_details_do_not_change_the_signature():
+    first = {"blood_sugar": "95 mg/dL", "patient_name": "A", "report_date": "2026-01-02"}
+    second = {"blood_sugar": "97 mg/dL", "patient_name": "B", "report_date": "2026-03-04"}
+    assert health_profile.profile_signature(first) == health_profile.profile_signature(second)
+
+
+def test_triglycerides_are_read_from_the_lipid_panel():
+    profile = health_profile.canonical_profile({"cholesterol": {"total": "180 mg/dL", "triglycerides": "260 mg/dL"}})
+    assert profile == {"cholesterol": {"total": "desirable"}, "triglycerides": "high"}
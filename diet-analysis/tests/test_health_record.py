@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import health_record
+
+
+def test_lists_are_unioned_by_default():
+    current = {"medications": ["Metformin", "Atorvastatin"]}
+    changes = health_record.diff_fields(current, {"medications": ["metformin", "Lisinopril"]})
+    assert changes == {("medications",): (["Metformin", "Atorvastatin"], ["Metformin", "Atorvastatin", "Lisinopril"])}
+
+
+def test_full_report_replaces_lists():
+    current = {"medications": ["Metformin", "Atorvastatin"], "allergies": ["Peanuts"]}
+    update = {"medications": ["Metformin"], "allergies": ["peanuts"]}
+    changes = health_record.diff_fields(current, update, replace_lists=True)
+    assert changes == {("medications",): (["Metformin", "Atorvastatin"], ["Metformin"])}
+
+
+def test_replace_lists_applies_inside_nested_maps():
+    current = {"other": {"supplements": ["Iron", "Vitamin D"]}}
+    changes = health_record.diff_fields(current, {"other": {"supplements": ["Iron"]}}, replace_lists=True)
+    assert changes == {("other", "supplements"): (["Iron", "Vitamin D"], ["Iron"])}
+
+
+def test_empty_list_clears_stored_list_only_when_replacing():
+    current = {"medications": ["Metformin"]}
+    assert health_record.diff_fields(current, {"medications": []}) == {}
+    changes = health_record.diff_fields(current, {"medications": []}, replace_lists=True)
+    assert changes == {("medications",): (["Metformin"], [])}
+    assert health_record.diff_fields({}, {"medications": []}, replace_lists=True) == {}
+
+
+def test_full_report_clears_lists_it_leaves_out(monkeypatch):
+    seen = {}
+
+    def commit(transaction, doc_ref, update, source, replace_lists):
+        seen["update"] = update
+        return {}, {}, {}, 1
+
+    monkeypatch.setattr(health_record, "_commit_update", commit)
+    db = SimpleNamespace(collection=lambda name: SimpleNamespace(document=lambda uid: None),
+                         transaction=lambda: None)
+    store = health_record.HealthRecordStore(db)
+    store.apply("u1", {"medications": ["Metformin"]}, replace_lists=True)
+    assert seen["update"] == {"conditions": [], "allergies": [], "medications": ["Metformin"]}
+    store.apply("u1", {"medications": ["Metformin"]})
+    assert seen["update"] == {"medications": ["Metformin"]}
@@ -0,0 +1,54 @@
+import lab_report
+
+
+def test_reference_range_before_the_value_is_skipped():
+    data, _ = lab_report.parse_lab_report("Glucose, Fasting (Plasma) Ref 70-110 mg/dL 132 mg/dL")
+    assert data == {"blood_sugar": "132 mg/dL"}
+
+
+def test_reference_range_after_the_value_is_ignored():
+    data, _ = lab_report.parse_lab_report("Total Cholesterol 182 mg/dL < 200\nHDL Cholesterol 1.2 mmol/L 1.0-1.5")
+    assert data == {"cholesterol": {"total": "182 mg/dL", "hdl": "1.2 mmol/L"}}
+
+
+def test_hba1c_in_ifcc_units_is_not_read_as_percent():
+    data, _ = lab_report.parse_lab_report("HbA1c (IFCC) 48 mmol/mol\nHbA1c (NGSP) 6.5 %")
+    assert data == {"hba1c": "6.5%"}
+
+
+def test_estimated_average_glucose_is_not_blood_sugar():
+    text = "HbA1c 6.8%\nEstimated Average Glucose (eAG) 148 mg/dL\nMean Plasma Glucose 150 mg/dL"
+    data, _ = lab_report.parse_lab_report(text)
+    assert data == {"hba1c": "6.8%"}
+
+
+def test_unit_followed_by_punctuation_and_flags():
+    data, complete = lab_report.parse_lab_report("Fasting Blood Sugar: 95 mg/dL.\nLDL-C 162 H\nBP 130/85")
+    assert data == {"blood_sugar": "95 mg/dL", "cholesterol": {"ldl": "162 mg/dL"}, "blood_pressure": "130/85"}
+    assert complete
+
+
+def test_renal_panel_is_read_in_full():
+    text = ("Fasting Blood Sugar 132 mg/dL\nHbA1c 6.9 %\neGFR 28 mL/min/1.73m2\n"
+            "Creatinine 2.4 mg/dL\nK 5.9 mmol/L\nUric Acid 420 µmol/L")
+    data, complete = lab_report.parse_lab_report(text)
+    assert data == {"blood_sugar": "132 mg/dL", "hba1c": "6.9%", "egfr": "28 mL/min/1.73m2",
+                    "creatinine": "2.4 mg/dL", "potassium": "5.9 mmol/L", "uric_acid": "420 µmol/L"}
+    assert complete
+
+
+def test_unrecognized_lab_values_make_the_result_partial():
+    text = "Fasting Blood Sugar 132 mg/dL\nHbA1c 6.9 %\nHemoglobin 13.5 g/dL\nReport date 12/05/2026"
+    data, complete = lab_report.parse_lab_report(text)
+    assert data == {"blood_sugar": "132 mg/dL", "hba1c": "6.9%"}
+    assert not complete
+
+
+def test_value_in_an_unexpected_unit_makes_the_result_partial():
+    _, complete = lab_report.parse_lab_report("Fasting Blood Sugar 132 mg/dL\nHbA1c 6.9 %\nHbA1c (IFCC) 52 mmol/mol")
+    assert not complete
+
+
+def test_header_lines_do_not_make_the_result_partial():
+    text = "Patient: A. Person  Age: 54\nDate: 12/05/2026\nFasting Blood Sugar 132 mg/dL\nHbA1c 6.9 %"
+    assert lab_report.parse_lab_report(text)[1]
@@ -0,0 +1,40 @@
+import ocr
+
+
+def test_parses_list_up_to_allergen_statement():
+    ingredients, score = ocr.parse_ingredient_list("Ingredients: Wheat flour, sugar, salt. Contains: wheat, milk.")
+    assert ingredients == ["wheat flour", "sugar", "salt"]
+    assert score == 1.0
+
+
+def test_contains_inside_brackets_does_not_end_list():
+    text = "Ingredients: Wheat flour, sugar, chocolate chips (contains milk, soy lecithin), salt, peanuts."
+    ingredients, _ = ocr.parse_ingredient_list(text)
+    assert ingredients == ["wheat flour", "sugar", "chocolate chips", "milk", "soy lecithin", "salt", "peanuts"]
+
+
+def test_contains_mid_sentence_does_not_end_list():
+    ingredients, _ = ocr.parse_ingredient_list("Ingredients: sugar, salt contains peanuts, milk.")
+    assert "milk" in ingredients
+
+
+def test_allergen_statement_on_new_line_ends_list():
+    text = "INGREDIENTS: rice flour, sugar, salt\nCONTAINS SOY\nBest before 12/26"
+    ingredients, score = ocr.parse_ingredient_list(text)
+    assert ingredients == ["rice flour", "sugar", "salt"]
+    assert score == 1.0
+
+
+def test_strips_percentages_and_e_numbers():
+    text = "Ingredients: Sugar, cocoa solids (22%), emulsifier (INS 322), salt."
+    ingredients, _ = ocr.parse_ingredient_list(text)
+    assert ingredients == ["sugar", "cocoa solids", "emulsifier", "salt"]
+
+
+def test_truncated_list_scores_lower():
+    _, score = ocr.parse_ingredient_list("Ingredients: sugar, cocoa butter, milk solids, emulsifier (soy lecithin")
+    assert score < 0.8
+
+
+def test_missing_header():
+    assert ocr.parse_ingredient_list("Nutrition facts per 100 g") == ([], 0.0)
@@ -0,0 +1,78 @@
+import time
+from types import SimpleNamespace
+
+import profiles
+
+
+class FakeDocument:
+    def __init__(self, db, uid):
+        self.db, self.uid = db, uid
+
+    def get(self):
+        self.db.reads += 1
+        data = self.db.data.get(self.uid)
+        return SimpleNamespace(exists=data is not None, to_dict=lambda: data)
+
+    def set(self, data, merge=False):
+        self.db.data[self.uid] = data
+
+    def on_snapshot(self, callback):
+        if self.db.listeners_fail:
+            raise RuntimeError("listen failed")
+        self.db.callbacks[self.uid] = callback
+        return SimpleNamespace(unsubscribe=lambda: None)
+
+
+class FakeDb:
+    def __init__(self, listeners_fail=False):
+        self.data, self.callbacks, self.reads, self.listeners_fail = {}, {}, 0, listeners_fail
+
+    def collection(self, name):
+        return SimpleNamespace(document=lambda uid: FakeDocument(self, uid))
+
+    def update_elsewhere(self, uid, data):
+        self.data[uid] = data
+        snapshot = SimpleNamespace(exists=True, to_dict=lambda: data)
+        self.callbacks[uid]([snapshot], [], None)
+
+
+def test_update_from_another_worker_replaces_cached_profile():
+    db = FakeDb()
+    db.data["u1"] = {"extracted_health_data": {"conditions": ["diabetes"]}}
+    store = profiles.ProfileStore(db, use_listeners=True)
+    assert store.get("u1") == ({"conditions": ["diabetes"]}, None)
+
+    db.update_elsewhere("u1", {"extracted_health_data": {"conditions": ["hypertension"]}})
+    assert store.get("u1") == ({"conditions": ["hypertension"]}, None)
+    assert db.reads == 1
+
+
+def test_profile_without_a_listener_expires_after_unwatched_ttl():
+    db = FakeDb(listeners_fail=True)
+    db.data["u1"] = {"extracted_health_data": {"conditions": ["diabetes"]}}
+    store = profiles.ProfileStore(db, use_listeners=True, unwatched_ttl=0.05)
+    store.get("u1")
+    store.get("u1")
+    assert db.reads == 1
+    time.sleep(0.06)
+    store.get("u1")
+    assert db.reads == 2
+
+
+def test_listeners_are_capped():
+    db = FakeDb()
+    for uid in ("u1", "u2", "u3"):
+        db.data[uid] = {"extracted_health_data": {"conditions": ["diabetes"]}}
+    store = profiles.ProfileStore(db, use_listeners=True, max_listeners=2)
+    for uid in ("u1", "u2", "u3"):
+        store.get(uid)
+    assert sorted(db.callbacks) == ["u1", "u2"]
+    assert store.stats()["entries"] == 3
+
+
+def test_listeners_are_off_by_default():
+    db = FakeDb()
+    db.data["u1"] = {"extracted_health_data": {"conditions": ["diabetes"]}}
+    store = profiles.ProfileStore(db)
+    store.get("u1")
+    assert not db.callbacks
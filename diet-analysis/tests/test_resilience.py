@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+import resilience
+
+
+class Throttled(Exception):
+    code = 429
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+def _guard(**overrides):
+    settings = dict(rate=1000, burst=1000, max_in_flight=4, min_in_flight=1, breaker_failures=2, breaker_reset=0.05)
+    settings.update(overrides)
+    return resilience.GeminiGuard(**settings)
+
+
+def test_deadline_counts_down_and_refuses_sleeps_past_it():
+    deadline = resilience.Deadline(0.2)
+    assert 0 < deadline.remaining() <= 0.2
+    assert not deadline.sleep(0.15, reserve=0.1)
+    assert deadline.sleep(0.01, reserve=0.1)
+    assert resilience.Deadline(0).expired()
+
+
+def test_token_bucket_allows_a_burst_then_refills():
+    bucket = resilience.TokenBucket(rate=50, burst=2)
+    assert bucket.acquire(0) and bucket.acquire(0)
+    assert not bucket.acquire(0)
+    started = time.monotonic()
+    assert bucket.acquire(1)
+    assert time.monotonic() - started < 0.2
+
+
+def test_token_bucket_gives_up_when_the_wait_exceeds_the_timeout():
+    bucket = resilience.TokenBucket(rate=1, burst=1)
+    bucket.acquire(0)
+    started = time.monotonic()
+    assert not bucket.acquire(0.05)
+    assert time.monotonic() - started < 0.05
+
+
+def test_aimd_limiter_blocks_at_the_limit_and_adapts():
+    limiter = resilience.AIMDLimiter(2, minimum=1, maximum=4)
+    assert limiter.acquire(0) and limiter.acquire(0)
+    assert not limiter.acquire(0.01)
+
+    threading.Timer(0.02, limiter.release).start()
+    assert limiter.acquire(1)
+
+    limiter.release(throttled=True)
+    assert limiter.stats() == {"limit": 1, "in_flight": 1}
+    limiter.release()
+    assert limiter.stats() == {"limit": 2, "in_flight": 0}
+
+
+def test_circuit_breaker_opens_then_lets_one_trial_through():
+    breaker = resilience.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = resilience.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_guard_opens_on_outages_and_rejects_calls():
+    guard = _guard()
+    for _ in range(2):
+        with pytest.raises(Unavailable):
+            with guard.slot():
+                raise Unavailable()
+    with pytest.raises(resilience.CircuitOpenError):
+        with guard.slot():
+            pass
+    assert guard.stats()["rejections"]["circuit_open"] == 1
+
+
+def test_guard_lowers_concurrency_on_throttling_but_ignores_client_errors():
+    guard = _guard()
+    with pytest.raises(Throttled):
+        with guard.slot():
+            raise Throttled()
+    assert guard.stats()["limit"] == 2
+    with pytest.raises(KeyError):
+        with guard.slot():
+            raise KeyError("bug")
+    assert guard.stats()["circuit"] == "closed"
+
+
+def test_guard_is_rate_limited_within_the_deadline():
+    guard = _guard(rate=1, burst=1)
+    with guard.slot(resilience.Deadline(0.05)):
+        pass
+    with pytest.raises(resilience.RateLimitedError):
+        with guard.slot(resilience.Deadline(0.05)):
+            pass
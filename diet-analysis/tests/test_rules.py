@@ -0,0 +1,68 @@
+import rules
+
+
+def _triggers(healthcare_data, ingredients):
+    return {(w["ingredient"], w["trigger"]) for w in rules.evaluate(healthcare_data, ingredients)["warnings"]}
+
+
+def test_plural_ingredients_match_singular_keys():
+    for ingredient in ("Rolled Oats", "Mixed Spices", "Condiments"):
+        matched, _ = rules.lookup_ingredient(ingredient)
+        assert matched, ingredient
+
+
+def test_alias_that_ends_in_s_still_resolves():
+    matched, tags = rules.lookup_ingredient("HFCS")
+    assert matched == {"high fructose corn syrup"}
+    assert "fructose" in tags
+
+
+def test_peanut_butter_is_not_dairy():
+    matched, tags = rules.lookup_ingredient("Peanut butter")
+    assert matched == {"peanut butter"}
+    assert tags == {"peanut"}
+
+
+def test_cocoa_butter_is_not_dairy():
+    _, tags = rules.lookup_ingredient("Cocoa butter")
+    assert not tags & {"milk", "lactose"}
+
+
+def test_plain_butter_is_dairy():
+    _, tags = rules.lookup_ingredient("Butter")
+    assert {"milk", "lactose"} <= tags
+
+
+def test_negated_sugar_is_not_added_sugar():
+    for ingredient in ("Sugar-free", "No added sugar"):
+        _, tags = rules.lookup_ingredient(ingredient)
+        assert "added_sugar" not in tags, ingredient
+
+
+def test_allergy_phrasing_is_canonicalized():
+    assert rules.canonical_allergy("Allergy to peanuts") == "peanut"
+    assert rules.canonical_allergy("Peanuts (severe)") == "peanut"
+    assert rules.canonical_allergy("Peanut allergy") == "peanut"
+
+
+def test_peanut_oil_warns_for_peanut_allergy():
+    for allergy in ("Allergy to peanuts", "Peanuts (severe)"):
+        assert ("Peanut oil", "peanut") in _triggers({"allergies": [allergy]}, ["Peanut oil"])
+
+
+def test_dosage_form_prefix_is_stripped():
+    assert rules.canonical_medication("Tab. Atorvastatin 10 mg") == "atorvastatin"
+    assert rules.canonical_medication("Cap Omeprazole") == "omeprazole"
+    assert rules.canonical_medication("Metformin 500 mg tablet") == "metformin"
+
+
+def test_only_whole_name_matches_resolve():
+    result = rules.evaluate({}, ["Rice", "Rice wine", "Water chestnut", "HFCS", "Sugar-free"])
+    assert result["resolved"] == ["Rice", "HFCS"]
+    assert result["unresolved"] == ["Rice wine", "Water chestnut", "Sugar-free"]
+
+
+def test_partial_matches_still_warn():
+    result = rules.evaluate({"allergies": ["peanut"]}, ["Roasted peanut pieces"])
+    assert result["unresolved"] == ["Roasted peanut pieces"]
+    assert [w["trigger"] for w in result["warnings"]] == ["peanut"]